@@ -0,0 +1,243 @@
+"""
+Aerodrome definitions for the availability statistics
+
+An aerodrome is defined by its runways, the rule selecting the runway in use
+from the reported wind and the minima of each procedure per runway. The
+definitions are read from a JSON file keyed by station ID:
+
+{
+    "SBKP": {
+        "runways": {
+            "15": {"heading": 149, "wind_sector": [194, 360]},
+            "33": {"heading": 329, "wind_sector": [360, 194]}
+        },
+        "selection": {"rule": "wind_sector", "calm_speed": 6,
+                      "calm_runway": "15"},
+        "procedures": {
+            "VFR": {"label": "VFR",
+                    "minima": {"15": [1500, 5000], "33": [1500, 5000]}},
+            "IFR-ILS": {"label": "ILS",
+                        "minima": {"15": [200, 800], "33": null}}
+        }
+    }
+}
+
+Minima are (ceiling in ft, visibility in m), null where the procedure is not
+published for the runway. The selection rules are:
+    - wind_sector: the runway whose wind sector (from, to] contains the wind
+      direction, in degrees
+    - headwind: the runway whose heading is the closest to the wind direction
+In both, the calm runway is in use when the wind speed is below calm_speed
+or the wind is not reported or variable.
+"""
+import json
+
+import numpy as np
+
+selection_rules = ('wind_sector', 'headwind')
+
+
+class Aerodrome:
+    """
+Runways, runway selection and procedure minima of an aerodrome
+    """
+    __slots__ = ('icao', 'runways', 'headings', 'wind_sectors', 'rule',
+                 'calm_speed', 'calm_runway', 'minima', 'procs', 'labels',
+                 'ceiling_minima', 'visibility_minima')
+
+    def __init__(self,
+                 icao: str,
+                 runways: list,
+                 minima: dict,
+                 rule: str = 'headwind',
+                 calm_speed: float = 6,
+                 calm_runway: str = None,
+                 headings: dict = None,
+                 wind_sectors: dict = None,
+                 labels: dict = None):
+        """
+    :param icao: station ID
+    :param runways: runway names, in the order of the statistics
+    :param minima: dict of procedure to dict of runway to (ceiling in ft,
+           visibility in m), None where the procedure is not published
+    :param rule: runway selection rule, one of selection_rules
+    :param calm_speed: wind speed, in kt, below which calm_runway is in use
+    :param calm_runway: runway in use with calm, variable or missing wind.
+           Defaults to the first runway
+    :param headings: dict of runway to heading in degrees, for 'headwind'
+    :param wind_sectors: dict of runway to (from, to] wind directions in
+           degrees, for 'wind_sector'
+    :param labels: dict of procedure to its name in the exported tables
+        """
+        if rule not in selection_rules:
+            raise ValueError(f'Unknown runway selection rule for {icao}: {rule}')
+
+        self.icao = icao
+        self.runways = list(runways)
+        self.rule = rule
+        self.calm_speed = calm_speed
+        self.calm_runway = calm_runway if calm_runway is not None \
+            else self.runways[0]
+        self.headings = headings or dict()
+        self.wind_sectors = wind_sectors or dict()
+        self.minima = minima
+        self.procs = list(minima)
+        self.labels = {proc: proc for proc in self.procs}
+        self.labels.update(labels or dict())
+
+        for runway in self.runways:
+            if rule == 'headwind' and runway not in self.headings:
+                raise ValueError(f'No heading for runway {runway} of {icao}')
+            if rule == 'wind_sector' and runway not in self.wind_sectors:
+                raise ValueError(f'No wind sector for runway {runway} of {icao}')
+
+        # Minima as (procedure, runway) arrays. Procedures not published get an
+        # infinite minimum, so they're never available
+        self.ceiling_minima = np.array(
+            [[minima[proc].get(runway)[0]
+              if minima[proc].get(runway) is not None else np.inf
+              for runway in self.runways] for proc in self.procs]
+        ).reshape(len(self.procs), len(self.runways))
+        self.visibility_minima = np.array(
+            [[minima[proc].get(runway)[1]
+              if minima[proc].get(runway) is not None else np.inf
+              for runway in self.runways] for proc in self.procs]
+        ).reshape(len(self.procs), len(self.runways))
+
+    @classmethod
+    def from_definition(cls, icao: str, definition: dict) -> 'Aerodrome':
+        """
+Builds an aerodrome from its entry in a definition file
+
+    :param icao: station ID
+    :param definition: entry of the station, see the module documentation
+    :return: aerodrome
+        """
+        runways = definition['runways']
+        selection = definition.get('selection', dict())
+        procedures = definition['procedures']
+
+        return cls(
+            icao,
+            list(runways),
+            {proc: {runway: tuple(runway_minima)
+                    if runway_minima is not None else None
+                    for runway, runway_minima in procedure['minima'].items()}
+             for proc, procedure in procedures.items()},
+            rule=selection.get('rule', 'headwind'),
+            calm_speed=selection.get('calm_speed', 6),
+            calm_runway=selection.get('calm_runway'),
+            headings={runway: values['heading']
+                      for runway, values in runways.items()
+                      if 'heading' in values},
+            wind_sectors={runway: tuple(values['wind_sector'])
+                          for runway, values in runways.items()
+                          if 'wind_sector' in values},
+            labels={proc: procedure['label']
+                    for proc, procedure in procedures.items()
+                    if 'label' in procedure},
+        )
+
+    @property
+    def metrics(self) -> list:
+        """
+Metrics of the statistics of the aerodrome, in order
+        """
+        return ['no_info_time'] \
+            + [f'{runway}_inuse_time' for runway in self.runways] \
+            + [f'unavailable_{proc}_time' for proc in self.procs]
+
+    def metric_labels(self) -> dict:
+        """
+Returns the name of each metric in the exported tables
+        """
+        labels = {'no_info_time': 'Tempo sem informações válidas'}
+        for runway in self.runways:
+            labels[f'{runway}_inuse_time'] = \
+                f'Tempo que a pista {runway} esteve em uso'
+        for proc in self.procs:
+            labels[f'unavailable_{proc}_time'] = \
+                f'Tempo que o aeródromo não recebeu operações {self.labels[proc]}'
+
+        return labels
+
+    def runway_in_use(self, wind_dir, wind_speed) -> np.ndarray:
+        """
+Returns the runway in use for the reported wind
+
+    :param wind_dir: wind direction column in degrees, NaN if not reported
+    :param wind_speed: wind speed column in kt, NaN if not reported
+    :return: array of indexes in runways
+        """
+        wind_dir = np.asarray(wind_dir, dtype=float)
+        wind_speed = np.asarray(wind_speed, dtype=float)
+
+        calm = np.isnan(wind_speed) | (wind_speed < self.calm_speed) \
+            | np.isnan(wind_dir)
+        runway_index = np.full(np.shape(wind_dir),
+                               self.runways.index(self.calm_runway))
+
+        if self.rule == 'headwind':
+            headings = np.array([self.headings[runway]
+                                 for runway in self.runways], dtype=float)
+            difference = np.abs(wind_dir[..., np.newaxis] - headings) % 360
+            closest = np.argmin(np.minimum(difference, 360 - difference),
+                                axis=-1)
+            runway_index = np.where(calm, runway_index, closest)
+
+        else:
+            # Sectors are checked in reverse, so the first matching one wins
+            for index in reversed(range(len(self.runways))):
+                sector_from, sector_to = self.wind_sectors[self.runways[index]]
+                if sector_from <= sector_to:
+                    in_sector = (wind_dir > sector_from) & (wind_dir <= sector_to)
+                else:
+                    in_sector = (wind_dir > sector_from) | (wind_dir <= sector_to)
+                runway_index = np.where(~calm & in_sector, index, runway_index)
+
+        return runway_index
+
+    def availability_matrix(self,
+                            wind_dir: np.ndarray,
+                            wind_speed: np.ndarray,
+                            ceiling: np.ndarray,
+                            visibility: np.ndarray,
+                            cb: np.ndarray) -> np.ndarray:
+        """
+Evaluates every procedure over every observation at once
+
+    :param wind_dir: wind direction column in degrees, NaN if not reported
+    :param wind_speed: wind speed column in kt, NaN if not reported
+    :param ceiling: lowest BKN/OVC layer base column in ft, NaN if there's
+           none
+    :param visibility: lowest visibility column in m, NaN if none was reported
+    :param cb: /////CB flag column, those observations close every procedure
+    :return: boolean array (observations x procs), True where the procedure
+             was available
+        """
+        runway_index = self.runway_in_use(wind_dir, wind_speed)
+
+        # Minima in force for each observation, (observations x procs)
+        ceiling_minimum = self.ceiling_minima[:, runway_index].T
+        visibility_minimum = self.visibility_minima[:, runway_index].T
+
+        # Comparisons against NaN are False, so missing information never
+        # closes a procedure by itself
+        below_minima = (ceiling[:, np.newaxis] < ceiling_minimum) | \
+            (visibility[:, np.newaxis] < visibility_minimum)
+
+        return ~below_minima & np.isfinite(ceiling_minimum) & ~cb[:, np.newaxis]
+
+
+def load_aerodromes(filepath: str) -> dict:
+    """
+Loads an aerodrome definition file
+
+    :param filepath: path to the JSON file, see the module documentation
+    :return: dict of station ID to Aerodrome, in file order
+    """
+    with open(filepath, 'r', encoding='utf8') as file_handle:
+        definitions = json.load(file_handle)
+
+    return {icao: Aerodrome.from_definition(icao, definition)
+            for icao, definition in definitions.items()}
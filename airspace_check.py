@@ -1,102 +1,75 @@
-import csv
+import argparse
+import collections
 import datetime
+import functools
+import hashlib
+import json
+import matplotlib.colors as colors
 import matplotlib.patches as patches
 import os
+import pickle
+import sys
 import matplotlib.pyplot as plt
+import numpy as np
 import pandas as pd
-import time
 
-from bs4 import BeautifulSoup
+from concurrent.futures import ProcessPoolExecutor
 from matplotlib.path import Path
-from pykml import parser
-from shapely.geometry import Point
-from shapely.geometry.polygon import Polygon
+
+import airspaces
+import combined_tracks
+import density_grid
+import flight_catalog
+import flight_metadata
+import metar_store
+import output_sinks
+import tracks
 plt.rcParams['svg.fonttype'] = 'none'
 
 # Runway strip
 sbkp_rwy_thr_xs = [-47.14694, -47.12194]
 sbkp_thr_ys = [-22.99861, -23.01639]
 
-# CTR Campinas' vertical limits
-ctr_upper_limit = 3700
-ctr_lower_limit = 0
-
-# List of points delimiting CTR Campinas' horizontal limits
-ctr_coords = [
-    (-47.05833, -23.15639),
-    (-46.95333, -23.03056),
-    (-47.23694, -22.8275),
-    (-47.36833, -22.98472),
-    (-47.14778, -23.14306),
-    (-47.05833, -23.15639)
-]
-
-# TMA São Paulo 2's vertical limits
-tma2_upper_limit = 5500
-tma2_lower_limit = 3600
-
-# List of points delimiting TMA São Paulo 2's horizontal limits
-tma2_coords = [
-    (-47.17722222200, -22.7633333330),
-    (-47.07132252390, -22.8399787568),
-    (-46.96530416120, -22.9165529453),
-    (-46.85916666700, -22.9930555560),
-    (-46.74861111100, -22.9850000000),
-    (-46.65172677510, -23.0689190695),
-    (-46.55472222200, -23.1527777780),
-    (-46.38339956780, -23.2048157536),
-    (-46.21194444400, -23.2566666670),
-    (-46.13666666700, -23.3822222220),
-    (-46.23866024820, -23.5299774042),
-    (-46.34088179830, -23.6776628004),
-    (-46.44333333300, -23.8252777780),
-    (-46.54887798310, -23.8387861596),
-    (-46.65444444400, -23.8522222220),
-    (-46.79390572640, -23.7572562394),
-    (-46.93316467380, -23.6621633984),
-    (-47.07222222200, -23.5669444440),
-    (-47.08849215850, -23.4036136619),
-    (-47.10472222200, -23.2402777780),
-    (-47.25192067260, -23.1347915266),
-    (-47.39888888900, -23.0291666670),
-    (-47.40531214760, -23.0069348209),
-    (-47.40377565800, -22.9807166225),
-    (-47.39928886810, -22.9547905659),
-    (-47.39190255780, -22.9294404543),
-    (-47.38169912370, -22.9049436329),
-    (-47.36879161300, -22.8815679684),
-    (-47.35332243130, -22.8595689372),
-    (-47.33546173970, -22.8391868539),
-    (-47.31540556250, -22.8206442696),
-    (-47.29337362520, -22.8041435665),
-    (-47.26960694870, -22.7898647741),
-    (-47.24436522530, -22.7779636293),
-    (-47.21792400390, -22.7685699005),
-    (-47.17722222200, -22.7633333330)
-]
-
-# TMA São Paulo 1's vertical limits
-tma1_upper_limit = 24500
-tma1_lower_limit = 5500
-
-# List of points delimiting TMA São Paulo 1's horizontal limits
-tma1_coords = [
-    (-045.38082500, -23.88307500),
-    (-045.55586670, -23.25037780),
-    (-045.61360000, -23.04041944),
-    (-045.66710830, -23.05229444),
-    (-045.92609170, -22.97498890),
-    (-046.12291390, -22.55789720),
-    (-046.98529170, -22.46140560),
-    (-047.56018890, -22.69492780),
-    (-047.68771110, -22.93983330),
-    (-047.80167500, -23.25763330),
-    (-047.73306390, -23.62205280),
-    (-046.69168610, -24.40681670),
-    (-046.16711110, -24.30751940),
-    (-046.07171944, -24.07566111),
-    (-045.38082500, -23.88307500),
-]
+# Airspaces of the statistics, the --airspaces files must include them
+ctr_name = 'CTR Campinas'
+tma1_name = 'TMA São Paulo 1'
+tma2_name = 'TMA São Paulo 2'
+
+# Categories of the positions of the charts
+position_categories = ['ground_movement', 'non_tma', 'on_tma1', 'on_tma2',
+                       'on_ctr']
+
+# Directory where the result of each flight is saved for the render stage
+results_dir = 'cache/flights/'
+
+# Part of the key of the saved results, to be bumped whenever the analysis
+# changes
+result_version = 1
+
+# Key of the flights and configuration the compiled charts were drawn with,
+# next to them
+compiled_key_path = 'visualization/all.key'
+
+# Index of the content hashes of the flight and airspace files
+hashes_path = 'cache/file_hashes-v1.pkl'
+
+# Thresholds of the flight phases of get_flight_time, also part of the key
+# of the saved results
+phase_thresholds = {
+    # Positions of the mean rate of climb
+    'mean_window': 5,
+    # Mean rate of climb (ft/min) below which, in absolute value, the
+    # tendency is cruise, and above which it's climb (descent if negative)
+    'cruise_tendency': 20,
+    'climb_tendency': 100,
+    # Ground speed (kt) below which a position on the ground is taxi
+    'taxi_speed': 30,
+    # Rate of climb (ft/min) below which, in absolute value, a position is
+    # level, and above which it climbs (descends if negative)
+    'level_rate': 50,
+    # Altitude difference (ft) from the highest altitude of a level off
+    'level_off_margin': 250,
+}
 
 
 def point_in_airspace(position_coords: list,
@@ -107,7 +80,7 @@ def point_in_airspace(position_coords: list,
     """
 Given a position (latitude, longitude and altitude) and an airspace's vertical
 and horizontal limits, returns whether the point is contained within the
-airspace or not
+airspace or not. The airspace is built only on the first call with its limits
 
     :param position_coords: (latitude, longitude) in decimal format
     :param position_alt: position altitude in feet
@@ -118,374 +91,283 @@ airspace or not
     :return: True/False, whether the position is contained within the airspace
              or not
     """
-    horizontal_limits = Polygon(airspace_horizontal_limits)
-    point = Point(position_coords[1], position_coords[0])
-
-    is_within_vertical_limits = \
-        airspace_lower_limit < position_alt <= airspace_upper_limit
-    is_within_horizontal_limits = \
-        horizontal_limits.contains(point) or horizontal_limits.touches(point)
-
-    return is_within_horizontal_limits and is_within_vertical_limits
-
-
-def get_flight_time(whole_data: list,
-                    tma1_data: list,
-                    tma2_data: list,
-                    ctr_data: list) -> dict:
-
-    for j in range(len(whole_data) - 1):
-        obs1_time = \
-            datetime.datetime.fromtimestamp(time.mktime(whole_data[j][0]))
-        obs2_time = \
-            datetime.datetime.fromtimestamp(time.mktime(whole_data[j + 1][0]))
-
-        time_variation = obs2_time - obs1_time
-        time_variation = time_variation.total_seconds()/60
-
-        altitude_variation = whole_data[j + 1][4] - whole_data[j][4]
-
-        rate_of_climb = round(altitude_variation / time_variation)
-
-        whole_data[j].append(rate_of_climb)
-
-    obs1_time = datetime.datetime.fromtimestamp(time.mktime(whole_data[-2][0]))
-    obs2_time = datetime.datetime.fromtimestamp(time.mktime(whole_data[-1][0]))
-
-    time_variation = obs2_time - obs1_time
-    time_variation = time_variation.total_seconds()/60
-
-    altitude_variation = whole_data[-2][4] - whole_data[-1][4]
-
-    rate_of_climb = round(altitude_variation / time_variation)
-
-    whole_data[-1].append(rate_of_climb)
-
-    pitch = None
-    mean_tendency = None
-    for k in range(len(whole_data) - 5):
-        rate_of_climb = [whole_data[k + j][7] for j in range(5)]
-        mean_rate_of_climb = round(sum(rate_of_climb)/5)
-
-        if -20 < mean_rate_of_climb < 20:
-            mean_tendency = 'cruise'
+    airspace = airspaces.cached_airspace(
+        airspace_lower_limit, airspace_upper_limit,
+        tuple(map(tuple, airspace_horizontal_limits))
+    )
 
-        elif mean_rate_of_climb > 100:
-            mean_tendency = 'climb'
+    return airspace.contains(position_coords[0], position_coords[1],
+                             position_alt)
 
-        elif mean_rate_of_climb < -100:
-            mean_tendency = 'descent'
 
-        if whole_data[k][4] == 0 and whole_data[k][5] == 0:
-            pitch = 'parked'
+def first_index(mask: np.ndarray):
+    """
+Index of the first True of a boolean array, None if there's none
+    """
+    return int(np.argmax(mask)) if mask.any() else None
 
-        elif whole_data[k][4] == 0 and whole_data[k][5] < 30:
-            pitch = 'taxi'
 
-        elif k < len(whole_data) \
-                and whole_data[k][4] == 0 \
-                and (whole_data[k - 1][8] == 'taxi'
-                     or whole_data[k - 1][8] == 'takeoff'):
-            pitch = 'takeoff'
+def last_index(mask: np.ndarray):
+    """
+Index of the last True of a boolean array, None if there's none
+    """
+    return len(mask) - 1 - int(np.argmax(mask[::-1])) if mask.any() else None
 
-        elif whole_data[k][4] == 0 \
-                and (whole_data[k - 1][8] == 'descent'
-                     or whole_data[k - 1][8] == 'descent_step'
-                     or whole_data[k - 1][8] == 'landing'):
-            pitch = 'landing'
 
-        elif k > 1 \
-                and (whole_data[k - 1][8] == 'descent'
-                     or whole_data[k - 1][8] == 'descent_step') \
-                and abs(whole_data[k][7]) < 50:
-            pitch = 'descent_step'
+def inside_durations(timestamps: np.ndarray, runs: tuple) -> tuple:
+    """
+Time spent inside an airspace, from the first to the last position of each
+run inside it, and the time from the last position of each run to the next
+position, outside (exit error)
+
+    :param timestamps: epoch seconds of the positions of the track
+    :param runs: (first positions, last positions) of the runs inside the
+           airspace
+    :return: (time inside, exit errors), as timedeltas
+    """
+    starts, ends = runs
+    inside = (timestamps[ends] - timestamps[starts]).sum()
+    exits = (timestamps[ends + 1] - timestamps[ends]).sum()
 
-        elif mean_tendency == 'cruise' and abs(whole_data[k][7]) < 50:
-            pitch = 'cruise'
+    return (datetime.timedelta(seconds=int(inside)),
+            datetime.timedelta(seconds=int(exits)))
 
-        elif mean_tendency == 'climb' and whole_data[k][7] > 50:
-            pitch = 'climb'
 
-        elif mean_tendency == 'descent' and whole_data[k][7] < -50:
-            pitch = 'descent'
+def crossing_events(track: tracks.Track, runs: dict) -> list:
+    """
+Entries into and exits from every airspace, one event per run of positions
+inside it. The errors are the time from the previous position (entry) or to
+the next one (exit), None at the ends of the track
+
+    :param track: flight track
+    :param runs: dict of airspace name: (first positions, last positions) of
+           the runs inside it, as returned by AirspaceRegistry.crossings
+    :return: list of dicts, in entry order
+    """
+    events = list()
+    last = len(track) - 1
+    for name, (starts, ends) in runs.items():
+        for start, end in zip(starts.tolist(), ends.tolist()):
+            entry = track.datetime(start)
+            exit_time = track.datetime(end)
+            events.append({
+                'airspace': name,
+                'entry': entry,
+                'entry_error': entry - track.datetime(start - 1)
+                if start > 0 else None,
+                'entry_coords': track.coords(start),
+                'exit': exit_time,
+                'exit_error': track.datetime(end + 1) - exit_time
+                if end < last else None,
+                'exit_coords': track.coords(end),
+                'duration': exit_time - entry,
+            })
+
+    return sorted(events, key=lambda event: event['entry'])
+
+
+def write_rows(filepath: str, rows: list, output_format: str) -> None:
+    """
+Writes a table with a row per dict, the columns in the order they appear
 
-        whole_data[k].append(pitch)
+    :param filepath: path of the file, without extension
+    :param rows: list of dicts
+    :param output_format: legacy, written by pandas with the durations as
+           text, or one of output_sinks.output_formats
+    """
+    if output_format == 'legacy':
+        pd.DataFrame([
+            {key: str(value) if isinstance(value, datetime.timedelta)
+             else value for key, value in row.items()}
+            for row in rows
+        ]).to_excel(f'{filepath}.xlsx')
+
+    else:
+        # Durations are kept as timedeltas and written as seconds
+        columns = list(dict.fromkeys(key for row in rows for key in row))
+        output_sinks.write_table(
+            filepath, columns,
+            ([row.get(key) for key in columns] for row in rows),
+            output_format
+        )
 
-    for k in range(len(whole_data)-5, len(whole_data)):
-        rate_of_climb = [whole_data[k - j][7] for j in range(5)]
-        mean_rate_of_climb = round(sum(rate_of_climb)/5)
 
-        if -20 < mean_rate_of_climb < 20:
-            mean_tendency = 'cruise'
+def get_flight_time(track: tracks.Track,
+                    tma1_runs: tuple,
+                    tma2_runs: tuple,
+                    ctr_runs: tuple) -> dict:
 
-        elif mean_rate_of_climb > 100:
-            mean_tendency = 'climb'
+    parked, taxi, takeoff, landing, descent_step, cruise, climb, descent = (
+        tracks.phase_codes[phase] for phase
+        in ['parked', 'taxi', 'takeoff', 'landing', 'descent_step', 'cruise',
+            'climb', 'descent']
+    )
 
-        elif mean_rate_of_climb < -100:
-            mean_tendency = 'descent'
+    altitudes = track.altitudes
+    rates_of_climb = track.rates_of_climb
+    phases = track.phases
 
-        if whole_data[k][4] == 0 and whole_data[k][5] == 0:
-            pitch = 'parked'
+    # Seconds from each position to the next one
+    steps = np.diff(track.timestamps)
+    if not steps.all():
+        raise ZeroDivisionError(
+            f'{track.callsign}: consecutive positions with the same timestamp'
+        )
 
-        elif whole_data[k][4] == 0 and whole_data[k][5] < 30:
-            pitch = 'taxi'
+    # Rate of climb (ft/min) to the next position. The last position takes
+    # the one from the previous position, with the opposite sign
+    rates_of_climb[:-1] = np.round(np.diff(altitudes.astype(float))
+                                   / (steps / 60))
+    rates_of_climb[-1] = -rates_of_climb[-2]
+
+    # Mean rate of climb of the window of positions from each one on, or of
+    # the window up to it for the last positions
+    window = phase_thresholds['mean_window']
+    window_sums = np.convolve(rates_of_climb,
+                              np.ones(window, dtype=np.int64), 'valid')
+    window_starts = np.arange(len(track))
+    window_starts[-window:] -= window - 1
+    mean_rates_of_climb = np.round(window_sums[window_starts] / window)
+
+    # Tendency of the mean rate of climb. Where the mean is between the
+    # thresholds the previous tendency is kept
+    cruise_tendency = phase_thresholds['cruise_tendency']
+    climb_tendency = phase_thresholds['climb_tendency']
+    tendencies = np.select([(-cruise_tendency < mean_rates_of_climb)
+                            & (mean_rates_of_climb < cruise_tendency),
+                            mean_rates_of_climb > climb_tendency,
+                            mean_rates_of_climb < -climb_tendency],
+                           [cruise, climb, descent], 0)
+    last_tendency = np.maximum.accumulate(
+        np.where(tendencies != 0, np.arange(len(track)), 0)
+    )
+    tendencies = tendencies[last_tendency]
+
+    # Phases that don't depend on the previous position's phase: on the
+    # ground by speed, in the air by the rate of climb and its tendency
+    on_ground = altitudes == 0
+    ground_phases = np.select(
+        [on_ground & (track.speeds == 0),
+         on_ground & (track.speeds < phase_thresholds['taxi_speed'])],
+        [parked, taxi], 0
+    )
+    level_rate = phase_thresholds['level_rate']
+    level = np.abs(rates_of_climb) < level_rate
+    air_phases = np.select([(tendencies == cruise) & level,
+                            (tendencies == climb)
+                            & (rates_of_climb > level_rate),
+                            (tendencies == descent)
+                            & (rates_of_climb < -level_rate)],
+                           [cruise, climb, descent], 0)
 
-        elif k < len(whole_data) \
-                and whole_data[k][4] == 0 \
-                and (whole_data[k - 1][8] == 'taxi'
-                     or whole_data[k - 1][8] == 'takeoff'):
-            pitch = 'takeoff'
+    # Positions without a matching phase keep the previous position's phase
+    phase = 0
+    for k, (ground, ground_phase, level_k, air_phase) in enumerate(
+            zip(on_ground.tolist(), ground_phases.tolist(), level.tolist(),
+                air_phases.tolist())):
+        if ground_phase:
+            phase = ground_phase
 
-        elif whole_data[k][4] == 0 \
-                and (whole_data[k - 1][8] == 'descent'
-                     or whole_data[k - 1][8] == 'descent_step'
-                     or whole_data[k - 1][8] == 'landing'):
-            pitch = 'landing'
+        elif ground and phase in (taxi, takeoff):
+            phase = takeoff
 
-        elif k > 1 \
-                and (whole_data[k - 1][8] == 'descent'
-                     or whole_data[k - 1][8] == 'descent_step') \
-                and abs(whole_data[k][7]) < 50:
-            pitch = 'descent_step'
+        elif ground and phase in (descent, descent_step, landing):
+            phase = landing
 
-        elif mean_tendency == 'cruise' and abs(whole_data[k][7]) < 50:
-            pitch = 'cruise'
+        elif k > 1 and phase in (descent, descent_step) and level_k:
+            phase = descent_step
 
-        elif mean_tendency == 'climb' and whole_data[k][7] > 50:
-            pitch = 'climb'
+        elif air_phase:
+            phase = air_phase
 
-        elif mean_tendency == 'descent' and whole_data[k][7] < -50:
-            pitch = 'descent'
+        phases[k] = phase
 
-        whole_data[k].append(pitch)
+    previous_phases = np.roll(phases, 1)
 
-    liftoff_index = 0
-    for k in range(len(whole_data)):
-        if whole_data[k][4] > 0:
-            liftoff_index = k
-            break
+    liftoff_index = first_index(altitudes > 0) or 0
 
-    liftoff_previous_time = datetime.datetime.fromtimestamp(
-        time.mktime(whole_data[liftoff_index - 1][0])
-    )
-    liftoff_time = datetime.datetime.fromtimestamp(
-        time.mktime(whole_data[liftoff_index][0])
-    )
+    liftoff_previous_time = track.datetime(liftoff_index - 1)
+    liftoff_time = track.datetime(liftoff_index)
 
     liftoff_time_error = liftoff_time - liftoff_previous_time
 
-    liftoff_coords = whole_data[liftoff_index][3]
+    liftoff_coords = track.coords(liftoff_index)
 
-    highest_alt = max(whole_data,
-                      key=lambda x: x[4])[4]
+    highest_alt = float(altitudes.max())
 
-    level_off_index = None
-    for k in range(1, len(whole_data)):
-        if whole_data[k - 1][8] == 'climb' and \
-                (whole_data[k][8] in {'cruise', 'descent'}
-                 or whole_data[k][7] == 0)  \
-                and abs(whole_data[k][4] - highest_alt) < 250:
-            level_off_index = k
-            break
+    level_off = (previous_phases == climb) \
+        & (np.isin(phases, [cruise, descent]) | (rates_of_climb == 0)) \
+        & (np.abs(altitudes - highest_alt)
+           < phase_thresholds['level_off_margin'])
+    level_off[0] = False
+    level_off_index = first_index(level_off)
 
-    level_off_previous_time = datetime.datetime.fromtimestamp(
-        time.mktime(whole_data[level_off_index - 1][0])
-    )
-    level_off_time = datetime.datetime.fromtimestamp(
-        time.mktime(whole_data[level_off_index][0])
-    )
+    level_off_previous_time = track.datetime(level_off_index - 1)
+    level_off_time = track.datetime(level_off_index)
 
     level_off_time_error = level_off_time - level_off_previous_time
-    level_off_coords = whole_data[level_off_index][3]
+    level_off_coords = track.coords(level_off_index)
 
-    descent_index = None
-    for k in range(len(whole_data)):
-        if whole_data[k][8] == 'descent':
-            descent_index = k
-            break
+    descent_index = first_index(phases == descent)
 
-    descent_previous_time = datetime.datetime.fromtimestamp(
-        time.mktime(whole_data[descent_index - 1][0])
-    )
+    descent_previous_time = track.datetime(descent_index - 1)
 
-    descent_time = datetime.datetime.fromtimestamp(
-        time.mktime(whole_data[descent_index][0])
-    )
+    descent_time = track.datetime(descent_index)
 
     descent_time_error = descent_time - descent_previous_time
-    descent_coords = whole_data[descent_index][3]
-
-    landing_index = None
-    for k in range(len(whole_data)-1, -1, -1):
-        if (whole_data[k][8] == 'landing' and whole_data[k-1][8] != 'landing')\
-                or (whole_data[k][8] == 'taxi'
-                    and whole_data[k-1][8] != 'descent'):
-            landing_index = k
-            break
-    landing_previous_time = datetime.datetime.fromtimestamp(
-        time.mktime(whole_data[landing_index - 1][0])
-    )
+    descent_coords = track.coords(descent_index)
 
-    landing_time = datetime.datetime.fromtimestamp(
-        time.mktime(whole_data[landing_index][0])
+    landing_index = last_index(
+        ((phases == landing) & (previous_phases != landing))
+        | ((phases == taxi) & (previous_phases != descent))
     )
+    landing_previous_time = track.datetime(landing_index - 1)
 
-    landing_coords = whole_data[landing_index][3]
+    landing_time = track.datetime(landing_index)
+
+    landing_coords = track.coords(landing_index)
 
     landing_time_error = landing_time - landing_previous_time
 
-    first_entry_time = datetime.datetime.fromtimestamp(
-        time.mktime(whole_data[0][0])
-    ) if (whole_data[0][8] == 'parked' or whole_data[0][8] == 'taxi') else None
+    first_entry_time = track.datetime(0) \
+        if phases[0] in (parked, taxi) else None
 
     before_takeoff_duration = liftoff_time - first_entry_time \
         if first_entry_time is not None else None
 
-    tma1_entry = datetime.datetime.fromtimestamp(time.mktime(tma1_data[0][0]))
-    tma1_entry_error = \
-        datetime.datetime.fromtimestamp(time.mktime(tma1_data[0][0])) \
-        - datetime.datetime.fromtimestamp(
-            time.mktime(whole_data[tma1_data[0][2] - 1][0])
-        )
-
-    tma1_entry_coords = tma1_data[0][3]
-    tma1_exit = datetime.datetime.fromtimestamp(time.mktime(tma1_data[-1][0]))
-    tma1_exit_error = datetime.datetime.fromtimestamp(
-        time.mktime(whole_data[tma1_data[-1][2] + 1][0])
-    ) - datetime.datetime.fromtimestamp(time.mktime(tma1_data[-1][0]))
-    tma1_exit_coords = tma1_data[-1][3]
-    tma1_time = datetime.timedelta(0)
-    tma1_time_error = datetime.timedelta(0)
-    interrupted_index = list()
-    for j in range(len(tma1_data) - 1):
-        if tma1_data[j][2] == (tma1_data[j + 1][2] - 1):
-            tma1_time += (
-               datetime.datetime.fromtimestamp(time.mktime(tma1_data[j + 1][0]))
-               - datetime.datetime.fromtimestamp(time.mktime(tma1_data[j][0]))
-            )
-
-        else:
-            interrupted_index.append(tma1_data[j][2])
-
-    for index in interrupted_index:
-        tma1_time_error += (
-          datetime.datetime.fromtimestamp(time.mktime(whole_data[index + 1][0]))
-          - datetime.datetime.fromtimestamp(time.mktime(whole_data[index][0]))
-        )
-
-    tma1_time_error += (
-        datetime.datetime.fromtimestamp(time.mktime(tma1_data[0][0]))
-        - datetime.datetime.fromtimestamp(
-            time.mktime(whole_data[tma1_data[0][2] - 1][0])
-        )
-    )
-
-    tma1_time_error += (
-        datetime.datetime.fromtimestamp(
-            time.mktime(whole_data[tma1_data[-1][2] + 1][0])
-        )
-        - datetime.datetime.fromtimestamp(time.mktime(tma1_data[-1][0]))
-    )
-
-    tma2_entry = datetime.datetime.fromtimestamp(time.mktime(tma2_data[0][0]))
-    tma2_entry_error = \
-        datetime.datetime.fromtimestamp(time.mktime(tma2_data[0][0])) \
-        - datetime.datetime.fromtimestamp(
-            time.mktime(whole_data[tma2_data[0][2] - 1][0])
-        )
-    tma2_entry_coords = tma2_data[0][3]
-    tma2_exit = datetime.datetime.fromtimestamp(time.mktime(tma2_data[-1][0]))
-    tma2_exit_error = \
-        datetime.datetime.fromtimestamp(
-            time.mktime(whole_data[tma2_data[-1][2] + 1][0])
-        ) - datetime.datetime.fromtimestamp(time.mktime(tma2_data[-1][0]))
-    tma2_exit_coords = tma2_data[-1][3]
-    tma2_time = datetime.timedelta(0)
-    tma2_time_error = datetime.timedelta(0)
-    interrupted_index.clear()
-    for j in range(len(tma2_data) - 1):
-        if tma2_data[j][2] == (tma2_data[j + 1][2] - 1):
-            tma2_time += (
-               datetime.datetime.fromtimestamp(time.mktime(tma2_data[j + 1][0]))
-               - datetime.datetime.fromtimestamp(time.mktime(tma2_data[j][0]))
-            )
-
-        else:
-            interrupted_index.append(tma2_data[j][2])
-
-    for index in interrupted_index:
-        tma2_time_error += (
-          datetime.datetime.fromtimestamp(time.mktime(whole_data[index + 1][0]))
-          - datetime.datetime.fromtimestamp(time.mktime(whole_data[index][0]))
-        )
-
-    tma2_time_error += (
-        datetime.datetime.fromtimestamp(time.mktime(tma2_data[0][0]))
-        - datetime.datetime.fromtimestamp(
-            time.mktime(whole_data[tma2_data[0][2] - 1][0])
-        )
-    )
-
-    tma2_time_error += (
-            datetime.datetime.fromtimestamp(
-                time.mktime(whole_data[tma2_data[-1][2] + 1][0]))
-            - datetime.datetime.fromtimestamp(time.mktime(tma2_data[-1][0]))
-    )
-
-    ctr_entry = datetime.datetime.fromtimestamp(time.mktime(ctr_data[0][0]))
-    ctr_entry_error = \
-        datetime.datetime.fromtimestamp(time.mktime(ctr_data[0][0])) \
-        - datetime.datetime.fromtimestamp(
-            time.mktime(whole_data[ctr_data[0][2] - 1][0])
-        )
-    ctr_entry_coords = ctr_data[0][3]
-    ctr_exit = datetime.datetime.fromtimestamp(time.mktime(ctr_data[-1][0]))
-    ctr_exit_error = \
-        datetime.datetime.fromtimestamp(
-            time.mktime(whole_data[ctr_data[-1][2] + 1][0])
-        ) - datetime.datetime.fromtimestamp(time.mktime(ctr_data[-1][0]))
-    ctr_exit_coords = ctr_data[-1][3]
-    ctr_time = datetime.timedelta(0)
-    ctr_time_error = datetime.timedelta(0)
-    interrupted_index.clear()
-    for j in range(len(ctr_data) - 1):
-        if ctr_data[j][2] == (ctr_data[j + 1][2] - 1):
-            ctr_time += (
-                datetime.datetime.fromtimestamp(time.mktime(ctr_data[j + 1][0]))
-                - datetime.datetime.fromtimestamp(time.mktime(ctr_data[j][0]))
-            )
-
-        else:
-            interrupted_index.append(ctr_data[j][2])
-
-    for index in interrupted_index:
-        ctr_time_error += (
-          datetime.datetime.fromtimestamp(time.mktime(whole_data[index + 1][0]))
-          - datetime.datetime.fromtimestamp(time.mktime(whole_data[index][0]))
-        )
-
-    ctr_time_error += (
-            datetime.datetime.fromtimestamp(time.mktime(ctr_data[0][0]))
-            - datetime.datetime.fromtimestamp(
-                time.mktime(whole_data[ctr_data[0][2] - 1][0])
-            )
-    )
-
-    ctr_time_error += (
-            datetime.datetime.fromtimestamp(
-                time.mktime(whole_data[ctr_data[-1][2] + 1][0]))
-            - datetime.datetime.fromtimestamp(time.mktime(ctr_data[-1][0]))
-    )
-
-    after_landing_ground_time = (
-            datetime.datetime.fromtimestamp(time.mktime(whole_data[-1][0]))
-            - landing_time
-    )
-
-    total_time = (
-            datetime.datetime.fromtimestamp(time.mktime(whole_data[-1][0]))
-            - datetime.datetime.fromtimestamp(time.mktime(whole_data[0][0]))
-    )
+    tma1_starts, tma1_ends = tma1_runs
+    tma1_entry = track.datetime(tma1_starts[0])
+    tma1_entry_error = tma1_entry - track.datetime(tma1_starts[0] - 1)
+    tma1_entry_coords = track.coords(tma1_starts[0])
+    tma1_exit = track.datetime(tma1_ends[-1])
+    tma1_exit_error = track.datetime(tma1_ends[-1] + 1) - tma1_exit
+    tma1_exit_coords = track.coords(tma1_ends[-1])
+    tma1_time, tma1_time_error = inside_durations(track.timestamps, tma1_runs)
+    tma1_time_error += tma1_entry_error
+
+    tma2_starts, tma2_ends = tma2_runs
+    tma2_entry = track.datetime(tma2_starts[0])
+    tma2_entry_error = tma2_entry - track.datetime(tma2_starts[0] - 1)
+    tma2_entry_coords = track.coords(tma2_starts[0])
+    tma2_exit = track.datetime(tma2_ends[-1])
+    tma2_exit_error = track.datetime(tma2_ends[-1] + 1) - tma2_exit
+    tma2_exit_coords = track.coords(tma2_ends[-1])
+    tma2_time, tma2_time_error = inside_durations(track.timestamps, tma2_runs)
+    tma2_time_error += tma2_entry_error
+
+    ctr_starts, ctr_ends = ctr_runs
+    ctr_entry = track.datetime(ctr_starts[0])
+    ctr_entry_error = ctr_entry - track.datetime(ctr_starts[0] - 1)
+    ctr_entry_coords = track.coords(ctr_starts[0])
+    ctr_exit = track.datetime(ctr_ends[-1])
+    ctr_exit_error = track.datetime(ctr_ends[-1] + 1) - ctr_exit
+    ctr_exit_coords = track.coords(ctr_ends[-1])
+    ctr_time, ctr_time_error = inside_durations(track.timestamps, ctr_runs)
+    ctr_time_error += ctr_entry_error
+
+    after_landing_ground_time = track.datetime(-1) - landing_time
+
+    total_time = track.datetime(-1) - track.datetime(0)
 
     flight_time = total_time - (before_takeoff_duration
                                 + after_landing_ground_time)
@@ -553,560 +435,1127 @@ def get_flight_time(whole_data: list,
     }
 
 
-if not os.path.isdir('visualization/'):
-    os.mkdir('visualization')
-
-file_list = list()
-dir_files = os.listdir('data/ops/')
-for flight in dir_files:
-    if flight[-4:] == '.csv' \
-            and f'{flight[:-4]}.kml'.replace('_', '-') in dir_files:
-        file_list.append(flight[:-4])
-
-all_data = list()
-
-# Visualization - Compile coordinates of ground movements
-all_ground_movement_xs = list()
-all_ground_movement_ys = list()
-# Visualization - Compile coordinates of position in airspace
-#                 other than TMAs São Paulo and CTR Campinas
-all_non_tma_xs = list()
-all_non_tma_ys = list()
-# Visualization - Compile coordinates of positions inside TMA São Paulo 1
-all_on_tma1_xs = list()
-all_on_tma1_ys = list()
-# Visualization - Compile coordinates of positions inside TMA São Paulo 2
-all_on_tma2_xs = list()
-all_on_tma2_ys = list()
-# Visualization - Compile coordinates of positions inside CTR Campinas
-all_on_ctr_xs = list()
-all_on_ctr_ys = list()
-
-# Count the number of flights parsed
-success = 0
-
-for file in sorted(file_list):
-    try:
-        # Path to file containing flight metadata
-        kml_filepath = os.path.abspath(os.path.join(
-            'data/ops/',
-            f'{file}.kml'.replace('_', '-')
-        ))
-
-        # Read and parse .kml file
-        with open(kml_filepath, 'r') as fileHandle:
-            xml = parser.parse(fileHandle)
-
-        # Get xml root
-        root = xml.getroot()
-
-        # Parse html extracted from the xml file
-        soup = BeautifulSoup(root.Document.description.pyval, 'html.parser')
-
-        # Get elements that containing
-        results = list()
-        for result in soup.select('a[title]'):
-            if result.text.strip() and 'airport' in result.get('href'):
-                results.append(result)
-
-        # Get flight info
-        flight_number = root.Document.name.pyval
-        company = str(soup.select_one('div > div > div:first-child'
-                                      ).contents[3])
-
-        # Get arrival and departure airport iata codes
-        dep_ad = results[0].text[:3].upper()
-        arr_ad = results[1].text[:3].upper()
-
-        # Get aircraft information
-        acft_model = soup.select_one(
-            'span[style="color: #333; font-size: 16px; '
-            'font-weight: bold; line-height: 1.3em;"]'
-        ).get_text()
-
-        acft_reg = list(
-            filter(lambda x: '/reg/' in x.get('href'), soup.select('a'))
-        )[0].get_text()
-
-        # Path to file containing flight tracking information
-        tracking_filepath = os.path.abspath(os.path.join(
-            'data/ops',
-            f'{file}.csv')
-        )
+@functools.lru_cache(maxsize=None)
+def flight_registry(airspace_files: tuple) -> airspaces.AirspaceRegistry:
+    """
+Returns the airspaces of the files, loaded only on the first call of each
+process with them
+
+    :param airspace_files: tuple of paths to GeoJSON or KML files
+    :return: AirspaceRegistry
+    """
+    return airspaces.AirspaceRegistry.from_files(list(airspace_files))
+
+
+def render_flight(file: str,
+                  metadata: dict,
+                  flight_time_stats: dict,
+                  positions: dict,
+                  ctr: airspaces.Airspace,
+                  tma1: airspaces.Airspace,
+                  tma2: airspaces.Airspace) -> None:
+    """
+Draws the charts of a flight, visualization/<file[:6]>_unfocused.svg with
+the whole track and visualization/<file[:6]>.svg around the airspaces
+
+    :param file: flight file name, without extension
+    :param metadata: flight information, as returned by
+           flight_metadata.read_metadata
+    :param flight_time_stats: dict returned by get_flight_time
+    :param positions: dict of position category: (longitudes, latitudes)
+    :param ctr: CTR Campinas
+    :param tma1: TMA São Paulo 1
+    :param tma2: TMA São Paulo 2
+    """
+    flight_number = metadata['code']
+    company = metadata['company']
+    dep_ad = metadata['departure_iata']
+    arr_ad = metadata['arrival_iata']
+    acft_model = metadata['aircraft_model']
+    acft_reg = metadata['aircraft_registration']
+
+    ground_movement_xs, ground_movement_ys = positions['ground_movement']
+    non_tma_xs, non_tma_ys = positions['non_tma']
+    on_tma1_xs, on_tma1_ys = positions['on_tma1']
+    on_tma2_xs, on_tma2_ys = positions['on_tma2']
+    on_ctr_xs, on_ctr_ys = positions['on_ctr']
+
+    # Visualization - Set figure size and ax limits
+    fig, ax = plt.subplots()
+    fig.set_size_inches(9, 10)
+    fig.subplots_adjust(wspace=0.01)
+    fig.subplots_adjust(top=0.9, bottom=0.05, left=0.05, right=0.95)
+    fig.suptitle(f'{flight_number} - {company}', size=20)
+
+    # ax.set_xlim(-48, -45)
+    # ax.set_ylim(-25, -22)
+
+    # Visualization - Plot runway
+    ax.plot(sbkp_rwy_thr_xs, sbkp_thr_ys, color='k', lw=2)
+    ax.plot(sbkp_rwy_thr_xs, sbkp_thr_ys, color='w', lw=1.5)
+
+    # Visualization - Create patch for CTR Campinas
+    patch = patches.PathPatch(
+        Path(ctr.horizontal_limits, closed=True),
+        lw=0.5, linestyle='--', alpha=0.5
+    )
+    # Visualization - Create patch for TMA São Paulo 1
+    patch2 = patches.PathPatch(
+        Path(tma1.horizontal_limits, closed=True),
+        lw=0.5, linestyle='--', alpha=0.5
+    )
+    # Visualization - Create patch for TMA São Paulo 2
+    patch3 = patches.PathPatch(
+        Path(tma2.horizontal_limits, closed=True),
+        lw=0.5, linestyle='--', alpha=0.5
+    )
+
+    # Visualization - Add created patches to chart
+    ax.add_patch(patch)
+    ax.add_patch(patch2)
+    ax.add_patch(patch3)
+
+    # Visualization - Plot all positions reported by the aircraft
+    ax.plot(non_tma_xs, non_tma_ys, color='#145c9e', marker='o',
+            markersize=5, linestyle='None', alpha=0.33,
+            label='Outside TMA and CTR')
+    ax.plot(on_tma1_xs, on_tma1_ys, color='#ffc857', marker='o',
+            markersize=5, linestyle='None', alpha=0.33,
+            label='Inside Sao Paulo TMA 1')
+    ax.plot(on_tma2_xs, on_tma2_ys, color='#fe5f55', marker='o',
+            markersize=5, linestyle='None', alpha=0.33,
+            label='Inside Sao Paulo TMA 2')
+    ax.plot(on_ctr_xs, on_ctr_ys, color='#6b2737', marker='o', markersize=5,
+            linestyle='None', alpha=0.33, label='Inside Campinas CTR')
+
+    # Visualization plot all positions reported by the aircraft
+    # while on the ground
+    # ax.plot(ground_movement_xs, ground_movement_ys, 'go', markersize=4,
+    #         alpha=0.1, zorder=2)
+
+    ylim = ax.get_ylim()
+    side = abs(ylim[0] - ylim[1])
+    d_unit = side * 0.05
+
+    tk = ax.annotate(
+        f'Take-Off\n'
+        f'({flight_time_stats["takeoff_time"].strftime("%H:%M")})',
+        xy=list(reversed(flight_time_stats['takeoff_coords'])),
+        xytext=(flight_time_stats['takeoff_coords'][1] - d_unit/2,
+                flight_time_stats['takeoff_coords'][0]),
+        textcoords='data',
+        arrowprops={'arrowstyle': '<-',
+                    'color': 'black',
+                    'lw': 1.5,
+                    'ls': '-'},
+        zorder=10
+    )
+
+    toc = ax.annotate(
+        f'Top of Climb\n'
+        f'({flight_time_stats["level_off_time"].strftime("%H:%M")})',
+        xy=list(reversed(flight_time_stats['level_off_coords'])),
+        xytext=(flight_time_stats['level_off_coords'][1] - d_unit/2,
+                flight_time_stats['level_off_coords'][0]-d_unit),
+        textcoords='data',
+        arrowprops={'arrowstyle': '<-',
+                    'color': 'black',
+                    'lw': 1.5,
+                    'ls': '-'},
+        zorder=10
+    )
+
+    tod = ax.annotate(
+        f'Top of Descent\n'
+        f'({flight_time_stats["descent_init_time"].strftime("%H:%M")})',
+        xy=list(reversed(flight_time_stats['descent_init_coords'])),
+        xytext=(flight_time_stats['descent_init_coords'][1] - d_unit/2,
+                flight_time_stats['descent_init_coords'][0]+d_unit),
+        textcoords='data',
+        arrowprops={'arrowstyle': '<-',
+                    'color': 'black',
+                    'lw': 1.5,
+                    'ls': '-'},
+        zorder=10
+    )
+
+    ln = ax.annotate(
+        f'Land\n'
+        f'({flight_time_stats["touchdown_time"].strftime("%H:%M")})',
+        xy=list(reversed(flight_time_stats['touchdown_coords'])),
+        xytext=(flight_time_stats['touchdown_coords'][1] - d_unit/2,
+                flight_time_stats['touchdown_coords'][0]),
+        textcoords='data',
+        arrowprops={'arrowstyle': '<-',
+                    'color': 'black',
+                    'lw': 1.5,
+                    'ls': '-'},
+        zorder=10
+    )
+
+    # Visualization - Display flight information
+    info_string1 = f'Aircraft model: {acft_model}' \
+                   f'\nAircraft marks: {acft_reg}'
+
+    info_string2 = (
+      f'Departure: {dep_ad} '
+      f'({flight_time_stats["takeoff_time"].strftime("%d/%m/%Y %H:%M")})'
+      f'\nArrival: {arr_ad} '
+      f'({flight_time_stats["touchdown_time"].strftime("%d/%m/%Y %H:%M")})'
+    )
+
+    ax.text(0, 1.05, info_string1, transform=ax.transAxes, fontsize=12,
+            verticalalignment='top')
+
+    ax.text(0.6, 1.05, info_string2, transform=ax.transAxes, fontsize=12,
+            verticalalignment='top')
+
+    ax.legend()
+    plt.axis('equal')
+
+    fig.savefig(os.path.abspath(f"visualization/{file[:6]}_unfocused.svg"),
+                format='svg')
 
-        # Read the file containing the flight tracking data
-        with open(tracking_filepath, 'r') as file_handle:
-            reader = csv.reader(file_handle)
-            data = [line for line in reader]
-
-        # Delete CSV header
-        del data[0]
-
-        for i in range(len(data)):
-            # Convert timestamp to time struct
-            data[i][0] = time.gmtime(int(data[i][0]))
-            # Add index information
-            data[i][2] = i
-            # Split latitude and longitude information
-            data[i][3] = str(data[i][3]).split(',')
-            # Cast latitude and longitude as float
-            data[i][3][0] = float(data[i][3][0])
-            data[i][3][1] = float(data[i][3][1])
-            # Cast altitude as float
-            data[i][4] = float(data[i][4])
-            # Cast speed as float
-            data[i][5] = float(data[i][5])
-            # Add index
-
-        # Ground movement
-        ground_movement = list(filter(lambda x: x[4] == 0, data))
-
-        # Filter ground movement
-        non_tma = list(filter(lambda x: x[4] != 0, data))
-
-        # Filter points inside TMA São Paulo 1
-        non_tma = list(filter(
-            lambda x: not point_in_airspace(x[3], x[4],
-                                            tma1_lower_limit,
-                                            tma1_upper_limit,
-                                            tma1_coords),
-            non_tma))
-        # Filter points inside TMA São Paulo 2
-        non_tma = list(filter(lambda x: not point_in_airspace(x[3], x[4],
-                                                              tma2_lower_limit,
-                                                              tma2_upper_limit,
-                                                              tma2_coords),
-                              non_tma))
-        # Filter points inside CTR Campinas
-        non_tma = list(filter(lambda x: not point_in_airspace(x[3], x[4],
-                                                              ctr_lower_limit,
-                                                              ctr_upper_limit,
-                                                              ctr_coords),
-                              non_tma))
-
-        # Get points inside TMA São Paulo 1
-        on_tma1 = list(filter(lambda x: point_in_airspace(x[3], x[4],
-                                                          tma1_lower_limit,
-                                                          tma1_upper_limit,
-                                                          tma1_coords),
-                              data))
-        # Get points inside TMA São Paulo 2
-        on_tma2 = list(filter(lambda x: point_in_airspace(x[3], x[4],
-                                                          tma2_lower_limit,
-                                                          tma2_upper_limit,
-                                                          tma2_coords),
-                              data))
-        # Get Points inside CTR Campinas
-        on_ctr = list(filter(lambda x: point_in_airspace(x[3], x[4],
-                                                         ctr_lower_limit,
-                                                         ctr_upper_limit,
-                                                         ctr_coords),
-                             data))
-
-        flight_time_stats = get_flight_time(data, on_tma1, on_tma2, on_ctr)
-        for key in flight_time_stats:
-            if isinstance(flight_time_stats[key], datetime.timedelta):
-                flight_time_stats[key] = str(flight_time_stats[key])
-
-        flight_data = {
-            'code': flight_number,
-            'departure_iata': dep_ad,
-            'arrival_iata': arr_ad,
-        }
-
-        flight_data.update(flight_time_stats)
-        all_data.append(flight_data)
-
-        # Visualization - Set figure size and ax limits
-        fig, ax = plt.subplots()
-        fig.set_size_inches(9, 10)
-        fig.subplots_adjust(wspace=0.01)
-        fig.subplots_adjust(top=0.9, bottom=0.05, left=0.05, right=0.95)
-        fig.suptitle(f'{flight_number} - {company}', size=20)
-
-        # ax.set_xlim(-48, -45)
-        # ax.set_ylim(-25, -22)
-
-        # Visualization - Plot runway
-        rwy_bg = ax.plot(sbkp_rwy_thr_xs, sbkp_thr_ys, color='k', lw=2)
-        rwy_fg = ax.plot(sbkp_rwy_thr_xs, sbkp_thr_ys, color='w', lw=1.5)
-
-        # Visualization - Create patch for CTR Campinas
-        patch = patches.PathPatch(
-            Path(ctr_coords, closed=True),
-            lw=0.5, linestyle='--', alpha=0.5
+    ax.set_xlim(-48, -45)
+    ax.set_ylim(-25, -22)
+    d_unit = 5*.05
+    tk.remove()
+    toc.remove()
+    tod.remove()
+    ln.remove()
+
+    if arr_ad == 'VCP':
+        ln = ax.annotate(
+            f'Land\n'
+            f'({flight_time_stats["touchdown_time"].strftime("%H:%M")})',
+            xy=list(reversed(flight_time_stats['touchdown_coords'])),
+            xytext=(flight_time_stats['touchdown_coords'][1] + d_unit,
+                    flight_time_stats['touchdown_coords'][0] + d_unit),
+            textcoords='data',
+            arrowprops={'arrowstyle': '<-',
+                        'color': 'black',
+                        'lw': 1.5,
+                        'ls': '-'},
+            zorder=11
         )
-        # Visualization - Create patch for TMA São Paulo 1
-        patch2 = patches.PathPatch(
-            Path(tma1_coords, closed=True),
-            lw=0.5, linestyle='--', alpha=0.5
+
+        ax.annotate(
+         f'TMA SP1 Entry\n'
+         f'({flight_time_stats["tma_sao_paulo1_entry"].strftime("%H:%M")})',
+         xy=list(
+             reversed(flight_time_stats['tma_sao_paulo1_entry_coords'])),
+         xytext=(
+            flight_time_stats['tma_sao_paulo1_entry_coords'][1] + d_unit,
+            flight_time_stats['tma_sao_paulo1_entry_coords'][0] + d_unit
+         ),
+         textcoords='data',
+         arrowprops={'arrowstyle': '<-',
+                     'color': 'black',
+                     'lw': 1.5,
+                     'ls': '-'},
+         zorder=11
         )
-        # Visualization - Create patch for TMA São Paulo 2
-        patch3 = patches.PathPatch(
-            Path(tma2_coords, closed=True),
-            lw=0.5, linestyle='--', alpha=0.5
+
+        ax.annotate(
+         f'TMA SP2 Entry\n'
+         f'({flight_time_stats["tma_sao_paulo2_entry"].strftime("%H:%M")})',
+         xy=list(
+             reversed(flight_time_stats['tma_sao_paulo2_entry_coords'])),
+         xytext=(
+             flight_time_stats['tma_sao_paulo2_entry_coords'][1] - 2*d_unit,
+             flight_time_stats['tma_sao_paulo2_entry_coords'][0] - 2*d_unit
+         ),
+         textcoords='data',
+         arrowprops={'arrowstyle': '<-',
+                     'color': 'black',
+                     'lw': 1.5,
+                     'ls': '-'},
+         zorder=11
         )
 
-        # Visualization - Add created patches to chart
-        ax.add_patch(patch)
-        ax.add_patch(patch2)
-        ax.add_patch(patch3)
-
-        # Visualization - Get coordinates of ground movements
-        ground_movement_xs = [entry[3][1] for entry in ground_movement]
-        ground_movement_ys = [entry[3][0] for entry in ground_movement]
-        # Visualization - Get coordinates of position in airspace
-        #                 other than TMAs São Paulo and CTR Campinas
-        non_tma_xs = [entry[3][1] for entry in non_tma]
-        non_tma_ys = [entry[3][0] for entry in non_tma]
-        # Visualization - Get coordinates of positions inside TMA São Paulo 1
-        on_tma1_xs = [entry[3][1] for entry in on_tma1]
-        on_tma1_ys = [entry[3][0] for entry in on_tma1]
-        # Visualization - Get coordinates of positions inside TMA São Paulo 2
-        on_tma2_xs = [entry[3][1] for entry in on_tma2]
-        on_tma2_ys = [entry[3][0] for entry in on_tma2]
-        # Visualization - Get coordinates of positions inside CTR Campinas
-        on_ctr_xs = [entry[3][1] for entry in on_ctr]
-        on_ctr_ys = [entry[3][0] for entry in on_ctr]
-
-        # Add coordinates to compilation
-        all_ground_movement_xs.extend(ground_movement_xs)
-        all_ground_movement_ys.extend(ground_movement_ys)
-        all_non_tma_xs.extend(non_tma_xs)
-        all_non_tma_ys.extend(non_tma_ys)
-        all_on_tma1_xs.extend(on_tma1_xs)
-        all_on_tma1_ys.extend(on_tma1_ys)
-        all_on_tma2_xs.extend(on_tma2_xs)
-        all_on_tma2_ys.extend(on_tma2_ys)
-        all_on_ctr_xs.extend(on_ctr_xs)
-        all_on_ctr_ys.extend(on_ctr_ys)
-
-        # Visualization - Plot all positions reported by the aircraft
-        ax.plot(non_tma_xs, non_tma_ys, color='#145c9e', marker='o',
-                markersize=5, linestyle='None', alpha=0.33,
-                label='Outside TMA and CTR')
-        ax.plot(on_tma1_xs, on_tma1_ys, color='#ffc857', marker='o',
-                markersize=5, linestyle='None', alpha=0.33,
-                label='Inside Sao Paulo TMA 1')
-        ax.plot(on_tma2_xs, on_tma2_ys, color='#fe5f55', marker='o',
-                markersize=5, linestyle='None', alpha=0.33,
-                label='Inside Sao Paulo TMA 2')
-        ax.plot(on_ctr_xs, on_ctr_ys, color='#6b2737', marker='o', markersize=5,
-                linestyle='None', alpha=0.33, label='Inside Campinas CTR')
-
-        # Visualization plot all positions reported by the aircraft
-        # while on the ground
-        # ax.plot(ground_movement_xs, ground_movement_ys, 'go', markersize=4,
-        #         alpha=0.1, zorder=2)
-
-        ylim = ax.get_ylim()
-        side = abs(ylim[0] - ylim[1])
-        d_unit = side * 0.05
+        ax.annotate(
+           f'CTR Entry\n'
+           f'({flight_time_stats["ctr_campinas_entry"].strftime("%H:%M")})',
+           xy=list(
+               reversed(flight_time_stats['ctr_campinas_entry_coords'])),
+           xytext=(flight_time_stats['ctr_campinas_entry_coords'][1]
+                   - d_unit/2,
+                   flight_time_stats['ctr_campinas_entry_coords'][0]
+                   - 1.5*d_unit),
+           textcoords='data',
+           arrowprops={'arrowstyle': '<-',
+                       'color': 'black',
+                       'lw': 1.5,
+                       'ls': '-'},
+           zorder=11
+        )
 
+    else:
         tk = ax.annotate(
             f'Take-Off\n'
             f'({flight_time_stats["takeoff_time"].strftime("%H:%M")})',
             xy=list(reversed(flight_time_stats['takeoff_coords'])),
-            xytext=(flight_time_stats['takeoff_coords'][1] - d_unit/2,
-                    flight_time_stats['takeoff_coords'][0]),
+            xytext=(flight_time_stats['takeoff_coords'][1],
+                    flight_time_stats['takeoff_coords'][0] - d_unit),
             textcoords='data',
             arrowprops={'arrowstyle': '<-',
                         'color': 'black',
                         'lw': 1.5,
                         'ls': '-'},
-            zorder=10
+            zorder=11
         )
 
-        toc = ax.annotate(
-            f'Top of Climb\n'
-            f'({flight_time_stats["level_off_time"].strftime("%H:%M")})',
-            xy=list(reversed(flight_time_stats['level_off_coords'])),
-            xytext=(flight_time_stats['level_off_coords'][1] - d_unit/2,
-                    flight_time_stats['level_off_coords'][0]-d_unit),
+        ax.annotate(
+            f'CTR Exit\n'
+            f'({flight_time_stats["ctr_campinas_exit"].strftime("%H:%M")})',
+            xy=list(
+                reversed(flight_time_stats['ctr_campinas_exit_coords'])),
+            xytext=(flight_time_stats['ctr_campinas_exit_coords'][1]
+                    + 2 * d_unit,
+                    flight_time_stats['ctr_campinas_exit_coords'][0]),
             textcoords='data',
             arrowprops={'arrowstyle': '<-',
                         'color': 'black',
                         'lw': 1.5,
                         'ls': '-'},
-            zorder=10
+            zorder=11
         )
 
-        tod = ax.annotate(
-            f'Top of Descent\n'
-            f'({flight_time_stats["descent_init_time"].strftime("%H:%M")})',
-            xy=list(reversed(flight_time_stats['descent_init_coords'])),
-            xytext=(flight_time_stats['descent_init_coords'][1] - d_unit/2,
-                    flight_time_stats['descent_init_coords'][0]+d_unit),
-            textcoords='data',
-            arrowprops={'arrowstyle': '<-',
-                        'color': 'black',
-                        'lw': 1.5,
-                        'ls': '-'},
-            zorder=10
+        ax.annotate(
+          f'TMA SP2 Exit\n'
+          f'({flight_time_stats["tma_sao_paulo2_exit"].strftime("%H:%M")})',
+          xy=list(
+              reversed(flight_time_stats['tma_sao_paulo2_exit_coords'])),
+          xytext=(
+              flight_time_stats['tma_sao_paulo2_exit_coords'][1]
+              - d_unit,
+              flight_time_stats['tma_sao_paulo2_exit_coords'][0]
+              + d_unit / 2
+          ),
+          textcoords='data',
+          arrowprops={'arrowstyle': '<-',
+                      'color': 'black',
+                      'lw': 1.5,
+                      'ls': '-'},
+          zorder=11
         )
 
-        ln = ax.annotate(
-            f'Land\n'
-            f'({flight_time_stats["touchdown_time"].strftime("%H:%M")})',
-            xy=list(reversed(flight_time_stats['touchdown_coords'])),
-            xytext=(flight_time_stats['touchdown_coords'][1] - d_unit/2,
-                    flight_time_stats['touchdown_coords'][0]),
-            textcoords='data',
-            arrowprops={'arrowstyle': '<-',
-                        'color': 'black',
-                        'lw': 1.5,
-                        'ls': '-'},
-            zorder=10
+        ax.annotate(
+          f'TMA SP1 Exit\n'
+          f'({flight_time_stats["tma_sao_paulo1_exit"].strftime("%H:%M")})',
+          xy=list(
+              reversed(flight_time_stats['tma_sao_paulo1_exit_coords'])),
+          xytext=(
+              flight_time_stats['tma_sao_paulo1_exit_coords'][1] - d_unit/2,
+              flight_time_stats['tma_sao_paulo1_exit_coords'][0]
+              + 0.66*d_unit
+          ),
+          textcoords='data',
+          arrowprops={'arrowstyle': '<-',
+                      'color': 'black',
+                      'lw': 1.5,
+                      'ls': '-'},
+          zorder=11
         )
 
-        # Visualization - Display flight information
-        info_string1 = f'Aircraft model: {acft_model}' \
-                       f'\nAircraft marks: {acft_reg}'
+    # Visualization - Display figure
+    fig.savefig(os.path.abspath(f"visualization/{file[:6]}.svg"),
+                format='svg')
+
+    plt.close(fig)
+
+
+def result_path(file: str) -> str:
+    """
+Path of the saved result of a flight
+    """
+    return os.path.join(results_dir, f'{file}.pkl')
+
+
+def save_result(file: str, result: dict, key: str = None) -> None:
+    """
+Saves the result of a flight for the render stage, atomically, after its
+key. The file is left untouched when the result didn't change, so its charts
+stay up to date
+
+    :param file: flight file name, without extension
+    :param result: dict returned by process_flight
+    :param key: key of the result, as returned by result_key
+    """
+    path = result_path(file)
+    content = pickle.dumps(key) + pickle.dumps(result)
+    if os.path.isfile(path):
+        with open(path, 'rb') as file_handle:
+            if file_handle.read() == content:
+                return
+
+    os.makedirs(results_dir, exist_ok=True)
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'wb') as file_handle:
+        file_handle.write(content)
+    os.replace(tmp_path, path)
+
+
+def load_result(file: str):
+    """
+Loads the saved result of a flight
+
+    :param file: flight file name, without extension
+    :return: dict, see process_flight, or None if it wasn't saved
+    """
+    path = result_path(file)
+    if not os.path.isfile(path):
+        return None
+
+    with open(path, 'rb') as file_handle:
+        # Skip its key
+        pickle.load(file_handle)
+
+        return pickle.load(file_handle)
+
+
+def saved_key(file: str):
+    """
+Key the result of a flight was saved with, None if it wasn't saved
+    """
+    path = result_path(file)
+    if not os.path.isfile(path):
+        return None
+
+    with open(path, 'rb') as file_handle:
+        return pickle.load(file_handle)
+
+
+def csv_path(file: str) -> str:
+    """
+Path to the .csv file of a flight, holding its track
+    """
+    return os.path.abspath(os.path.join('data/ops/', f'{file}.csv'))
+
+
+def kml_path(file: str) -> str:
+    """
+Path to the .kml file of a flight, holding its metadata
+    """
+    return os.path.abspath(os.path.join('data/ops/',
+                                        f'{file}.kml'.replace('_', '-')))
+
+
+class HashIndex:
+    """
+Content hashes of files, by absolute path, with the modification time (ns)
+and size of the file they were computed from, so a file is only read again
+when either changed
+    """
+    __slots__ = ('path', 'entries', 'changed')
+
+    def __init__(self, path: str = hashes_path):
+        """
+    :param path: path to the .pkl file of the index
+        """
+        self.path = path
+        self.changed = False
+        self.entries = dict()
+        if os.path.isfile(self.path):
+            with open(self.path, 'rb') as file_handle:
+                self.entries = pickle.load(file_handle)
+
+    def file_hash(self, filepath: str) -> str:
+        """
+SHA-256 hex digest of a file's content, computed only if the file is new
+or changed since it was
+
+    :param filepath: path to the file
+    :return: hex digest
+        """
+        key = os.path.abspath(filepath)
+        stat = os.stat(key)
+        entry = self.entries.get(key)
+        if entry is not None and entry[:2] == (stat.st_mtime_ns, stat.st_size):
+            return entry[2]
+
+        digest = metar_store.file_hash(key)
+        self.entries[key] = (stat.st_mtime_ns, stat.st_size, digest)
+        self.changed = True
+
+        return digest
+
+    def save(self) -> None:
+        """
+Saves the index atomically, if it changed
+        """
+        if not self.changed:
+            return
+
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp_path = f'{self.path}.tmp'
+        with open(tmp_path, 'wb') as file_handle:
+            pickle.dump(self.entries, file_handle,
+                        protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, self.path)
+        self.changed = False
+
+
+def config_hash(airspace_files: tuple, hashes: HashIndex) -> str:
+    """
+Returns the hash of what the analysis of every flight depends on besides
+its files: the result version, the phase thresholds and the content of the
+airspace files
+
+    :param airspace_files: tuple of paths to the airspace files
+    :param hashes: content hashes of the files hashed before
+    :return: hex digest
+    """
+    digest = hashlib.sha256(f'v{result_version}'.encode('utf8'))
+    digest.update(json.dumps(phase_thresholds, sort_keys=True).encode('utf8'))
+    for path in airspace_files:
+        digest.update(hashes.file_hash(path).encode('utf8'))
+
+    return digest.hexdigest()
+
+
+def result_key(file: str, config: str, hashes: HashIndex) -> str:
+    """
+Returns the key of the result of a flight, the hash of its .csv and .kml
+files and of the analysis configuration. Any change to them changes it
+
+    :param file: flight file name, without extension
+    :param config: analysis configuration hash, as returned by config_hash
+    :param hashes: content hashes of the files hashed before
+    :return: hex digest
+    """
+    digest = hashlib.sha256(config.encode('utf8'))
+    for path in [csv_path(file), kml_path(file)]:
+        digest.update(hashes.file_hash(path).encode('utf8'))
+
+    return digest.hexdigest()
+
+
+def analyse_track(track: tracks.Track,
+                  metadata: dict,
+                  registry: airspaces.AirspaceRegistry) -> dict:
+    """
+Analyses the track of a flight
+
+    :param track: flight track
+    :param metadata: flight information, as returned by
+           flight_metadata.read_metadata
+    :param registry: airspaces, including CTR Campinas and TMAs São Paulo 1
+           and 2
+    :return: dict with the flight metadata, the flight_data row, the crossing
+             events and the positions of each category, as (longitudes,
+             latitudes)
+    """
+    ctr = registry.airspace(ctr_name)
+    tma1 = registry.airspace(tma1_name)
+    tma2 = registry.airspace(tma2_name)
+
+    # Ground movement
+    ground_movement = np.flatnonzero(track.altitudes == 0)
+
+    # Classify every position against every airspace at once
+    membership = registry.classify_track(track.latitudes,
+                                         track.longitudes,
+                                         track.altitudes)
+    in_tma1 = registry.mask(membership, tma1.name)
+    in_tma2 = registry.mask(membership, tma2.name)
+    in_ctr = registry.mask(membership, ctr.name)
+
+    # Positions in the air outside TMAs São Paulo and CTR Campinas
+    non_tma = np.flatnonzero(
+        (track.altitudes != 0) & ~(in_tma1 | in_tma2 | in_ctr)
+    )
+
+    # Get points inside TMA São Paulo 1
+    on_tma1 = np.flatnonzero(in_tma1)
+    # Get points inside TMA São Paulo 2
+    on_tma2 = np.flatnonzero(in_tma2)
+    # Get Points inside CTR Campinas
+    on_ctr = np.flatnonzero(in_ctr)
+
+    # Runs of consecutive positions inside each airspace
+    runs = registry.crossings(membership)
+
+    flight_time_stats = get_flight_time(track, runs[tma1.name],
+                                        runs[tma2.name], runs[ctr.name])
 
-        info_string2 = (
-          f'Departure: {dep_ad} '
-          f'({flight_time_stats["takeoff_time"].strftime("%d/%m/%Y %H:%M")})'
-          f'\nArrival: {arr_ad} '
-          f'({flight_time_stats["touchdown_time"].strftime("%d/%m/%Y %H:%M")})'
+    flight_data = {
+        'code': metadata['code'],
+        'departure_iata': metadata['departure_iata'],
+        'arrival_iata': metadata['arrival_iata'],
+    }
+
+    flight_data.update(flight_time_stats)
+
+    events = [{'code': metadata['code'], **event}
+              for event in crossing_events(track, runs)]
+
+    # Visualization - Coordinates of each category of positions
+    positions = {
+        category: (track.longitudes[indexes], track.latitudes[indexes])
+        for category, indexes in zip(
+            position_categories,
+            [ground_movement, non_tma, on_tma1, on_tma2, on_ctr]
         )
+    }
+
+    return {'metadata': metadata,
+            'flight_data': flight_data,
+            'events': events,
+            'positions': positions}
+
+
+def process_flight(file: str, airspace_files: tuple,
+                   metadata: dict = None, key: str = None) -> tuple:
+    """
+Analyses a flight of data/ops/ and saves its result for the render stage
+
+    :param file: flight file name, without extension
+    :param airspace_files: tuple of paths to the airspace files
+    :param metadata: flight information, read from the .kml file when None
+    :param key: key to save the result with, as returned by result_key
+    :return: (result, error). result is as returned by analyse_track. When
+             the flight can't be analysed result is None and error describes
+             it
+    """
+    registry = flight_registry(airspace_files)
+
+    track = None
+    try:
+        if metadata is None:
+            metadata = flight_metadata.read_metadata(kml_path(file))
 
-        ax.text(0, 1.05, info_string1, transform=ax.transAxes, fontsize=12,
-                verticalalignment='top')
-
-        ax.text(0.6, 1.05, info_string2, transform=ax.transAxes, fontsize=12,
-                verticalalignment='top')
-
-        ax.legend()
-        plt.axis('equal')
-
-        fig.savefig(os.path.abspath(f"visualization/{file[:6]}_unfocused.svg"),
-                    format='svg')
-
-        ax.set_xlim(-48, -45)
-        ax.set_ylim(-25, -22)
-        d_unit = 5*.05
-        tk.remove()
-        toc.remove()
-        tod.remove()
-        ln.remove()
-
-        if arr_ad == 'VCP':
-            ln = ax.annotate(
-                f'Land\n'
-                f'({flight_time_stats["touchdown_time"].strftime("%H:%M")})',
-                xy=list(reversed(flight_time_stats['touchdown_coords'])),
-                xytext=(flight_time_stats['touchdown_coords'][1] + d_unit,
-                        flight_time_stats['touchdown_coords'][0] + d_unit),
-                textcoords='data',
-                arrowprops={'arrowstyle': '<-',
-                            'color': 'black',
-                            'lw': 1.5,
-                            'ls': '-'},
-                zorder=11
-            )
-
-            ax.annotate(
-             f'TMA SP1 Entry\n'
-             f'({flight_time_stats["tma_sao_paulo1_entry"].strftime("%H:%M")})',
-             xy=list(
-                 reversed(flight_time_stats['tma_sao_paulo1_entry_coords'])),
-             xytext=(
-                flight_time_stats['tma_sao_paulo1_entry_coords'][1] + d_unit,
-                flight_time_stats['tma_sao_paulo1_entry_coords'][0] + d_unit
-             ),
-             textcoords='data',
-             arrowprops={'arrowstyle': '<-',
-                         'color': 'black',
-                         'lw': 1.5,
-                         'ls': '-'},
-             zorder=11
-            )
-
-            ax.annotate(
-             f'TMA SP2 Entry\n'
-             f'({flight_time_stats["tma_sao_paulo2_entry"].strftime("%H:%M")})',
-             xy=list(
-                 reversed(flight_time_stats['tma_sao_paulo2_entry_coords'])),
-             xytext=(
-                 flight_time_stats['tma_sao_paulo2_entry_coords'][1] - 2*d_unit,
-                 flight_time_stats['tma_sao_paulo2_entry_coords'][0] - 2*d_unit
-             ),
-             textcoords='data',
-             arrowprops={'arrowstyle': '<-',
-                         'color': 'black',
-                         'lw': 1.5,
-                         'ls': '-'},
-             zorder=11
-            )
-
-            ax.annotate(
-               f'CTR Entry\n'
-               f'({flight_time_stats["ctr_campinas_entry"].strftime("%H:%M")})',
-               xy=list(
-                   reversed(flight_time_stats['ctr_campinas_entry_coords'])),
-               xytext=(flight_time_stats['ctr_campinas_entry_coords'][1]
-                       - d_unit/2,
-                       flight_time_stats['ctr_campinas_entry_coords'][0]
-                       - 1.5*d_unit),
-               textcoords='data',
-               arrowprops={'arrowstyle': '<-',
-                           'color': 'black',
-                           'lw': 1.5,
-                           'ls': '-'},
-               zorder=11
-            )
-
-        else:
-            tk = ax.annotate(
-                f'Take-Off\n'
-                f'({flight_time_stats["takeoff_time"].strftime("%H:%M")})',
-                xy=list(reversed(flight_time_stats['takeoff_coords'])),
-                xytext=(flight_time_stats['takeoff_coords'][1],
-                        flight_time_stats['takeoff_coords'][0] - d_unit),
-                textcoords='data',
-                arrowprops={'arrowstyle': '<-',
-                            'color': 'black',
-                            'lw': 1.5,
-                            'ls': '-'},
-                zorder=11
-            )
-
-            ax.annotate(
-                f'CTR Exit\n'
-                f'({flight_time_stats["ctr_campinas_exit"].strftime("%H:%M")})',
-                xy=list(
-                    reversed(flight_time_stats['ctr_campinas_exit_coords'])),
-                xytext=(flight_time_stats['ctr_campinas_exit_coords'][1]
-                        + 2 * d_unit,
-                        flight_time_stats['ctr_campinas_exit_coords'][0]),
-                textcoords='data',
-                arrowprops={'arrowstyle': '<-',
-                            'color': 'black',
-                            'lw': 1.5,
-                            'ls': '-'},
-                zorder=11
-            )
-
-            ax.annotate(
-              f'TMA SP2 Exit\n'
-              f'({flight_time_stats["tma_sao_paulo2_exit"].strftime("%H:%M")})',
-              xy=list(
-                  reversed(flight_time_stats['tma_sao_paulo2_exit_coords'])),
-              xytext=(
-                  flight_time_stats['tma_sao_paulo2_exit_coords'][1]
-                  - d_unit,
-                  flight_time_stats['tma_sao_paulo2_exit_coords'][0]
-                  + d_unit / 2
-              ),
-              textcoords='data',
-              arrowprops={'arrowstyle': '<-',
-                          'color': 'black',
-                          'lw': 1.5,
-                          'ls': '-'},
-              zorder=11
-            )
-
-            ax.annotate(
-              f'TMA SP1 Exit\n'
-              f'({flight_time_stats["tma_sao_paulo1_exit"].strftime("%H:%M")})',
-              xy=list(
-                  reversed(flight_time_stats['tma_sao_paulo1_exit_coords'])),
-              xytext=(
-                  flight_time_stats['tma_sao_paulo1_exit_coords'][1] - d_unit/2,
-                  flight_time_stats['tma_sao_paulo1_exit_coords'][0]
-                  + 0.66*d_unit
-              ),
-              textcoords='data',
-              arrowprops={'arrowstyle': '<-',
-                          'color': 'black',
-                          'lw': 1.5,
-                          'ls': '-'},
-              zorder=11
-            )
-
-        # Visualization - Display figure
-        fig.savefig(os.path.abspath(f"visualization/{file[:6]}.svg"),
-                    format='svg')
-
-        plt.close(fig)
-        success += 1
+        # Read the file containing the flight tracking data, or map its
+        # cached columns
+        track = tracks.load(csv_path(file))
+
+        result = analyse_track(track, metadata, registry)
 
     except TypeError:
-        print(f'{file} - last alt {data[-1][4]}')
-
-fig, ax = plt.subplots()
-fig.set_size_inches(9, 9.5)
-fig.subplots_adjust(wspace=0.01)
-fig.subplots_adjust(top=0.9, bottom=0.1, left=0.1, right=0.9)
-fig.suptitle(f'Compiled ({success} flights)', size=20)
-# ax.set_axis_off()
-
-# Visualization - Plot runway
-rwy_bg = ax.plot(sbkp_rwy_thr_xs, sbkp_thr_ys,
-                 color='k', lw=2, zorder=5, alpha=0.5)
-rwy_fg = ax.plot(sbkp_rwy_thr_xs, sbkp_thr_ys,
-                 color='w', lw=1.5, zorder=5, alpha=0.5)
-
-# Visualization - Create patch for CTR Campinas
-patch = patches.PathPatch(
-    Path(ctr_coords, closed=True),
-    lw=0.5, linestyle='--', alpha=0.5
-)
-# Visualization - Create patch for TMA São Paulo 1
-patch2 = patches.PathPatch(
-    Path(tma1_coords, closed=True),
-    lw=0.5, linestyle='--', alpha=0.5
-)
-# Visualization - Create patch for TMA São Paulo 2
-patch3 = patches.PathPatch(
-    Path(tma2_coords, closed=True),
-    lw=0.5, linestyle='--', alpha=0.5
-)
-# Visualization - Create patch for CTR Campinas
-patch4 = patches.PathPatch(
-    Path(ctr_coords, closed=True),
-    lw=0.5, linestyle='--', alpha=0.5, edgecolor='black', facecolor='none',
-    zorder=10
-)
-# Visualization - Create patch for TMA São Paulo 1
-patch5 = patches.PathPatch(
-    Path(tma1_coords, closed=True),
-    lw=0.5, linestyle='--', alpha=0.5, edgecolor='black', facecolor='none',
-    zorder=10
-)
-# Visualization - Create patch for TMA São Paulo 2
-patch6 = patches.PathPatch(
-    Path(tma2_coords, closed=True),
-    lw=0.5, linestyle='--', alpha=0.5, edgecolor='black', facecolor='none',
-    zorder=10
-)
-
-# Visualization - Add created patches to chart
-ax.add_patch(patch)
-ax.add_patch(patch2)
-ax.add_patch(patch3)
-ax.add_patch(patch4)
-ax.add_patch(patch5)
-ax.add_patch(patch6)
-
-ax.plot(all_non_tma_xs, all_non_tma_ys, color='#145c9e', marker='o',
-        markersize=5, linestyle='None', alpha=0.15, label='Outside TMA and CTR')
-ax.plot(all_on_tma1_xs, all_on_tma1_ys, color='#ffc857', marker='o',
-        markersize=5, linestyle='None', alpha=0.15,
-        label='Inside Sao Paulo TMA 1')
-ax.plot(all_on_tma2_xs, all_on_tma2_ys, color='#fe5f55', marker='o',
-        markersize=5, linestyle='None', alpha=0.15,
-        label='Inside Sao Paulo TMA 2')
-ax.plot(all_on_ctr_xs, all_on_ctr_ys, color='#6b2737', marker='o', markersize=5,
-        linestyle='None', alpha=0.15, label='Inside Campinas CTR')
-# ax.plot(ground_movement_xs, ground_movement_ys, color='#226f54', marker='o',
-#         markersize=4, linestyle=None, alpha=0.1, zorder=2)
-
-fig.savefig(os.path.join('visualization/', 'all_unfocused.svg'), format='svg')
-ax.set_xlim(-48, -45)
-ax.set_ylim(-25, -22)
-fig.savefig(os.path.join('visualization/', 'all.svg'), format='svg')
-
-df = pd.DataFrame(all_data)
-df.to_excel('Dados VCP (2).xlsx')
-plt.close(fig)
+        last_altitude = track.altitudes[-1] if track is not None else None
+        return None, f'{file} - last alt {last_altitude}'
+
+    save_result(file, result, key)
+
+    return result, None
+
+
+def process_combined_flight(name: str,
+                            track: tracks.Track,
+                            airspace_files: tuple) -> tuple:
+    """
+Analyses a flight of a combined position file, see combined_tracks. Its
+information is only its callsign, as code, and any error is reported
+
+    :param name: flight name, as read by combined_tracks.read_flights
+    :param track: flight track
+    :param airspace_files: tuple of paths to the airspace files
+    :return: (result, error), see process_flight
+    """
+    metadata = dict.fromkeys(flight_catalog.metadata_columns)
+    metadata['code'] = track.callsign or name
+
+    try:
+        return analyse_track(track, metadata,
+                             flight_registry(airspace_files)), None
+    except Exception as exception:
+        return None, f'{name} - {exception!r}'
+
+
+def ingest_flights(filepath: str,
+                   airspace_files: tuple,
+                   workers: int = 1,
+                   flight_column: str = combined_tracks.default_flight_column):
+    """
+Processes the flights of a combined position file as they're read, one by
+one or, with more than one worker, in a pool of worker processes with a few
+flights queued per worker. The results come in the order the flights are
+read either way, and aren't saved
+
+    :param filepath: path to the combined .csv file
+    :param airspace_files: tuple of paths to the airspace files
+    :param workers: number of worker processes
+    :param flight_column: column of the flight key
+    :return: generator of (name, result, error), see process_flight
+    """
+    flights = combined_tracks.read_flights(filepath, flight_column)
+
+    if workers <= 1:
+        for name, track in flights:
+            yield name, *process_combined_flight(name, track, airspace_files)
+
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        queued = collections.deque()
+        for name, track in flights:
+            queued.append((name, executor.submit(process_combined_flight,
+                                                 name, track,
+                                                 airspace_files)))
+            if len(queued) >= 2 * workers:
+                name, future = queued.popleft()
+                yield name, *future.result()
+
+        while queued:
+            name, future = queued.popleft()
+            yield name, *future.result()
+
+
+def process_flights(files: list, airspace_files: tuple, workers: int = 1,
+                    metadata_index: flight_metadata.MetadataIndex = None):
+    """
+Processes the flights one by one or, with more than one worker, in a pool
+of worker processes. The results come in the order of the files either way.
+In the pool, a flight that fails is reported as its error without stopping
+the others. A flight whose result was saved with the same key, i.e. with the
+same files and analysis configuration, isn't analysed again
+
+    :param files: flight file names, without extension
+    :param airspace_files: tuple of paths to the airspace files
+    :param workers: number of worker processes
+    :param metadata_index: flight information of the .kml files read before,
+           only the .kml files not in it or changed since are read, and it is
+           updated with them
+    :return: generator of (file, result, error), see process_flight
+    """
+    if metadata_index is None:
+        metadata_index = flight_metadata.MetadataIndex()
+
+    # Files are only hashed again when they changed since the last run
+    hashes = HashIndex()
+    config = config_hash(airspace_files, hashes)
+    keys = [result_key(file, config, hashes) for file in files]
+    hashes.save()
+    # Flights whose result was saved with the same key, loaded when their
+    # turn comes
+    saved = [saved_key(file) == key for file, key in zip(files, keys)]
+
+    # Modification times of the .kml files before reading them, so a file
+    # changed meanwhile is read again on the next run
+    mtimes = [flight_metadata.modification_time(kml_path(file))
+              for file in files]
+    known = [metadata_index.get(kml_path(file), mtime)
+             for file, mtime in zip(files, mtimes)]
+
+    def indexed(file, mtime, result, error):
+        if result is not None:
+            metadata_index.put(kml_path(file), mtime, result['metadata'])
+
+        return file, result, error
+
+    if workers <= 1:
+        for file, key, is_saved, mtime, metadata in zip(files, keys, saved,
+                                                        mtimes, known):
+            if is_saved:
+                yield file, load_result(file), None
+            else:
+                result, error = process_flight(file, airspace_files,
+                                               metadata, key)
+                yield indexed(file, mtime, result, error)
+
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [None if is_saved
+                   else executor.submit(process_flight, file, airspace_files,
+                                        metadata, key)
+                   for file, key, is_saved, metadata in zip(files, keys, saved,
+                                                            known)]
+
+        for file, mtime, future in zip(files, mtimes, futures):
+            if future is None:
+                yield file, load_result(file), None
+                continue
+
+            try:
+                result, error = future.result()
+            except Exception as exception:
+                result, error = None, f'{file} - {exception!r}'
+
+            yield indexed(file, mtime, result, error)
+
+
+def flight_charts(file: str) -> list:
+    """
+Paths of the charts of a flight
+    """
+    return [os.path.abspath(f'visualization/{file[:6]}_unfocused.svg'),
+            os.path.abspath(f'visualization/{file[:6]}.svg')]
+
+
+def up_to_date(outputs: list, inputs: list) -> bool:
+    """
+Returns whether all the outputs exist and are newer than all the inputs
+    """
+    if not all(os.path.isfile(output) for output in outputs):
+        return False
+
+    return min(os.path.getmtime(output) for output in outputs) \
+        > max(os.path.getmtime(path) for path in inputs)
+
+
+def compiled_key(files: list, airspace_files: tuple) -> str:
+    """
+Returns the key of the compiled charts, the hash of the flights drawn in
+them and of the analysis configuration. Drawing other flights, e.g. another
+selection of the catalog, changes it
+
+    :param files: flight file names, without extension
+    :param airspace_files: tuple of paths to the airspace files
+    :return: hex digest
+    """
+    digest = hashlib.sha256(
+        config_hash(airspace_files, HashIndex()).encode('utf8')
+    )
+    for file in sorted(files):
+        digest.update(f'{file}\n'.encode('utf8'))
+
+    return digest.hexdigest()
+
+
+def compiled_saved_key():
+    """
+Key the compiled charts were drawn with, None if unknown
+    """
+    if not os.path.isfile(compiled_key_path):
+        return None
+
+    with open(compiled_key_path, 'r', encoding='utf8') as file_handle:
+        return file_handle.read().strip() or None
+
+
+def save_compiled_key(key: str) -> None:
+    """
+Keeps the key the compiled charts were drawn with, next to them. None for
+charts that can't be told apart, e.g. of a combined position file
+
+    :param key: key returned by compiled_key, or None
+    """
+    tmp_path = f'{compiled_key_path}.tmp'
+    with open(tmp_path, 'w', encoding='utf8') as file_handle:
+        file_handle.write(key or '')
+    os.replace(tmp_path, compiled_key_path)
+
+
+def render_saved_flight(file: str, airspace_files: tuple) -> None:
+    """
+Draws the charts of a flight from its saved result
+
+    :param file: flight file name, without extension
+    :param airspace_files: tuple of paths to the airspace files
+    """
+    registry = flight_registry(airspace_files)
+    result = load_result(file)
+
+    render_flight(file, result['metadata'], result['flight_data'],
+                  result['positions'], registry.airspace(ctr_name),
+                  registry.airspace(tma1_name), registry.airspace(tma2_name))
+
+
+def render_flights(files: list, airspace_files: tuple,
+                   workers: int = 1) -> list:
+    """
+Render stage: draws the charts of the flights from their saved results, in
+a pool of worker processes with more than one worker. The flights whose
+charts are newer than their result and the airspace files are skipped, and
+a flight that fails is reported without stopping the others
+
+    :param files: flight file names, without extension, with saved results
+    :param airspace_files: tuple of paths to the airspace files
+    :param workers: number of worker processes
+    :return: list of the flights drawn
+    """
+    stale = [file for file in files
+             if not up_to_date(flight_charts(file),
+                               [result_path(file), *airspace_files])]
+
+    if workers <= 1:
+        for file in stale:
+            try:
+                render_saved_flight(file, airspace_files)
+            except Exception as exception:
+                print(f'{file} - {exception!r}')
+
+        return stale
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(render_saved_flight, file, airspace_files)
+                   for file in stale]
+
+        for file, future in zip(stale, futures):
+            try:
+                future.result()
+            except Exception as exception:
+                print(f'{file} - {exception!r}')
+
+    return stale
+
+
+def render_compiled(success: int,
+                    overview: density_grid.DensityGrid,
+                    focused: density_grid.DensityGrid,
+                    ctr: airspaces.Airspace,
+                    tma1: airspaces.Airspace,
+                    tma2: airspaces.Airspace) -> None:
+    """
+Draws the chart of the density of the positions of all flights, as a raster
+under the airspaces, visualization/all_unfocused.svg and
+visualization/all.svg around the airspaces
+
+    :param success: number of flights analysed
+    :param overview: positions of all flights, wherever they are
+    :param focused: positions of all flights around the airspaces, over the
+           extent of visualization/all.svg
+    :param ctr: CTR Campinas
+    :param tma1: TMA São Paulo 1
+    :param tma2: TMA São Paulo 2
+    """
+    fig, ax = plt.subplots()
+    fig.set_size_inches(9, 9.5)
+    fig.subplots_adjust(wspace=0.01)
+    fig.subplots_adjust(top=0.9, bottom=0.1, left=0.1, right=0.9)
+    fig.suptitle(f'Compiled ({success} flights)', size=20)
+    # ax.set_axis_off()
+
+    # Visualization - Plot runway
+    ax.plot(sbkp_rwy_thr_xs, sbkp_thr_ys,
+            color='k', lw=2, zorder=5, alpha=0.5)
+    ax.plot(sbkp_rwy_thr_xs, sbkp_thr_ys,
+            color='w', lw=1.5, zorder=5, alpha=0.5)
+
+    # Visualization - Create patch for CTR Campinas
+    patch = patches.PathPatch(
+        Path(ctr.horizontal_limits, closed=True),
+        lw=0.5, linestyle='--', alpha=0.5
+    )
+    # Visualization - Create patch for TMA São Paulo 1
+    patch2 = patches.PathPatch(
+        Path(tma1.horizontal_limits, closed=True),
+        lw=0.5, linestyle='--', alpha=0.5
+    )
+    # Visualization - Create patch for TMA São Paulo 2
+    patch3 = patches.PathPatch(
+        Path(tma2.horizontal_limits, closed=True),
+        lw=0.5, linestyle='--', alpha=0.5
+    )
+    # Visualization - Create patch for CTR Campinas
+    patch4 = patches.PathPatch(
+        Path(ctr.horizontal_limits, closed=True),
+        lw=0.5, linestyle='--', alpha=0.5, edgecolor='black', facecolor='none',
+        zorder=10
+    )
+    # Visualization - Create patch for TMA São Paulo 1
+    patch5 = patches.PathPatch(
+        Path(tma1.horizontal_limits, closed=True),
+        lw=0.5, linestyle='--', alpha=0.5, edgecolor='black', facecolor='none',
+        zorder=10
+    )
+    # Visualization - Create patch for TMA São Paulo 2
+    patch6 = patches.PathPatch(
+        Path(tma2.horizontal_limits, closed=True),
+        lw=0.5, linestyle='--', alpha=0.5, edgecolor='black', facecolor='none',
+        zorder=10
+    )
+
+    # Visualization - Add created patches to chart
+    ax.add_patch(patch)
+    ax.add_patch(patch2)
+    ax.add_patch(patch3)
+    ax.add_patch(patch4)
+    ax.add_patch(patch5)
+    ax.add_patch(patch6)
+
+    # Visualization - Density of each category of positions, bottom first,
+    #                 each position as opaque as one of the markers of the
+    #                 flight charts
+    layers = [('non_tma', colors.to_rgb('#145c9e')),
+              ('on_tma1', colors.to_rgb('#ffc857')),
+              ('on_tma2', colors.to_rgb('#fe5f55')),
+              ('on_ctr', colors.to_rgb('#6b2737'))]
+
+    # Visualization - Limits of the positions and the airspaces, with the
+    #                 default margins, as the grid extends beyond them
+    xs = [x for airspace in [ctr, tma1, tma2]
+          for x, _ in airspace.horizontal_limits]
+    ys = [y for airspace in [ctr, tma1, tma2]
+          for _, y in airspace.horizontal_limits]
+    occupied = overview.occupied_extent()
+    if occupied is not None:
+        xs.extend(occupied[:2])
+        ys.extend(occupied[2:])
+    x_margin = (max(xs) - min(xs)) * 0.05
+    y_margin = (max(ys) - min(ys)) * 0.05
+
+    # Visualization - The overview grid on the unfocused chart and the finer
+    #                 focused grid on the chart around the airspaces
+    rasters = [ax.imshow(grid.image(layers, alpha=0.15), extent=grid.extent,
+                         origin='lower', interpolation='nearest',
+                         aspect='auto', zorder=2)
+               for grid in [overview, focused] if grid.extent is not None]
+
+    rasters[-1].set_visible(False)
+    ax.set_xlim(min(xs) - x_margin, max(xs) + x_margin)
+    ax.set_ylim(min(ys) - y_margin, max(ys) + y_margin)
+    fig.savefig(os.path.join('visualization/', 'all_unfocused.svg'),
+                format='svg')
+    rasters[0].set_visible(False)
+    rasters[-1].set_visible(True)
+    ax.set_xlim(-48, -45)
+    ax.set_ylim(-25, -22)
+    fig.savefig(os.path.join('visualization/', 'all.svg'), format='svg')
+    plt.close(fig)
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(
+        description='Computes the time each flight spent in the airspaces of '
+                    'Campinas'
+    )
+    arg_parser.add_argument('--output-format',
+                            choices=['legacy'] + output_sinks.output_formats,
+                            default='legacy',
+                            help='legacy writes the durations as text (xlsx). '
+                                 'The others write them as numeric seconds')
+    arg_parser.add_argument('--airspaces', nargs='+',
+                            default=['data/airspaces/sbkp.geojson'],
+                            metavar='FILE',
+                            help='GeoJSON or KML files with the airspaces, '
+                                 'which must include CTR Campinas and TMAs '
+                                 'São Paulo 1 and 2')
+    arg_parser.add_argument('--workers', type=int, default=1,
+                            help='number of worker processes, each analysing '
+                                 'or drawing one flight at a time')
+    arg_parser.add_argument('--no-render', action='store_true',
+                            help='only analyse the flights and write the '
+                                 'tables, without drawing the charts')
+    arg_parser.add_argument('--render-only', action='store_true',
+                            help='only draw the charts of the flights '
+                                 'analysed before, from their saved results')
+    arg_parser.add_argument('--catalog-only', action='store_true',
+                            help='only bring the catalog of the flights of '
+                                 'data/ops/ up to date')
+    arg_parser.add_argument('--ingest', metavar='FILE',
+                            help='analyse the flights of a combined position '
+                                 'file (see combined_tracks) instead of the '
+                                 'ones of data/ops/. Only the compiled charts '
+                                 'are drawn')
+    arg_parser.add_argument('--flight-column',
+                            default=combined_tracks.default_flight_column,
+                            help='column of the flight key of the combined '
+                                 'position file')
+    selection = arg_parser.add_argument_group(
+        'flight selection', 'flights of the catalog to process, all by default'
+    )
+    selection.add_argument('--company',
+                           help='part of the company name')
+    selection.add_argument('--departure', metavar='IATA',
+                           help='departure airport')
+    selection.add_argument('--arrival', metavar='IATA',
+                           help='arrival airport')
+    selection.add_argument('--registration',
+                           help='aircraft registration')
+    selection.add_argument('--since', type=datetime.datetime.fromisoformat,
+                           metavar='DATE',
+                           help='flights with positions from this time (ISO '
+                                'format, UTC without an offset) on')
+    selection.add_argument('--until', type=datetime.datetime.fromisoformat,
+                           metavar='DATE',
+                           help='flights with positions before this time '
+                                '(ISO format, UTC without an offset)')
+    args = arg_parser.parse_args()
+
+    if args.no_render and args.render_only:
+        arg_parser.error('--no-render and --render-only are exclusive')
+    if args.ingest is not None and (args.render_only or args.catalog_only):
+        arg_parser.error('--ingest excludes --render-only and --catalog-only')
+
+    # Flight information read from the .kml files on earlier runs
+    metadata_index = flight_metadata.MetadataIndex()
+
+    file_list = list()
+    if args.ingest is None:
+        # Flights of data/ops/, from the catalog brought up to date with it
+        catalog = flight_catalog.connect()
+        flight_catalog.refresh(catalog, metadata_index=metadata_index)
+        file_list = flight_catalog.select(
+            catalog, company=args.company, departure=args.departure,
+            arrival=args.arrival, registration=args.registration,
+            since=args.since, until=args.until
+        )
+        catalog.close()
+
+    if args.catalog_only:
+        metadata_index.save()
+        print(f'{len(file_list)} flights')
+        sys.exit()
+
+    # Airspaces, built once for the position checks
+    registry = flight_registry(tuple(args.airspaces))
+    ctr = registry.airspace(ctr_name)
+    tma2 = registry.airspace(tma2_name)
+    tma1 = registry.airspace(tma1_name)
+
+    if not os.path.isdir('visualization/'):
+        os.mkdir('visualization')
+
+    all_data = list()
+    # Entries into and exits from every airspace, of all flights
+    all_events = list()
+
+    # Visualization - Density of each category of positions of all flights
+    #                 but ground movement (not drawn), counted flight by
+    #                 flight: wherever they are on an adaptive grid, finer as
+    #                 it may only use part of it, and around the airspaces on
+    #                 cells about the size of a marker
+    overview = density_grid.DensityGrid(position_categories[1:], bins=1024)
+    focused = density_grid.DensityGrid(position_categories[1:], bins=256,
+                                       extent=(-48, -45, -25, -22))
+
+    # Flights analysed
+    analysed = list()
+
+    if args.render_only:
+        # Flights analysed before, from their saved results
+        results = ((file, load_result(file), None)
+                   for file in file_list
+                   if os.path.isfile(result_path(file)))
+    elif args.ingest is not None:
+        # Flights of the combined position file, as they're read
+        results = ingest_flights(args.ingest, tuple(args.airspaces),
+                                 args.workers, args.flight_column)
+    else:
+        results = process_flights(file_list, tuple(args.airspaces),
+                                  args.workers, metadata_index)
+
+    for file, result, error in results:
+        if result is None:
+            print(error)
+            continue
+
+        all_data.append(result['flight_data'])
+        all_events.extend(result['events'])
+        overview.add(result['positions'])
+        focused.add(result['positions'])
+
+        analysed.append(file)
+
+    metadata_index.save()
+
+    if not args.render_only:
+        write_rows('Dados VCP (2)', all_data, args.output_format)
+        write_rows('Eventos VCP (2)', all_events, args.output_format)
+
+    if not args.no_render:
+        if args.ingest is None:
+            render_flights(analysed, tuple(args.airspaces), args.workers)
+
+        compiled_charts = [os.path.join('visualization/', 'all_unfocused.svg'),
+                           os.path.join('visualization/', 'all.svg')]
+        key = compiled_key(analysed, tuple(args.airspaces))
+        if args.ingest is not None \
+                or compiled_saved_key() != key \
+                or not up_to_date(compiled_charts,
+                                  [result_path(file) for file in analysed]
+                                  + list(args.airspaces)):
+            render_compiled(len(analysed), overview, focused, ctr, tma1, tma2)
+            save_compiled_key(None if args.ingest is not None else key)
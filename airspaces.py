@@ -0,0 +1,472 @@
+"""
+Airspace volumes for the position checks of airspace_check.py
+
+Each airspace is built once: its polygon is prepared for repeated predicates
+and its bounding box is kept, so checking a position costs a vertical band
+check and a bounding box reject before any polygon test.
+
+Whole tracks are classified at once with array ray casting over the polygon
+edges, see AirspaceRegistry.classify_track, and their membership is
+run-length encoded into the crossings of each airspace, see crossings.
+
+Airspaces can be loaded from GeoJSON and KML files into an AirspaceRegistry,
+which indexes their bounding boxes in an STRtree so positions are only tested
+against the few candidate volumes around them. Each feature (GeoJSON) or
+Placemark (KML) is a Polygon or MultiPolygon with its name and its vertical
+limits in feet, as the properties (GeoJSON) or ExtendedData (KML) fields
+"name", "lower_limit" and "upper_limit".
+"""
+import functools
+import json
+import os
+
+import numpy as np
+from lxml import etree
+from shapely.geometry import Point, box
+from shapely.geometry.polygon import Polygon
+from shapely.prepared import prep
+from shapely.strtree import STRtree
+
+# Positions closer than this to an airspace boundary along their latitude, or
+# to the latitude of a vertex, in degrees, are checked with the prepared
+# polygon instead of ray casting
+boundary_tolerance = 1e-9
+
+# Positions classified at once, bounds the (positions x edges) arrays
+chunk_size = 1 << 14
+
+# Consecutive positions of a track looked up at once in the STRtree
+track_chunk_size = 512
+
+
+class Airspace:
+    """
+Airspace volume: horizontal limits between a lower and an upper limit
+    """
+    __slots__ = ('name', 'lower_limit', 'upper_limit', 'horizontal_limits',
+                 'polygon', 'prepared_polygon', 'bounds', 'edges')
+
+    def __init__(self,
+                 name: str,
+                 lower_limit: float,
+                 upper_limit: float,
+                 horizontal_limits: list,
+                 holes: list = None):
+        """
+    :param name: airspace name
+    :param lower_limit: lower vertical limit in feet (exclusive)
+    :param upper_limit: upper vertical limit in feet (inclusive)
+    :param horizontal_limits: list of (longitude, latitude) coordinates that
+           horizontally limits the airspace
+    :param holes: lists of (longitude, latitude) coordinates of the areas
+           excluded from the airspace, if any
+        """
+        self.name = name
+        self.lower_limit = lower_limit
+        self.upper_limit = upper_limit
+        self.horizontal_limits = horizontal_limits
+        self.polygon = Polygon(horizontal_limits, holes)
+        self.prepared_polygon = prep(self.polygon)
+        # (min longitude, min latitude, max longitude, max latitude)
+        self.bounds = self.polygon.bounds
+
+        # Edges of every ring for the ray casting: start longitude, start and
+        # end latitudes, longitude change per latitude (0 for the horizontal
+        # edges, never crossed) and sorted vertex latitudes
+        rings = [np.array(ring.coords) for ring
+                 in [self.polygon.exterior, *self.polygon.interiors]]
+        starts = np.concatenate([ring[:-1] for ring in rings])
+        ends = np.concatenate([ring[1:] for ring in rings])
+        dx = ends[:, 0] - starts[:, 0]
+        dy = ends[:, 1] - starts[:, 1]
+        self.edges = (starts[:, 0], starts[:, 1], ends[:, 1],
+                      np.divide(dx, dy, out=np.zeros_like(dx), where=dy != 0),
+                      np.sort(starts[:, 1]))
+
+    def contains(self, latitude: float, longitude: float,
+                 altitude: float) -> bool:
+        """
+Returns whether a position is contained within the airspace, its boundary
+included
+
+    :param latitude: latitude in decimal format
+    :param longitude: longitude in decimal format
+    :param altitude: altitude in feet
+    :return: True/False, whether the position is contained within the airspace
+             or not
+        """
+        if not self.lower_limit < altitude <= self.upper_limit:
+            return False
+
+        min_longitude, min_latitude, max_longitude, max_latitude = self.bounds
+        if not (min_longitude <= longitude <= max_longitude
+                and min_latitude <= latitude <= max_latitude):
+            return False
+
+        # Contained or on the boundary
+        return self.prepared_polygon.covers(Point(longitude, latitude))
+
+    def contains_points(self,
+                        latitudes: np.ndarray,
+                        longitudes: np.ndarray,
+                        altitudes: np.ndarray) -> np.ndarray:
+        """
+Returns whether each position is contained within the airspace, its
+boundary included. Same as contains, over arrays of positions
+
+    :param latitudes: latitudes in decimal format
+    :param longitudes: longitudes in decimal format
+    :param altitudes: altitudes in feet
+    :return: boolean array, True where the position is within the airspace
+        """
+        min_longitude, min_latitude, max_longitude, max_latitude = self.bounds
+
+        inside = (self.lower_limit < altitudes) \
+            & (altitudes <= self.upper_limit) \
+            & (min_longitude <= longitudes) & (longitudes <= max_longitude) \
+            & (min_latitude <= latitudes) & (latitudes <= max_latitude)
+
+        candidates = np.flatnonzero(inside)
+        for start in range(0, len(candidates), chunk_size):
+            chunk = candidates[start:start + chunk_size]
+            inside[chunk] = self.covers_points(latitudes[chunk],
+                                               longitudes[chunk])
+
+        return inside
+
+    def covers_points(self,
+                      latitudes: np.ndarray,
+                      longitudes: np.ndarray) -> np.ndarray:
+        """
+Returns whether each point is within the horizontal limits, boundary
+included, by casting a ray from each point across every edge
+
+    :param latitudes: latitudes in decimal format
+    :param longitudes: longitudes in decimal format
+    :return: boolean array, True where the point is within the limits
+        """
+        x1, y1, y2, inverse_slope, vertex_latitudes = self.edges
+        x = longitudes[:, np.newaxis]
+        y = latitudes[:, np.newaxis]
+
+        # Edges crossed by a ray towards increasing longitude, an odd count
+        # means the point is inside
+        straddles = (y1 > y) != (y2 > y)
+        distance = x - (x1 + (y - y1) * inverse_slope)
+        inside = np.count_nonzero(straddles & (distance < 0), axis=1) % 2 == 1
+
+        # Points next to an edge, or at the latitude of a vertex, are left to
+        # the prepared polygon
+        near = (straddles & (np.abs(distance) <= boundary_tolerance)).any(axis=1)
+        index = np.searchsorted(vertex_latitudes, latitudes)
+        near |= np.abs(
+            latitudes - vertex_latitudes[np.clip(index, 0,
+                                                 len(vertex_latitudes) - 1)]
+        ) <= boundary_tolerance
+        near |= np.abs(
+            latitudes - vertex_latitudes[np.clip(index - 1, 0,
+                                                 len(vertex_latitudes) - 1)]
+        ) <= boundary_tolerance
+
+        for point in np.flatnonzero(near):
+            inside[point] = self.prepared_polygon.covers(
+                Point(longitudes[point], latitudes[point])
+            )
+
+        return inside
+
+
+def crossings(membership: np.ndarray) -> tuple:
+    """
+Run-length encodes the membership of a track: every run of consecutive
+positions inside each airspace, in one pass over the positions
+
+    :param membership: boolean array (positions x airspaces), as returned by
+           AirspaceRegistry.classify_track
+    :return: (airspace column, first position, last position) integer
+             arrays, one element per run, by airspace and then by position
+    """
+    membership = np.asarray(membership, dtype=np.int8)
+    boundary = np.zeros((1, membership.shape[1]), dtype=np.int8)
+
+    # +1 where a run starts, -1 right after it ends
+    changes = np.diff(np.concatenate([boundary, membership, boundary]),
+                      axis=0).T
+    columns, starts = np.nonzero(changes == 1)
+    ends = np.nonzero(changes == -1)[1] - 1
+
+    return columns, starts, ends
+
+
+@functools.lru_cache(maxsize=None)
+def cached_airspace(lower_limit: float,
+                    upper_limit: float,
+                    horizontal_limits: tuple) -> Airspace:
+    """
+Returns the airspace built from its limits, building it only on the first
+call with them
+
+    :param lower_limit: lower vertical limit in feet
+    :param upper_limit: upper vertical limit in feet
+    :param horizontal_limits: tuple of (longitude, latitude) coordinates
+    :return: airspace
+    """
+    return Airspace('', lower_limit, upper_limit, list(horizontal_limits))
+
+
+def geojson_polygons(geometry: dict) -> list:
+    """
+Returns the polygons of a GeoJSON geometry
+
+    :param geometry: GeoJSON Polygon or MultiPolygon
+    :return: list of (exterior, holes), lists of (longitude, latitude)
+    """
+    if geometry['type'] == 'Polygon':
+        polygons = [geometry['coordinates']]
+    elif geometry['type'] == 'MultiPolygon':
+        polygons = geometry['coordinates']
+    else:
+        raise ValueError(f'Unsupported airspace geometry: {geometry["type"]}')
+
+    return [([tuple(point[:2]) for point in rings[0]],
+             [[tuple(point[:2]) for point in ring] for ring in rings[1:]])
+            for rings in polygons]
+
+
+def load_geojson(filepath: str) -> list:
+    """
+Loads the airspaces of a GeoJSON FeatureCollection
+
+    :param filepath: path to the .geojson file
+    :return: list of Airspace, one per polygon
+    """
+    with open(filepath, 'r', encoding='utf8') as file_handle:
+        collection = json.load(file_handle)
+
+    airspace_list = list()
+    for feature in collection['features']:
+        properties = feature['properties']
+        for exterior, holes in geojson_polygons(feature['geometry']):
+            airspace_list.append(Airspace(properties['name'],
+                                          float(properties['lower_limit']),
+                                          float(properties['upper_limit']),
+                                          exterior, holes))
+
+    return airspace_list
+
+
+def kml_coordinates(text: str) -> list:
+    """
+Parses the content of a KML coordinates element
+
+    :param text: "longitude,latitude[,altitude] ..." tuples
+    :return: list of (longitude, latitude)
+    """
+    return [tuple(float(value) for value in point.split(',')[:2])
+            for point in text.split()]
+
+
+def load_kml(filepath: str) -> list:
+    """
+Loads the airspaces of the Placemarks of a KML file
+
+    :param filepath: path to the .kml file
+    :return: list of Airspace, one per polygon
+    """
+    tree = etree.parse(filepath)
+
+    def children(element, name: str) -> list:
+        return element.xpath(f'.//*[local-name()="{name}"]')
+
+    airspace_list = list()
+    for placemark in children(tree.getroot(), 'Placemark'):
+        fields = {data.get('name'): data.xpath('string(.)').strip()
+                  for data in children(placemark, 'Data')
+                  + children(placemark, 'SimpleData')}
+        names = placemark.xpath('./*[local-name()="name"]/text()')
+        name = fields.get('name', names[0].strip() if names else '')
+
+        if 'lower_limit' not in fields or 'upper_limit' not in fields:
+            raise ValueError(f'No vertical limits for {name} in {filepath}')
+
+        for polygon in children(placemark, 'Polygon'):
+            exterior = children(children(polygon, 'outerBoundaryIs')[0],
+                                'coordinates')[0].text
+            holes = [children(ring, 'coordinates')[0].text
+                     for ring in children(polygon, 'innerBoundaryIs')]
+            airspace_list.append(Airspace(
+                name, float(fields['lower_limit']),
+                float(fields['upper_limit']), kml_coordinates(exterior),
+                [kml_coordinates(hole) for hole in holes]
+            ))
+
+    return airspace_list
+
+
+def load_airspaces(filepaths: list) -> list:
+    """
+Loads the airspaces of GeoJSON (.geojson, .json) and KML (.kml) files
+
+    :param filepaths: paths to the files
+    :return: list of Airspace, in file order
+    """
+    airspace_list = list()
+    for filepath in filepaths:
+        extension = os.path.splitext(filepath)[1].lower()
+        if extension in {'.geojson', '.json'}:
+            airspace_list.extend(load_geojson(filepath))
+        elif extension == '.kml':
+            airspace_list.extend(load_kml(filepath))
+        else:
+            raise ValueError(f'Unknown airspace file format: {filepath}')
+
+    return airspace_list
+
+
+class AirspaceRegistry:
+    """
+Airspaces indexed by name and, spatially, by their bounding boxes
+    """
+    __slots__ = ('airspaces', 'names', 'tree', 'tree_index')
+
+    def __init__(self, airspace_list: list):
+        """
+    :param airspace_list: list of Airspace. Airspaces sharing a name, such
+           as the parts of a MultiPolygon, are one volume
+        """
+        self.airspaces = list(airspace_list)
+        self.names = dict()
+        for index, airspace in enumerate(self.airspaces):
+            self.names.setdefault(airspace.name, list()).append(index)
+
+        polygons = [airspace.polygon for airspace in self.airspaces]
+        self.tree = STRtree(polygons) if polygons else None
+        # Shapely < 2 returns the geometries from the queries, not indexes
+        self.tree_index = {id(polygon): index
+                           for index, polygon in enumerate(polygons)}
+
+    @classmethod
+    def from_files(cls, filepaths: list) -> 'AirspaceRegistry':
+        """
+Builds a registry from GeoJSON and KML files, see load_airspaces
+        """
+        return cls(load_airspaces(filepaths))
+
+    def __len__(self) -> int:
+        return len(self.airspaces)
+
+    def indexes(self, name: str) -> list:
+        """
+Returns the indexes of the parts of an airspace
+
+    :param name: airspace name
+    :return: list of indexes in airspaces
+        """
+        if name not in self.names:
+            raise KeyError(f'Airspace not found: {name}')
+
+        return self.names[name]
+
+    def airspace(self, name: str) -> Airspace:
+        """
+Returns an airspace by name, which must have a single part
+        """
+        indexes = self.indexes(name)
+        if len(indexes) > 1:
+            raise ValueError(f'Airspace {name} has {len(indexes)} parts')
+
+        return self.airspaces[indexes[0]]
+
+    def candidates(self, geometry) -> list:
+        """
+Returns the airspaces whose bounding box intersects a geometry
+
+    :param geometry: shapely geometry
+    :return: sorted list of indexes in airspaces
+        """
+        if self.tree is None:
+            return list()
+
+        return sorted(
+            int(found) if isinstance(found, (int, np.integer))
+            else self.tree_index[id(found)]
+            for found in self.tree.query(geometry)
+        )
+
+    def airspaces_at(self, latitude: float, longitude: float,
+                     altitude: float) -> list:
+        """
+Returns the airspaces containing a position
+
+    :param latitude: latitude in decimal format
+    :param longitude: longitude in decimal format
+    :param altitude: altitude in feet
+    :return: list of Airspace
+        """
+        return [self.airspaces[index] for index
+                in self.candidates(Point(longitude, latitude))
+                if self.airspaces[index].contains(latitude, longitude,
+                                                  altitude)]
+
+    def classify_track(self,
+                       latitudes: np.ndarray,
+                       longitudes: np.ndarray,
+                       altitudes: np.ndarray) -> np.ndarray:
+        """
+Classifies every position of a track against the airspaces. Each run of
+consecutive positions is only tested against the airspaces around it
+
+    :param latitudes: latitudes in decimal format
+    :param longitudes: longitudes in decimal format
+    :param altitudes: altitudes in feet
+    :return: boolean array (positions x airspaces), True where the position
+             is within the airspace
+        """
+        latitudes = np.asarray(latitudes, dtype=float)
+        longitudes = np.asarray(longitudes, dtype=float)
+        altitudes = np.asarray(altitudes, dtype=float)
+
+        membership = np.zeros((len(latitudes), len(self.airspaces)),
+                              dtype=bool)
+        for start in range(0, len(latitudes), track_chunk_size):
+            chunk = slice(start, start + track_chunk_size)
+            envelope = box(np.nanmin(longitudes[chunk]),
+                           np.nanmin(latitudes[chunk]),
+                           np.nanmax(longitudes[chunk]),
+                           np.nanmax(latitudes[chunk]))
+
+            for index in self.candidates(envelope):
+                membership[chunk, index] = \
+                    self.airspaces[index].contains_points(latitudes[chunk],
+                                                          longitudes[chunk],
+                                                          altitudes[chunk])
+
+        return membership
+
+    def mask(self, membership: np.ndarray, name: str) -> np.ndarray:
+        """
+Returns where the positions are within an airspace, any of its parts
+
+    :param membership: array returned by classify_track
+    :param name: airspace name
+    :return: boolean array
+        """
+        return membership[:, self.indexes(name)].any(axis=1)
+
+    def crossings(self, membership: np.ndarray) -> dict:
+        """
+Returns the runs of consecutive positions inside each airspace, the parts
+of an airspace joined
+
+    :param membership: array returned by classify_track
+    :return: dict of airspace name: (first positions, last positions) of its
+             runs, integer arrays in position order
+        """
+        named = np.zeros((len(membership), len(self.names)), dtype=bool)
+        for column, name in enumerate(self.names):
+            named[:, column] = self.mask(membership, name)
+
+        columns, starts, ends = crossings(named)
+
+        return {name: (starts[columns == column], ends[columns == column])
+                for column, name in enumerate(self.names)}
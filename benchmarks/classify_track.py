@@ -0,0 +1,152 @@
+"""
+Per-flight cost of the airspace classification of airspace_check.py: the
+six filter passes over the track, point by point, against a single
+AirspaceRegistry.classify_track call, and check that both give the same
+lists
+
+Run from the repository root:
+    python -m benchmarks.classify_track [--flights N] [--points N]
+"""
+import argparse
+import random
+import sys
+import time
+
+import numpy as np
+
+import airspaces
+from benchmarks.point_in_airspace import polygon_coords
+
+
+def synthetic_track(points: int, vertices: list) -> list:
+    """
+Random climbing, cruising and descending track around SBKP, as the rows of
+airspace_check.py ([2] index, [3] [lat, lon], [4] altitude), with some
+positions on the airspace vertices
+    """
+    latitude, longitude, altitude = -23.0, -47.13, 0.0
+    cruise_altitude = random.uniform(10000, 35000)
+    track = list()
+    for index in range(points):
+        latitude += random.uniform(-0.02, 0.02)
+        longitude += random.uniform(-0.02, 0.02)
+        if index < points // 3:
+            altitude = min(cruise_altitude, altitude + random.uniform(0, 300))
+        elif index > 2 * points // 3:
+            altitude = max(0.0, altitude - random.uniform(0, 300))
+
+        if random.random() < 0.01:
+            longitude, latitude = random.choice(vertices)
+
+        track.append([None, None, index, [latitude, longitude],
+                      altitude if index > 10 else 0.0, 250.0])
+
+    return track
+
+
+def filter_passes(data: list, tma1, tma2, ctr) -> tuple:
+    """
+Classification as airspace_check.py did it, six passes point by point
+    """
+    non_tma = list(filter(lambda x: x[4] != 0, data))
+    non_tma = list(filter(lambda x: not tma1.contains(x[3][0], x[3][1], x[4]),
+                          non_tma))
+    non_tma = list(filter(lambda x: not tma2.contains(x[3][0], x[3][1], x[4]),
+                          non_tma))
+    non_tma = list(filter(lambda x: not ctr.contains(x[3][0], x[3][1], x[4]),
+                          non_tma))
+    on_tma1 = list(filter(lambda x: tma1.contains(x[3][0], x[3][1], x[4]),
+                          data))
+    on_tma2 = list(filter(lambda x: tma2.contains(x[3][0], x[3][1], x[4]),
+                          data))
+    on_ctr = list(filter(lambda x: ctr.contains(x[3][0], x[3][1], x[4]),
+                         data))
+
+    return non_tma, on_tma1, on_tma2, on_ctr
+
+
+def track_arrays(data: list) -> tuple:
+    """
+Latitude, longitude and altitude arrays of the rows of the track
+    """
+    return (np.fromiter((x[3][0] for x in data), dtype=float, count=len(data)),
+            np.fromiter((x[3][1] for x in data), dtype=float, count=len(data)),
+            np.fromiter((x[4] for x in data), dtype=float, count=len(data)))
+
+
+def classified(data: list, arrays: tuple,
+               registry: airspaces.AirspaceRegistry) -> tuple:
+    """
+Classification as airspace_check.py does it, one classify_track call of the
+registry and the lists derived by masking
+    """
+    latitudes, longitudes, altitudes = arrays
+    membership = registry.classify_track(latitudes, longitudes, altitudes)
+    masks = [registry.mask(membership, name)
+             for name in ['TMA 1', 'TMA 2', 'CTR']]
+
+    non_tma = [data[i] for i in np.flatnonzero((altitudes != 0)
+                                               & ~(masks[0] | masks[1]
+                                                   | masks[2]))]
+
+    return (non_tma,
+            *[[data[i] for i in np.flatnonzero(mask)] for mask in masks])
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--flights', type=int, default=50)
+    arg_parser.add_argument('--points', type=int, default=2000,
+                            help='positions per flight')
+    args = arg_parser.parse_args()
+
+    random.seed(0)
+
+    # Vertices and vertical limits like TMA São Paulo 1 and 2 and CTR Campinas
+    tma1 = airspaces.Airspace('TMA 1', 5500, 24500, polygon_coords(15, 1.2))
+    tma2 = airspaces.Airspace('TMA 2', 3600, 5500, polygon_coords(36, 0.6))
+    ctr = airspaces.Airspace('CTR', 0, 3700, polygon_coords(6, 0.2))
+    registry = airspaces.AirspaceRegistry([tma1, tma2, ctr])
+    vertices = tma1.horizontal_limits + tma2.horizontal_limits \
+        + ctr.horizontal_limits
+
+    flights = [synthetic_track(args.points, vertices)
+               for _ in range(args.flights)]
+
+    timings = dict()
+
+    start = time.perf_counter()
+    reference = [filter_passes(data, tma1, tma2, ctr) for data in flights]
+    timings['filter passes'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    arrays = [track_arrays(data) for data in flights]
+    timings['track arrays'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for latitudes, longitudes, altitudes in arrays:
+        registry.classify_track(latitudes, longitudes, altitudes)
+    timings['classify_track'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    results = [classified(data, flight_arrays, registry)
+               for data, flight_arrays in zip(flights, arrays)]
+    timings['+ lists'] = time.perf_counter() - start
+
+    for name, timing in timings.items():
+        print(f'{name:15} {timing:7.3f} s '
+              f'{timing / args.flights * 1e3:8.2f} ms/flight')
+
+    mismatches = sum(
+        [row[2] for row in list1] != [row[2] for row in list2]
+        for lists1, lists2 in zip(reference, results)
+        for list1, list2 in zip(lists1, lists2)
+    )
+
+    print(f'speedup         '
+          f'{timings["filter passes"] / timings["classify_track"]:.1f}x '
+          f'(classification), '
+          f'{timings["filter passes"] / (timings["track arrays"] + timings["+ lists"]):.1f}x '
+          f'(with arrays and lists)')
+    print(f'mismatches      {mismatches}')
+    sys.exit(1 if mismatches else 0)
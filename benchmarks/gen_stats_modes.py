@@ -0,0 +1,102 @@
+"""
+Times of the default, --stream and --workers modes of gen_stats.py on a
+synthetic archive with a missing day and a missing month, and check that
+they all give the same daily and monthly statistics, with and without a
+maximum validity
+
+Run from the repository root:
+    python -m benchmarks.gen_stats_modes [--years N] [--workers N]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+import gen_stats
+import metar_store
+from benchmarks import synthetic
+
+# Timetag prefixes of the reports left out of the archive
+missing = ['20090105', '200903']
+
+
+def default_stats(filepath: str, max_validity: int):
+    """
+Hourly statistics of the default mode, over the date range of the data
+    """
+    obs = metar_store.parse_archive(filepath)
+
+    return gen_stats.compute_hourly_stats(obs, *gen_stats.date_range(obs),
+                                          max_validity)
+
+
+def stream_tables(filepath: str, max_validity: int) -> tuple:
+    """
+Daily and monthly statistics of the --stream mode, as daily() and monthly()
+    """
+    tables = {'day': ([], []), 'month': ([], [])}
+    for period, key, seconds in gen_stats.stream_stats(
+            metar_store.iter_archive(filepath), max_validity):
+        tables[period][0].append(key)
+        tables[period][1].append(seconds)
+
+    return tuple((keys, np.array(seconds))
+                 for keys, seconds in (tables['day'], tables['month']))
+
+
+def same_tables(tables1: tuple, tables2: tuple) -> bool:
+    return all(keys1 == keys2 and np.array_equal(seconds1, seconds2)
+               for (keys1, seconds1), (keys2, seconds2)
+               in zip(tables1, tables2))
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--years', type=int, default=1,
+                            help='years of hourly reports')
+    arg_parser.add_argument('--workers', type=int, default=2,
+                            help='worker processes of the --workers mode')
+    args = arg_parser.parse_args()
+
+    mismatches = 0
+    with tempfile.TemporaryDirectory() as directory:
+        filepath = os.path.join(directory, 'sbkp.txt')
+        with open(filepath, 'w', encoding='utf8') as file_handle:
+            file_handle.writelines(
+                line for line in synthetic.metar_archive(args.years)
+                if not any(line.startswith(prefix) for prefix in missing)
+            )
+
+        for max_validity in [None, 90]:
+            modes = [
+                ('default', lambda: default_stats(filepath, max_validity)),
+                ('workers', lambda: gen_stats.compute_hourly_stats_parallel(
+                    filepath, args.workers, max_validity=max_validity)),
+            ]
+
+            results = dict()
+            for name, compute in modes:
+                # The columns cached by a previous mode aren't reused
+                cached = metar_store.cache_path(filepath)
+                if os.path.isfile(cached):
+                    os.remove(cached)
+
+                start = time.perf_counter()
+                hourly_stats = compute()
+                results[name] = (hourly_stats.daily(), hourly_stats.monthly())
+                print(f'max validity {max_validity!s:5} {name:8} '
+                      f'{time.perf_counter() - start:7.3f} s')
+
+            start = time.perf_counter()
+            results['stream'] = stream_tables(filepath, max_validity)
+            print(f'max validity {max_validity!s:5} {"stream":8} '
+                  f'{time.perf_counter() - start:7.3f} s')
+
+            mismatches += sum(not same_tables(results['default'], tables)
+                              for tables in results.values())
+
+    print(f'mismatches         {mismatches}')
+    sys.exit(1 if mismatches else 0)
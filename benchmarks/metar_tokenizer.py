@@ -0,0 +1,100 @@
+"""
+Throughput of the fast-path METAR tokenizer against Metar.Metar on the REDEMET
+archives, and differential check of the fields both extract
+
+Run from the repository root:
+    python -m benchmarks.metar_tokenizer
+"""
+import math
+import os
+import re
+import sys
+import time
+
+from metar import Metar
+
+import metar_store
+import metar_tokenizer
+
+redemet_dir = 'data/REDEMET/'
+
+
+def read_reports() -> list:
+    """
+Reads the reports of the REDEMET archives
+
+    :return: list of (raw_metar, month, year)
+    """
+    reports = list()
+    for file in sorted(os.listdir(redemet_dir)):
+        with open(os.path.join(redemet_dir, file), 'r',
+                  encoding='utf8') as file_handle:
+            for line in file_handle:
+                line = line.strip('\ufeff')
+                raw_metar = re.sub(r'\b([A-Z]{4}) COR ', r'\1 ',
+                                   line[13:].strip())
+
+                if '/////CB' not in raw_metar:
+                    reports.append(
+                        (raw_metar, int(line[4:6]), int(line[:4]))
+                    )
+
+    return reports
+
+
+def metar_fields(raw_metar: str, month: int, year: int):
+    parsed_obs = Metar.Metar(raw_metar, month=month, year=year, strict=False)
+    if parsed_obs.time is None:
+        return None
+
+    return (parsed_obs.time.minute, *metar_store.extract_fields(parsed_obs))
+
+
+def tokenizer_fields(raw_metar: str, month: int, year: int):
+    fields = metar_tokenizer.tokenize(raw_metar)
+    if fields is None:
+        return metar_fields(raw_metar, month, year)
+
+    return fields
+
+
+def same_fields(fields1, fields2) -> bool:
+    if fields1 is None or fields2 is None:
+        return fields1 is fields2
+
+    return all(
+        value1 == value2 or (math.isnan(value1) and math.isnan(value2))
+        for value1, value2 in zip(fields1, fields2)
+    )
+
+
+if __name__ == '__main__':
+    reports = read_reports()
+
+    timings = dict()
+    results = dict()
+    for name, function in [('Metar.Metar', metar_fields),
+                           ('tokenizer', tokenizer_fields)]:
+        start = time.perf_counter()
+        results[name] = [function(*report) for report in reports]
+        timings[name] = time.perf_counter() - start
+
+        print(f'{name:12} {timings[name]:7.3f} s '
+              f'{len(reports) / timings[name]:10.0f} reports/s')
+
+    fast_path = sum(metar_tokenizer.tokenize(report[0]) is not None
+                    for report in reports)
+    print(f'speedup      {timings["Metar.Metar"] / timings["tokenizer"]:.1f}x')
+    print(f'fast path    {fast_path}/{len(reports)} reports')
+
+    # Differential check, both must extract the same fields
+    mismatches = [
+        report[0] for report, fields1, fields2
+        in zip(reports, results['Metar.Metar'], results['tokenizer'])
+        if not same_fields(fields1, fields2)
+    ]
+    for raw_metar in mismatches[:10]:
+        print(f'mismatch: {raw_metar}')
+
+    print(f'mismatches   {len(mismatches)}')
+    sys.exit(1 if mismatches else 0)
@@ -0,0 +1,144 @@
+"""
+Write and reload times of the output sinks against the legacy pandas xlsx
+tables, on a synthetic table of daily statistics (as gen_stats.py) and one of
+flights (as airspace_check.py)
+
+Run from the repository root:
+    python -m benchmarks.output_sinks [--rows N]
+"""
+import argparse
+import datetime
+import os
+import random
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+import gen_stats
+import output_sinks
+import stats_store
+from stats_store import HourlyStats
+
+
+def synthetic_stats(days: int) -> HourlyStats:
+    """
+Random hourly statistics of a range of days
+    """
+    rng = np.random.default_rng(0)
+
+    return HourlyStats(
+        datetime.datetime(2000, 1, 1),
+        rng.integers(0, 3600, size=(days, 24, len(stats_store.metrics)))
+    )
+
+
+def synthetic_flights(flights: int) -> list:
+    """
+Random rows with the types returned by airspace_check.get_flight_time:
+datetimes, timedeltas and coordinates
+    """
+    random.seed(0)
+
+    rows = list()
+    for flight in range(flights):
+        takeoff = datetime.datetime(2022, 1, 1) \
+            + datetime.timedelta(seconds=random.randrange(10 ** 7))
+        row = {'code': f'AZU{flight % 10000:04}',
+               'departure_iata': 'VCP',
+               'arrival_iata': 'SDU'}
+        for name in ['takeoff', 'level_off', 'descent_init', 'touchdown']:
+            row[f'{name}_time'] = takeoff \
+                + datetime.timedelta(seconds=random.randrange(7200))
+            row[f'{name}_time_error'] = \
+                datetime.timedelta(seconds=random.randrange(60))
+            row[f'{name}_coords'] = [random.uniform(-24, -22),
+                                     random.uniform(-48, -46)]
+        for name in ['recorded_time', 'flight_time', 'inside_tma_sao_paulo1',
+                     'inside_tma_sao_paulo2', 'inside_ctr_campinas']:
+            row[name] = datetime.timedelta(seconds=random.randrange(7200))
+            row[f'{name}_error'] = \
+                datetime.timedelta(seconds=random.randrange(60))
+        rows.append(row)
+
+    return rows
+
+
+def write_legacy_flights(flights: list, filepath: str) -> None:
+    """
+Writes the flights as airspace_check.py does by default
+    """
+    rows = list()
+    for flight in flights:
+        rows.append({key: str(value)
+                     if isinstance(value, datetime.timedelta) else value
+                     for key, value in flight.items()})
+
+    pd.DataFrame(rows).to_excel(f'{filepath}.xlsx')
+
+
+def write_sink_flights(flights: list, filepath: str,
+                       output_format: str) -> None:
+    """
+Writes the flights as airspace_check.py does with --output-format
+    """
+    columns = list(flights[0])
+    output_sinks.write_table(
+        filepath, columns,
+        ([flight.get(key) for key in columns] for flight in flights),
+        output_format
+    )
+
+
+def read_table(filepath: str):
+    if filepath.endswith('.csv'):
+        return pd.read_csv(filepath)
+    if filepath.endswith('.parquet'):
+        return pd.read_parquet(filepath)
+
+    return pd.read_excel(filepath)
+
+
+def timed(function, *args) -> float:
+    start = time.perf_counter()
+    function(*args)
+
+    return time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--rows', type=int, default=20000,
+                            help='rows of each synthetic table')
+    args = arg_parser.parse_args()
+
+    hourly_stats = synthetic_stats(args.rows)
+    flights = synthetic_flights(args.rows)
+
+    with tempfile.TemporaryDirectory() as directory:
+        for table, write in [
+                ('stats', lambda fmt, path: gen_stats.write_stats(
+                    hourly_stats, path, os.path.join(directory, 'monthly'),
+                    fmt)),
+                ('flights', lambda fmt, path:
+                    write_legacy_flights(flights, path) if fmt == 'legacy'
+                    else write_sink_flights(flights, path, fmt))]:
+            for output_format in ['legacy'] + output_sinks.output_formats:
+                filepath = os.path.join(directory, f'{table}-{output_format}')
+                extension = output_sinks.extensions.get(output_format, '.xlsx')
+
+                try:
+                    write_time = timed(write, output_format, filepath)
+                except ImportError as error:
+                    print(f'{table:8} {output_format:8} skipped: '
+                          f'{str(error).splitlines()[0]}')
+                    continue
+
+                read_time = timed(read_table, f'{filepath}{extension}')
+                size = os.path.getsize(f'{filepath}{extension}')
+
+                print(f'{table:8} {output_format:8} '
+                      f'write {write_time:7.3f} s  '
+                      f'read {read_time:7.3f} s  '
+                      f'{size / 1e6:7.2f} MB')
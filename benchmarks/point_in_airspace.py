@@ -0,0 +1,115 @@
+"""
+Per-point cost of the airspace check: building a Polygon on every call (the
+previous point_in_airspace) against the prepared, cached airspaces, and check
+that both give the same result
+
+Run from the repository root:
+    python -m benchmarks.point_in_airspace [--points N]
+"""
+import argparse
+import math
+import random
+import sys
+import time
+
+from shapely.geometry import Point
+from shapely.geometry.polygon import Polygon
+
+import airspaces
+
+
+def polygon_coords(vertices: int, radius: float) -> list:
+    """
+Closed polygon around SBKP with the given number of vertices, as a list of
+(longitude, latitude)
+    """
+    coords = [(-47.13 + radius * math.cos(2 * math.pi * vertex / vertices),
+               -23.0 + radius * 0.8 * math.sin(2 * math.pi * vertex / vertices))
+              for vertex in range(vertices)]
+
+    return coords + [coords[0]]
+
+
+def polygon_point_in_airspace(position_coords, position_alt, lower_limit,
+                              upper_limit, horizontal_limits) -> bool:
+    """
+point_in_airspace before the airspaces were prepared and cached
+    """
+    horizontal_limits = Polygon(horizontal_limits)
+    point = Point(position_coords[1], position_coords[0])
+
+    return (horizontal_limits.contains(point)
+            or horizontal_limits.touches(point)) \
+        and lower_limit < position_alt <= upper_limit
+
+
+def cached_point_in_airspace(position_coords, position_alt, lower_limit,
+                             upper_limit, horizontal_limits) -> bool:
+    """
+point_in_airspace of airspace_check.py
+    """
+    airspace = airspaces.cached_airspace(
+        lower_limit, upper_limit, tuple(map(tuple, horizontal_limits))
+    )
+
+    return airspace.contains(position_coords[0], position_coords[1],
+                             position_alt)
+
+
+def random_positions(points: int, coords: list) -> list:
+    """
+Random positions around the airspaces, plus their vertices
+    """
+    random.seed(0)
+
+    positions = [([random.uniform(-24.0, -22.0), random.uniform(-48.5, -45.5)],
+                  random.uniform(0, 30000)) for _ in range(points)]
+    positions += [([latitude, longitude], 3000)
+                  for longitude, latitude in coords]
+
+    return positions
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--points', type=int, default=20000,
+                            help='number of random positions')
+    args = arg_parser.parse_args()
+
+    # Vertices and vertical limits like CTR Campinas, TMA São Paulo 2 and 1
+    limits = [(0, 3700, polygon_coords(6, 0.2)),
+              (3600, 5500, polygon_coords(36, 0.6)),
+              (5500, 24500, polygon_coords(15, 1.2))]
+    positions = random_positions(args.points,
+                                 [vertex for limit in limits
+                                  for vertex in limit[2]])
+    prepared = [airspaces.Airspace('', *limit) for limit in limits]
+
+    results = dict()
+    timings = dict()
+    for name, check in [
+            ('polygon per call', lambda position, index:
+                polygon_point_in_airspace(*position, *limits[index])),
+            ('cached', lambda position, index:
+                cached_point_in_airspace(*position, *limits[index])),
+            ('Airspace.contains', lambda position, index:
+                prepared[index].contains(position[0][0], position[0][1],
+                                         position[1]))]:
+        start = time.perf_counter()
+        results[name] = [check(position, index) for position in positions
+                         for index in range(len(limits))]
+        timings[name] = time.perf_counter() - start
+
+        checks = len(positions) * len(limits)
+        print(f'{name:18} {timings[name]:7.3f} s '
+              f'{timings[name] / checks * 1e6:8.2f} us/check')
+
+    reference = results['polygon per call']
+    mismatches = sum(result != expected
+                     for name in results if name != 'polygon per call'
+                     for result, expected in zip(results[name], reference))
+
+    print(f'speedup            '
+          f'{timings["polygon per call"] / timings["Airspace.contains"]:.1f}x')
+    print(f'mismatches         {mismatches}')
+    sys.exit(1 if mismatches else 0)
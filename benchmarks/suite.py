@@ -0,0 +1,282 @@
+"""
+Reproducible benchmarks of gen_stats.py and airspace_check.py on synthetic
+inputs of 10^3 to 10^6 items, see benchmarks.synthetic, written to JSON to
+compare runs across commits:
+    - check_ops: every procedure against parsed METAR reports
+    - point_in_airspace: random positions against the three airspaces
+    - get_flight_time: flights of 1000 positions, already classified
+    - gen_stats: the whole script on an archive of that many reports
+    - airspace_check: the whole script, without charts, on flights of 1000
+      positions totalling that many positions
+The inputs are generated and prepared before the timed part, and the scripts
+run in a scratch directory with empty caches
+
+Run from the repository root:
+    python -m benchmarks.suite [--scales N ...] [--only NAME ...]
+        [--repeat N] [--seed N] [--output FILE] [--compare FILE] [--render]
+"""
+import argparse
+import datetime
+import itertools
+import json
+import math
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+from metar import Metar
+
+import airspace_check
+import gen_stats
+import tracks
+from benchmarks import synthetic
+
+repository_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+airspace_file = os.path.join(repository_dir, 'data/airspaces/sbkp.geojson')
+
+# Positions of each flight of get_flight_time and airspace_check
+flight_points = 1000
+
+benchmark_names = ['check_ops', 'point_in_airspace', 'get_flight_time',
+                   'gen_stats', 'airspace_check']
+
+
+def commit() -> str:
+    """
+Commit checked out in the repository, None outside git
+    """
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'],
+                              cwd=repository_dir, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def archive_lines(reports: int, seed: int) -> list:
+    """
+First lines of a synthetic archive, one report an hour
+    """
+    years = math.ceil(reports / (365 * 24)) + 1
+
+    return list(itertools.islice(synthetic.metar_archive(years, seed=seed),
+                                 reports))
+
+
+def flight_tracks(positions: int, seed: int) -> list:
+    """
+Synthetic flights of flight_points positions, at least one
+    """
+    flights = list()
+    for index in range(max(1, positions // flight_points)):
+        callsign, _, _, rows = synthetic.flight(index, flight_points, seed)
+        columns = list(zip(*rows))
+        flights.append(tracks.Track(*columns, callsign=callsign))
+
+    return flights
+
+
+def time_check_ops(scale: int, seed: int) -> float:
+    lines = archive_lines(scale, seed)
+    metars = [Metar.Metar(line[13:].strip().rstrip('='),
+                          month=int(line[4:6]), year=int(line[:4]),
+                          strict=False)
+              for line in lines if '/////CB' not in line]
+
+    start = time.perf_counter()
+    for metar in metars:
+        for op in gen_stats.procs:
+            gen_stats.check_ops(op, metar)
+
+    return time.perf_counter() - start
+
+
+def time_point_in_airspace(scale: int, seed: int) -> float:
+    registry = airspace_check.flight_registry((airspace_file,))
+    limits = [(airspace.lower_limit, airspace.upper_limit,
+               airspace.horizontal_limits)
+              for airspace in [registry.airspace(airspace_check.ctr_name),
+                               registry.airspace(airspace_check.tma2_name),
+                               registry.airspace(airspace_check.tma1_name)]]
+
+    rng = random.Random(seed)
+    positions = [([rng.uniform(-24.5, -22.0), rng.uniform(-48.0, -45.0)],
+                  rng.uniform(0, 30000)) for _ in range(scale)]
+
+    # Airspaces built before the timed part, as after the first flight
+    for limit in limits:
+        airspace_check.point_in_airspace(*positions[0], *limit)
+
+    start = time.perf_counter()
+    for coords, altitude in positions:
+        for limit in limits:
+            airspace_check.point_in_airspace(coords, altitude, *limit)
+
+    return time.perf_counter() - start
+
+
+def time_get_flight_time(scale: int, seed: int) -> float:
+    registry = airspace_check.flight_registry((airspace_file,))
+    flights = list()
+    for track in flight_tracks(scale, seed):
+        runs = registry.crossings(registry.classify_track(
+            track.latitudes, track.longitudes, track.altitudes
+        ))
+        flights.append((track, runs[airspace_check.tma1_name],
+                        runs[airspace_check.tma2_name],
+                        runs[airspace_check.ctr_name]))
+
+    start = time.perf_counter()
+    for flight in flights:
+        airspace_check.get_flight_time(*flight)
+
+    return time.perf_counter() - start
+
+
+def run_script(script: str, arguments: list, directory: str) -> float:
+    """
+Runs a script of the repository in a directory, timing the whole process
+    """
+    start = time.perf_counter()
+    subprocess.run([sys.executable, os.path.join(repository_dir, script),
+                    *arguments],
+                   cwd=directory, check=True, stdout=subprocess.DEVNULL)
+
+    return time.perf_counter() - start
+
+
+def time_gen_stats(scale: int, seed: int) -> float:
+    with tempfile.TemporaryDirectory() as directory:
+        with open(os.path.join(directory, 'sbkp.txt'), 'w',
+                  encoding='utf8') as file_handle:
+            file_handle.writelines(archive_lines(scale, seed))
+
+        return run_script('gen_stats.py',
+                          ['--input', 'sbkp.txt', '--output-format', 'csv'],
+                          directory)
+
+
+def time_airspace_check(scale: int, seed: int, render: bool) -> float:
+    with tempfile.TemporaryDirectory() as directory:
+        ops_directory = os.path.join(directory, 'data/ops')
+        airspaces_directory = os.path.join(directory, 'data/airspaces')
+        os.makedirs(ops_directory)
+        os.makedirs(airspaces_directory)
+        shutil.copy(airspace_file, airspaces_directory)
+
+        for index in range(max(1, scale // flight_points)):
+            synthetic.write_flight(ops_directory, index, flight_points, seed)
+
+        arguments = ['--output-format', 'csv']
+        if not render:
+            arguments.append('--no-render')
+
+        return run_script('airspace_check.py', arguments, directory)
+
+
+def per_item(benchmark: str, scale: int) -> int:
+    """
+Number of items of a benchmark at a scale, the ones its time is divided by
+    """
+    if benchmark in ('get_flight_time', 'airspace_check'):
+        return max(1, scale // flight_points) * flight_points
+
+    return scale
+
+
+def compare(results: list, filepath: str) -> None:
+    """
+Prints the ratio of each time to the one of an earlier run
+    """
+    with open(filepath, 'r', encoding='utf8') as file_handle:
+        previous = json.load(file_handle)
+
+    earlier = {(result['benchmark'], result['scale']): result['seconds']
+               for result in previous['results']}
+
+    print(f'\ncompared with {previous.get("commit") or filepath}')
+    for result in results:
+        seconds = earlier.get((result['benchmark'], result['scale']))
+        if seconds is None:
+            continue
+
+        print(f'{result["benchmark"]:18} {result["scale"]:>9} '
+              f'{seconds:9.3f} s -> {result["seconds"]:9.3f} s '
+              f'{result["seconds"] / seconds:6.2f}x')
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--scales', type=int, nargs='+',
+                            default=[1000, 10000, 100000], metavar='N',
+                            help='numbers of reports or positions')
+    arg_parser.add_argument('--only', nargs='+', choices=benchmark_names,
+                            default=benchmark_names, metavar='NAME',
+                            help=f'benchmarks to run, of '
+                                 f'{", ".join(benchmark_names)}')
+    arg_parser.add_argument('--repeat', type=int, default=1,
+                            help='runs of each benchmark, the fastest is kept')
+    arg_parser.add_argument('--seed', type=int, default=0,
+                            help='random seed of the synthetic inputs')
+    arg_parser.add_argument('--output', metavar='FILE',
+                            help='JSON file of the results, '
+                                 'benchmark-<commit>.json by default')
+    arg_parser.add_argument('--compare', metavar='FILE',
+                            help='JSON file of an earlier run to compare with')
+    arg_parser.add_argument('--render', action='store_true',
+                            help='draw the charts in the airspace_check run')
+    args = arg_parser.parse_args()
+
+    benchmarks = {
+        'check_ops': time_check_ops,
+        'point_in_airspace': time_point_in_airspace,
+        'get_flight_time': time_get_flight_time,
+        'gen_stats': time_gen_stats,
+        'airspace_check': lambda scale, seed:
+            time_airspace_check(scale, seed, args.render),
+    }
+
+    results = list()
+    for name in args.only:
+        for scale in args.scales:
+            seconds = min(benchmarks[name](scale, args.seed)
+                          for _ in range(args.repeat))
+            items = per_item(name, scale)
+            results.append({'benchmark': name,
+                            'scale': scale,
+                            'items': items,
+                            'seconds': seconds,
+                            'per_item_us': seconds / items * 1e6})
+
+            print(f'{name:18} {scale:>9} {seconds:9.3f} s '
+                  f'{seconds / items * 1e6:9.2f} us/item')
+
+    revision = commit()
+    report = {
+        'commit': revision,
+        'date': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'seed': args.seed,
+        'repeat': args.repeat,
+        'render': args.render,
+        'results': results,
+    }
+
+    output = args.output \
+        or f'benchmark-{revision[:10] if revision else "local"}.json'
+    with open(output, 'w', encoding='utf8') as file_handle:
+        json.dump(report, file_handle, indent=2)
+    print(f'results written to {output}')
+
+    if args.compare:
+        compare(results, args.compare)
@@ -0,0 +1,290 @@
+"""
+Seeded synthetic inputs for the benchmarks: SBKP METAR archives in the
+REDEMET layout and Flightradar24 track and metadata files of VCP departures
+and arrivals through CTR Campinas and the São Paulo TMAs. The same arguments
+give the same files on any machine and commit
+"""
+import datetime
+import math
+import os
+import random
+
+import numpy as np
+
+# SBKP aerodrome reference point
+sbkp_latitude, sbkp_longitude = -23.0075, -47.1344
+
+# Other ends of the flights: IATA code, latitude, longitude
+destinations = [
+    ('SDU', -22.9105, -43.1631),
+    ('CNF', -19.6336, -43.9686),
+    ('POA', -29.9939, -51.1711),
+    ('BSB', -15.8711, -47.9186),
+    ('CWB', -25.5285, -49.1758),
+    ('FLN', -27.6703, -48.5525),
+    ('SSA', -12.9086, -38.3225),
+    ('REC', -8.1265, -34.9236),
+    ('CGB', -15.6529, -56.1167),
+    ('GYN', -16.6320, -49.2207),
+]
+
+# Fix inside the TMAs São Paulo every flight goes through, on a straight
+# line from SBKP across CTR Campinas
+terminal_fix = (-23.25, -46.85)
+
+# Climb and descent gradients (ft/nm)
+climb_gradient = 320
+descent_gradient = 300
+
+# Cloud amounts, low and high ceilings
+cloud_amounts = ['FEW', 'SCT', 'BKN', 'OVC']
+
+# Present weather of reduced visibility
+weather = ['BR', 'FG', '-RA', 'RA', '+RA', 'TSRA', 'DZ', 'HZ']
+
+
+def metar_report(rng: random.Random, time: datetime.datetime,
+                 cb: bool) -> str:
+    """
+Random SBKP report, mostly good weather with some low ceilings, reduced
+visibility and RVR groups
+
+    :param rng: random generator
+    :param time: observation time
+    :param cb: whether the clouds are reported as /////CB
+    :return: report, without its type
+    """
+    if rng.random() < 0.1:
+        wind = '00000KT'
+    else:
+        speed = rng.randint(1, 25)
+        gust = f'G{speed + rng.randint(8, 15):02d}' if rng.random() < 0.05 \
+            else ''
+        wind = f'{rng.randrange(10, 370, 10):03d}{speed:02d}{gust}KT'
+
+    groups = [f'SBKP {time:%d%H%M}Z', wind]
+
+    if rng.random() < 0.8:
+        groups.append('9999')
+    else:
+        visibility = rng.choice([200, 400, 600, 800, 1200, 1600, 2000, 3000,
+                                 4000, 5000, 8000])
+        groups.append(f'{visibility:04d}')
+        if visibility < 1500 and rng.random() < 0.5:
+            groups.append(f'R{rng.choice(["15", "33"])}/'
+                          f'{rng.choice([300, 550, 800, 1100, 1500]):04d}')
+        groups.append(rng.choice(weather))
+
+    if cb:
+        groups.append('/////CB')
+    elif rng.random() < 0.15:
+        groups.append('NSC')
+    else:
+        base = rng.choice([2, 4, 6, 8, 10, 15, 25, 35, 50, 80])
+        for _ in range(rng.randint(1, 3)):
+            groups.append(f'{rng.choice(cloud_amounts)}{base:03d}')
+            base += rng.choice([5, 10, 20])
+
+    temperature = rng.randint(8, 32)
+    groups.append(f'{temperature:02d}/{temperature - rng.randint(0, 8):02d}')
+    groups.append(f'Q{rng.randint(1005, 1025)}')
+
+    return ' '.join(groups)
+
+
+def metar_archive(years: int,
+                  reports_per_hour: int = 1,
+                  speci_fraction: float = 0.05,
+                  cb_fraction: float = 0.01,
+                  start_year: int = 2009,
+                  seed: int = 0):
+    """
+Lines of a synthetic SBKP archive, "YYYYMMDDHH - <METAR>", in time order
+
+    :param years: number of years, from January 1st of start_year
+    :param reports_per_hour: regular reports per hour, evenly spaced
+    :param speci_fraction: fraction of the hours with a SPECI between the
+           regular reports
+    :param cb_fraction: fraction of the reports with /////CB clouds
+    :param start_year: first year
+    :param seed: random seed
+    :return: generator of lines, with their newline
+    """
+    rng = random.Random(seed)
+    hour = datetime.datetime(start_year, 1, 1)
+    end = datetime.datetime(start_year + years, 1, 1)
+    minutes = [60 * index // reports_per_hour
+               for index in range(reports_per_hour)]
+
+    while hour < end:
+        reports = [(minute, '') for minute in minutes]
+        if rng.random() < speci_fraction:
+            reports.append((rng.randint(1, 59), 'SPECI '))
+
+        for minute, report_type in sorted(reports):
+            time = hour + datetime.timedelta(minutes=minute)
+            report = metar_report(rng, time, rng.random() < cb_fraction)
+            yield f'{hour:%Y%m%d%H} - {report_type}{report}=\n'
+
+        hour += datetime.timedelta(hours=1)
+
+
+def flight_positions(rng: random.Random, points: int, departure: bool,
+                     start: int) -> tuple:
+    """
+Positions of a flight between SBKP and another airport, by way of the
+terminal fix: parked, taxi and takeoff roll, climb, cruise, descent, landing
+roll, taxi and parked. The positions in the air are closer together near the
+airports, as in the feeds
+
+    :param rng: random generator
+    :param points: number of positions, at least 50
+    :param departure: True for a departure from SBKP, False for an arrival
+    :param start: epoch seconds of the first position
+    :return: (other airport IATA code, list of (timestamp, latitude,
+             longitude, altitude, speed, heading))
+    """
+    iata, latitude, longitude = rng.choice(destinations)
+    route = [(sbkp_latitude, sbkp_longitude), terminal_fix,
+             (latitude, longitude)]
+    if not departure:
+        route.reverse()
+
+    # Distance (nm) of each leg, on a chart scaled to the latitude of SBKP
+    legs = [math.hypot(end[0] - begin[0],
+                       (end[1] - begin[1]) * math.cos(math.radians(23))) * 60
+            for begin, end in zip(route[:-1], route[1:])]
+    length = sum(legs)
+    cruise_altitude = rng.choice([25000, 31000, 35000, 37000, 39000])
+
+    # Positions on the ground at each end, parked, taxiing and rolling
+    ground = min(max(3, points // 20), 60)
+    airborne = points - 2 * ground
+
+    positions = list()
+    timestamp = start
+
+    def add(position: tuple, altitude: float, speed: float, heading: float,
+            step: int) -> None:
+        nonlocal timestamp
+        jitter = 0.002 if speed else 0
+        positions.append((timestamp,
+                          position[0] + rng.uniform(-jitter, jitter),
+                          position[1] + rng.uniform(-jitter, jitter),
+                          round(altitude), round(speed), round(heading) % 360))
+        timestamp += step
+
+    def bearing(begin: tuple, end: tuple) -> float:
+        return math.degrees(math.atan2(
+            (end[1] - begin[1]) * math.cos(math.radians(23)),
+            end[0] - begin[0]
+        ))
+
+    for index in range(ground):
+        speed = 0 if index < ground // 3 else 15 if index < ground - 2 \
+            else 120
+        add(route[0], 0, speed, bearing(route[0], route[1]),
+            rng.randint(10, 30))
+
+    # Distance flown at each position in the air, closer together at the
+    # ends of the route
+    distances = length * (1 - np.cos(np.linspace(0, np.pi, airborne))) / 2
+    for index, distance in enumerate(distances):
+        altitude = max(100.0, min(cruise_altitude,
+                                  climb_gradient * distance,
+                                  descent_gradient * (length - distance)))
+        speed = 160 + 290 * altitude / cruise_altitude
+
+        # Position on its leg
+        leg = 0 if distance < legs[0] else 1
+        fraction = (distance - leg * legs[0]) / legs[leg] if legs[leg] else 1
+        begin, end = route[leg], route[leg + 1]
+        position = (begin[0] + (end[0] - begin[0]) * fraction,
+                    begin[1] + (end[1] - begin[1]) * fraction)
+
+        # Time to the next position, at least a second
+        following = distances[index + 1] if index + 1 < airborne \
+            else length
+        step = max(1, round((following - distance) / speed * 3600))
+        add(position, altitude, speed, bearing(begin, end), step)
+
+    for index in range(ground):
+        speed = 110 if index < 2 else 15 if index < 2 * ground // 3 else 0
+        add(route[-1], 0, speed, bearing(route[-2], route[-1]),
+            rng.randint(10, 30))
+
+    return iata, positions
+
+
+def flight(index: int, points: int, seed: int = 0) -> tuple:
+    """
+Synthetic flight. Even flights depart from SBKP, odd ones arrive
+
+    :param index: flight number
+    :param points: number of positions, at least 50
+    :param seed: random seed, with the index
+    :return: (callsign, departure IATA code, arrival IATA code, positions as
+             returned by flight_positions)
+    """
+    rng = random.Random(seed * 1000003 + index)
+    departure = index % 2 == 0
+    start = 1640995200 + rng.randrange(365 * 86400)
+    iata, positions = flight_positions(rng, max(points, 50), departure, start)
+    callsign = f'AZU{4000 + index % 6000}'
+
+    if departure:
+        return callsign, 'VCP', iata, positions
+
+    return callsign, iata, 'VCP', positions
+
+
+def write_flight(directory: str, index: int, points: int,
+                 seed: int = 0) -> str:
+    """
+Writes a synthetic flight as a Flightradar24 track file and its metadata
+file, <index>_track.csv and <index>-track.kml
+
+    :param directory: directory of the flight files
+    :param index: flight number
+    :param points: number of positions, at least 50
+    :param seed: random seed, with the index
+    :return: flight file name, without extension
+    """
+    callsign, departure_iata, arrival_iata, positions = flight(index, points,
+                                                               seed)
+    file = f'{index:06d}_track'
+
+    with open(os.path.join(directory, f'{file}.csv'), 'w') as file_handle:
+        file_handle.write('Timestamp,UTC,Callsign,Position,Altitude,Speed,'
+                          'Direction\n')
+        for timestamp, latitude, longitude, altitude, speed, heading \
+                in positions:
+            utc = datetime.datetime.fromtimestamp(timestamp,
+                                                 datetime.timezone.utc)
+            file_handle.write(f'{timestamp},{utc:%Y-%m-%dT%H:%M:%S}Z,'
+                              f'{callsign},"{latitude:.6f},{longitude:.6f}",'
+                              f'{altitude},{speed},{heading}\n')
+
+    description = (
+        f'<div><div><div><b>{callsign}</b><br/>Operated by '
+        f'<span>Azul Linhas A&#233;reas Brasileiras</span></div></div></div>'
+        f'<a title="Departure" href="https://www.flightradar24.com/data/'
+        f'airports/{departure_iata.lower()}">{departure_iata} (SB)</a>'
+        f'<a title="Arrival" href="https://www.flightradar24.com/data/'
+        f'airports/{arrival_iata.lower()}">{arrival_iata} (SB)</a>'
+        f'<span style="color: #333; font-size: 16px; font-weight: bold; '
+        f'line-height: 1.3em;">Embraer E195-E2</span>'
+        f'<a href="https://www.flightradar24.com/data/aircraft/reg/'
+        f'pr-a{index % 100:02d}">PR-A{index % 100:02d}</a>'
+    )
+    with open(os.path.join(directory, f'{file}.kml'.replace('_', '-')),
+              'w') as file_handle:
+        file_handle.write(
+            '<?xml version="1.0" encoding="UTF-8"?>\n'
+            '<kml xmlns="http://www.opengis.net/kml/2.2"><Document>'
+            f'<name>{callsign}</name>'
+            f'<description><![CDATA[{description}]]></description>'
+            '<Folder><name>Route</name></Folder></Document></kml>\n'
+        )
+
+    return file
@@ -0,0 +1,162 @@
+"""
+Flights of large combined position files
+
+A combined file holds the positions of many flights, e.g. a whole day of a
+feed, as CSV with a header and one position per row:
+    - a flight key column, the flight id or the ICAO 24-bit address
+    - timestamp: epoch seconds (UTC)
+    - callsign
+    - latitude, longitude: decimal degrees
+    - altitude: feet
+    - speed: knots
+    - heading: degrees
+in time order. Other columns are ignored.
+
+The file is read in chunks of typed columns and each chunk is split by key.
+A flight is complete once its key hasn't been seen for a gap of file time,
+or at the end of the file, and the positions of a key after such a gap start
+a new flight. Only the flights still going are kept in memory.
+"""
+import numpy as np
+import pandas as pd
+
+import tracks
+
+# Column of the flight key
+default_flight_column = 'flight_id'
+
+# Position columns, by Track field
+position_columns = {
+    'timestamps': ('timestamp', np.int64),
+    'latitudes': ('latitude', np.float64),
+    'longitudes': ('longitude', np.float64),
+    'altitudes': ('altitude', np.float32),
+    'speeds': ('speed', np.float32),
+    'headings': ('heading', np.float32),
+}
+
+# Rows read at once
+default_chunk_rows = 1 << 20
+
+# Seconds without positions after which a flight is complete
+default_flight_gap = 1800
+
+
+class PendingFlight:
+    """
+Positions of a flight still going, as the column pieces of each chunk
+    """
+    __slots__ = ('key', 'callsign', 'pieces', 'last_timestamp')
+
+    def __init__(self, key: str):
+        self.key = key
+        self.callsign = None
+        self.pieces = list()
+        self.last_timestamp = None
+
+    def add(self, columns: dict, callsigns: np.ndarray) -> None:
+        """
+Adds positions, in time order
+
+    :param columns: dict of Track field: array
+    :param callsigns: callsigns of the positions, NaN where missing
+        """
+        if self.callsign is None:
+            reported = [callsign for callsign in callsigns
+                        if isinstance(callsign, str) and callsign.strip()]
+            if reported:
+                self.callsign = reported[0].strip()
+
+        self.pieces.append(columns)
+        self.last_timestamp = int(columns['timestamps'][-1])
+
+    def track(self) -> tuple:
+        """
+Track of the flight
+
+    :return: (name, Track), named after the key and the first timestamp
+        """
+        columns = {field: np.concatenate([piece[field]
+                                          for piece in self.pieces])
+                   for field in position_columns}
+        # Positions in time order, as read for equal timestamps
+        order = np.argsort(columns['timestamps'], kind='stable')
+        track = tracks.Track(*[columns[field][order]
+                               for field in position_columns],
+                             callsign=self.callsign)
+
+        return f'{self.key}-{track.timestamps[0]}', track
+
+
+def read_flights(filepath: str,
+                 flight_column: str = default_flight_column,
+                 chunk_rows: int = default_chunk_rows,
+                 flight_gap: int = default_flight_gap):
+    """
+Reads the flights of a combined position file, each as soon as it's
+complete. Rows without a key, time or any position field are skipped
+
+    :param filepath: path to the combined .csv file
+    :param flight_column: column of the flight key
+    :param chunk_rows: rows read at once
+    :param flight_gap: seconds without positions after which a flight is
+           complete
+    :return: generator of (name, Track), completed flights in the order of
+             their last position
+    """
+    dtypes = {column: dtype for column, dtype in position_columns.values()}
+    reader = pd.read_csv(
+        filepath, engine='c', chunksize=chunk_rows,
+        usecols=[flight_column, 'callsign', *dtypes],
+        dtype={flight_column: str, 'callsign': str,
+               **{column: np.float64 for column in dtypes}}
+    )
+
+    pending = dict()
+    for chunk in reader:
+        chunk = chunk.dropna(subset=[flight_column, *dtypes])
+        if not len(chunk):
+            continue
+
+        keys = chunk[flight_column].to_numpy()
+        callsigns = chunk['callsign'].to_numpy()
+        columns = {field: chunk[column].to_numpy().astype(dtype)
+                   for field, (column, dtype) in position_columns.items()}
+        timestamps = columns['timestamps']
+
+        # Rows of each key, in file order
+        order = np.argsort(keys, kind='stable')
+        boundaries = np.flatnonzero(keys[order][1:] != keys[order][:-1]) + 1
+
+        completed = list()
+        for rows in np.split(order, boundaries):
+            key = keys[rows[0]]
+
+            # A new flight after each gap in the positions of the key, from
+            # its pending flight or between its rows
+            starts = np.flatnonzero(np.diff(timestamps[rows]) > flight_gap) + 1
+            for segment in np.split(rows, starts):
+                flight = pending.get(key)
+                if flight is not None and timestamps[segment[0]] \
+                        - flight.last_timestamp > flight_gap:
+                    completed.append(pending.pop(key))
+                    flight = None
+
+                if flight is None:
+                    flight = pending[key] = PendingFlight(key)
+
+                flight.add({field: column[segment]
+                            for field, column in columns.items()},
+                           callsigns[segment])
+
+        # Flights not seen for a gap of file time
+        now = int(timestamps.max())
+        for key, flight in list(pending.items()):
+            if now - flight.last_timestamp > flight_gap:
+                completed.append(pending.pop(key))
+
+        for flight in sorted(completed, key=lambda x: x.last_timestamp):
+            yield flight.track()
+
+    for flight in sorted(pending.values(), key=lambda x: x.last_timestamp):
+        yield flight.track()
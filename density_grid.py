@@ -0,0 +1,177 @@
+"""
+Fixed-size 2D histograms of positions
+
+The positions of every flight are counted into a grid of cells per category
+as they come, so the memory held for the compiled charts and the size of the
+raster drawn from them stay the same whatever the number of positions.
+
+A grid has either a fixed extent, dropping the positions outside it, or an
+adaptive one: it starts around the first positions and, whenever a position
+falls outside, doubles its extent and merges each 2x2 block of cells.
+"""
+import math
+
+import numpy as np
+
+
+class DensityGrid:
+    """
+Position counts per cell of a regular longitude/latitude grid, per category
+    """
+    __slots__ = ('categories', 'bins', 'fixed', 'origin', 'size', 'counts')
+
+    def __init__(self, categories: list, bins: int = 512,
+                 extent: tuple = None):
+        """
+    :param categories: names of the categories of positions
+    :param bins: cells per side, even
+    :param extent: (min longitude, max longitude, min latitude, max
+           latitude) of a fixed grid. None for an adaptive grid
+        """
+        if bins % 2:
+            raise ValueError(f'The number of cells per side must be even, '
+                             f'not {bins}')
+
+        self.categories = list(categories)
+        self.bins = bins
+        self.fixed = extent is not None
+        # (min longitude, min latitude) and (width, height) in degrees.
+        # Unset until the first position for an adaptive grid
+        self.origin = None if extent is None else (extent[0], extent[2])
+        self.size = None if extent is None \
+            else (extent[1] - extent[0], extent[3] - extent[2])
+        self.counts = {category: np.zeros((bins, bins), dtype=np.uint32)
+                       for category in self.categories}
+
+    @property
+    def extent(self):
+        """
+(min longitude, max longitude, min latitude, max latitude), None while an
+adaptive grid is empty
+        """
+        if self.origin is None:
+            return None
+
+        return (self.origin[0], self.origin[0] + self.size[0],
+                self.origin[1], self.origin[1] + self.size[1])
+
+    def fit(self, longitudes: np.ndarray, latitudes: np.ndarray) -> None:
+        """
+Grows an adaptive grid until it holds the positions
+        """
+        min_longitude, max_longitude = longitudes.min(), longitudes.max()
+        min_latitude, max_latitude = latitudes.min(), latitudes.max()
+
+        if self.origin is None:
+            # Square cells, a power of two degrees wide, aligned to it
+            span = max(max_longitude - min_longitude,
+                       max_latitude - min_latitude, 1e-6)
+            side = 2.0 ** math.ceil(math.log2(span))
+            self.origin = (math.floor(min_longitude / side) * side,
+                           math.floor(min_latitude / side) * side)
+            self.size = (side * 2, side * 2)
+
+        half = self.bins // 2
+        while not (self.origin[0] <= min_longitude
+                   and max_longitude < self.origin[0] + self.size[0]
+                   and self.origin[1] <= min_latitude
+                   and max_latitude < self.origin[1] + self.size[1]):
+            # The current cells become one quarter of the grid, on the side
+            # away from the positions outside it
+            west = min_longitude < self.origin[0]
+            south = min_latitude < self.origin[1]
+            for category, counts in self.counts.items():
+                merged = counts.reshape(half, 2, half, 2).sum(axis=(1, 3),
+                                                               dtype=np.uint32)
+                counts = np.zeros_like(counts)
+                counts[half * south:half * (south + 1),
+                       half * west:half * (west + 1)] = merged
+                self.counts[category] = counts
+
+            self.origin = (self.origin[0] - self.size[0] * west,
+                           self.origin[1] - self.size[1] * south)
+            self.size = (self.size[0] * 2, self.size[1] * 2)
+
+    def add(self, positions: dict) -> None:
+        """
+Counts positions into the grid
+
+    :param positions: dict of category: (longitudes, latitudes) arrays
+        """
+        for category, (longitudes, latitudes) in positions.items():
+            if category not in self.counts:
+                continue
+
+            # Positions without valid coordinates are dropped
+            longitudes = np.asarray(longitudes, dtype=float)
+            latitudes = np.asarray(latitudes, dtype=float)
+            finite = np.isfinite(longitudes) & np.isfinite(latitudes)
+            longitudes = longitudes[finite]
+            latitudes = latitudes[finite]
+            if not len(longitudes):
+                continue
+
+            if not self.fixed:
+                self.fit(longitudes, latitudes)
+
+            columns = np.floor((longitudes - self.origin[0])
+                               / self.size[0] * self.bins)
+            rows = np.floor((latitudes - self.origin[1])
+                            / self.size[1] * self.bins)
+            inside = (columns >= 0) & (columns < self.bins) \
+                & (rows >= 0) & (rows < self.bins)
+
+            cells = rows[inside].astype(np.int64) * self.bins \
+                + columns[inside].astype(np.int64)
+            self.counts[category] += np.bincount(
+                cells, minlength=self.bins * self.bins
+            ).reshape(self.bins, self.bins).astype(np.uint32)
+
+    def occupied_extent(self):
+        """
+(min longitude, max longitude, min latitude, max latitude) of the cells
+with any position, None if there's none
+        """
+        occupied = np.zeros((self.bins, self.bins), dtype=bool)
+        for counts in self.counts.values():
+            occupied |= counts > 0
+
+        if not occupied.any():
+            return None
+
+        rows = np.flatnonzero(occupied.any(axis=1))
+        columns = np.flatnonzero(occupied.any(axis=0))
+        cell_width = self.size[0] / self.bins
+        cell_height = self.size[1] / self.bins
+
+        return (self.origin[0] + columns[0] * cell_width,
+                self.origin[0] + (columns[-1] + 1) * cell_width,
+                self.origin[1] + rows[0] * cell_height,
+                self.origin[1] + (rows[-1] + 1) * cell_height)
+
+    def image(self, layers: list, alpha: float) -> np.ndarray:
+        """
+Composes the categories into an RGBA image, rows from south to north. Each
+position adds the opacity of a marker of the given alpha to its cell, so a
+cell looks like its markers drawn on top of each other
+
+    :param layers: list of (category, (red, green, blue)), bottom first,
+           colour components between 0 and 1
+    :param alpha: opacity of a single position
+    :return: float array (bins x bins x 4)
+        """
+        # Premultiplied colour and opacity, composed with "over"
+        color = np.zeros((self.bins, self.bins, 3))
+        opacity = np.zeros((self.bins, self.bins))
+        for category, rgb in layers:
+            layer = 1 - (1 - alpha) ** self.counts[category]
+            color = np.asarray(rgb) * layer[..., np.newaxis] \
+                + color * (1 - layer[..., np.newaxis])
+            opacity = layer + opacity * (1 - layer)
+
+        rgba = np.zeros((self.bins, self.bins, 4))
+        np.divide(color, opacity[..., np.newaxis], out=rgba[..., :3],
+                  where=opacity[..., np.newaxis] > 0)
+        rgba[..., 3] = opacity
+
+        return rgba
@@ -0,0 +1,265 @@
+"""
+SQLite catalog of the flights of data/ops/
+
+Each flight is a Flightradar24 track file, <file>.csv, and its metadata file,
+<file>.kml with '-' for '_'. The catalog pairs them once and keeps one row per
+flight with the paths, the flight information, the time span, number of
+positions and bounding box of the track, and the modification times (ns) of
+both files. Refreshing it only reads the flights that are new or changed, and
+flights can be selected from it without opening any of their files.
+"""
+import datetime
+import os
+import sqlite3
+
+import flight_metadata
+import tracks
+
+# Directory where the catalog is kept
+cache_dir = 'cache/'
+
+# Part of the catalog name, to be bumped whenever its columns change
+catalog_version = 1
+
+# Directory of the flight files
+ops_dir = 'data/ops/'
+
+# Flight information columns, as read by flight_metadata.read_metadata
+metadata_columns = ['code', 'company', 'departure_iata', 'arrival_iata',
+                    'aircraft_model', 'aircraft_registration']
+
+# Track columns
+track_columns = ['first_timestamp', 'last_timestamp', 'samples',
+                 'min_latitude', 'max_latitude', 'min_longitude',
+                 'max_longitude']
+
+columns = ['file', 'csv_path', 'kml_path', 'csv_mtime', 'kml_mtime'] \
+    + metadata_columns + track_columns
+
+schema = '''
+CREATE TABLE IF NOT EXISTS flights (
+    file TEXT PRIMARY KEY,
+    csv_path TEXT NOT NULL,
+    kml_path TEXT NOT NULL,
+    csv_mtime INTEGER NOT NULL,
+    kml_mtime INTEGER NOT NULL,
+    code TEXT,
+    company TEXT,
+    departure_iata TEXT,
+    arrival_iata TEXT,
+    aircraft_model TEXT,
+    aircraft_registration TEXT,
+    first_timestamp INTEGER,
+    last_timestamp INTEGER,
+    samples INTEGER,
+    min_latitude REAL,
+    max_latitude REAL,
+    min_longitude REAL,
+    max_longitude REAL
+);
+CREATE INDEX IF NOT EXISTS flights_departure ON flights (departure_iata);
+CREATE INDEX IF NOT EXISTS flights_arrival ON flights (arrival_iata);
+CREATE INDEX IF NOT EXISTS flights_company ON flights (company);
+CREATE INDEX IF NOT EXISTS flights_first_timestamp
+    ON flights (first_timestamp);
+'''
+
+
+def catalog_path(cache_directory: str = cache_dir) -> str:
+    """
+Returns the path of the catalog
+
+    :param cache_directory: directory holding the catalog
+    :return: path to the .sqlite file
+    """
+    return os.path.join(cache_directory,
+                        f'flight_catalog-v{catalog_version}.sqlite')
+
+
+def connect(path: str = None) -> sqlite3.Connection:
+    """
+Opens the catalog, creating it if needed
+
+    :param path: path to the .sqlite file, catalog_path() when None
+    :return: connection
+    """
+    path = path or catalog_path()
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+
+    connection = sqlite3.connect(path)
+    connection.executescript(schema)
+
+    return connection
+
+
+def flight_files(directory: str = ops_dir) -> dict:
+    """
+Pairs the track and metadata files of a directory
+
+    :param directory: directory of the flight files
+    :return: dict of flight file name, without extension: (path to the .csv
+             file, path to the .kml file), for the tracks with a .kml file
+    """
+    dir_files = set(os.listdir(directory))
+
+    return {
+        file[:-4]: (os.path.abspath(os.path.join(directory, file)),
+                    os.path.abspath(os.path.join(
+                        directory, f'{file[:-4]}.kml'.replace('_', '-')
+                    )))
+        for file in dir_files
+        if file[-4:] == '.csv'
+        and f'{file[:-4]}.kml'.replace('_', '-') in dir_files
+    }
+
+
+def flight_row(file: str,
+               csv_path: str,
+               kml_path: str,
+               csv_mtime: int,
+               kml_mtime: int,
+               metadata_index: flight_metadata.MetadataIndex) -> tuple:
+    """
+Reads the catalog row of a flight. A flight whose files can't be read keeps
+its row with NULL information, so it's still selected and its analysis
+reports the error
+
+    :param file: flight file name, without extension
+    :param csv_path: path to the .csv file
+    :param kml_path: path to the .kml file
+    :param csv_mtime: modification time of the .csv file, in ns
+    :param kml_mtime: modification time of the .kml file, in ns
+    :param metadata_index: flight information of the .kml files read before,
+           updated with this one
+    :return: values of columns
+    """
+    metadata = metadata_index.get(kml_path, kml_mtime)
+    if metadata is None:
+        try:
+            metadata = flight_metadata.read_metadata(kml_path)
+            metadata_index.put(kml_path, kml_mtime, metadata)
+        except Exception:
+            metadata = dict()
+
+    try:
+        track = tracks.load(csv_path)
+    except Exception:
+        track = None
+
+    if track is not None and len(track):
+        track_values = [int(track.timestamps[0]), int(track.timestamps[-1]),
+                        len(track),
+                        float(track.latitudes.min()),
+                        float(track.latitudes.max()),
+                        float(track.longitudes.min()),
+                        float(track.longitudes.max())]
+    else:
+        track_values = [None] * len(track_columns)
+
+    return (file, csv_path, kml_path, csv_mtime, kml_mtime,
+            *[metadata.get(column) for column in metadata_columns],
+            *track_values)
+
+
+def refresh(connection: sqlite3.Connection,
+            directory: str = ops_dir,
+            metadata_index: flight_metadata.MetadataIndex = None) -> int:
+    """
+Brings the catalog up to date with a directory: adds the new flights,
+reads again the changed ones and removes the ones no longer there. The
+unchanged flights are only checked for their modification times
+
+    :param connection: connection to the catalog
+    :param directory: directory of the flight files
+    :param metadata_index: flight information of the .kml files read before,
+           updated with the ones read
+    :return: number of flights read
+    """
+    if metadata_index is None:
+        metadata_index = flight_metadata.MetadataIndex()
+
+    known = {file: (csv_mtime, kml_mtime) for file, csv_mtime, kml_mtime
+             in connection.execute('SELECT file, csv_mtime, kml_mtime '
+                                   'FROM flights')}
+
+    rows = list()
+    files = flight_files(directory)
+    for file, (csv_path, kml_path) in sorted(files.items()):
+        mtimes = (os.stat(csv_path).st_mtime_ns,
+                  os.stat(kml_path).st_mtime_ns)
+        if known.get(file) != mtimes:
+            rows.append(flight_row(file, csv_path, kml_path, *mtimes,
+                                   metadata_index))
+
+    with connection:
+        connection.executemany(
+            f'INSERT OR REPLACE INTO flights ({", ".join(columns)}) '
+            f'VALUES ({", ".join("?" * len(columns))})',
+            rows
+        )
+        connection.executemany('DELETE FROM flights WHERE file = ?',
+                               [(file,) for file in known
+                                if file not in files])
+
+    return len(rows)
+
+
+def epoch_seconds(date: datetime.datetime) -> int:
+    """
+Epoch seconds of a time, UTC when it has no offset
+    """
+    if date.tzinfo is not None:
+        date = date.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+
+    return int((date - tracks.epoch).total_seconds())
+
+
+def select(connection: sqlite3.Connection,
+           company: str = None,
+           departure: str = None,
+           arrival: str = None,
+           registration: str = None,
+           since: datetime.datetime = None,
+           until: datetime.datetime = None) -> list:
+    """
+Selects flights from the catalog. The flights with NULL information are
+only selected when no filter needs it
+
+    :param connection: connection to the catalog
+    :param company: part of the company name, case insensitive for ASCII
+    :param departure: departure airport IATA code
+    :param arrival: arrival airport IATA code
+    :param registration: aircraft registration
+    :param since: flights with positions from this time on, UTC when it has
+           no offset
+    :param until: flights with positions before this time, UTC when it has
+           no offset
+    :return: flight file names, without extension, sorted
+    """
+    conditions = list()
+    parameters = list()
+    if company is not None:
+        conditions.append('company LIKE ?')
+        parameters.append(f'%{company}%')
+
+    for column, value in [('departure_iata', departure and departure.upper()),
+                          ('arrival_iata', arrival and arrival.upper()),
+                          ('aircraft_registration',
+                           registration and registration.upper())]:
+        if value is not None:
+            conditions.append(f'{column} = ?')
+            parameters.append(value)
+
+    if since is not None:
+        conditions.append('last_timestamp >= ?')
+        parameters.append(epoch_seconds(since))
+
+    if until is not None:
+        conditions.append('first_timestamp < ?')
+        parameters.append(epoch_seconds(until))
+
+    where = f'WHERE {" AND ".join(conditions)} ' if conditions else ''
+
+    return [file for file, in connection.execute(
+        f'SELECT file FROM flights {where}ORDER BY file', parameters
+    )]
@@ -0,0 +1,170 @@
+"""
+Flight information of Flightradar24 .kml files
+
+The flight number and the HTML description of a flight are the name and
+description of the Document of its .kml file, which come before the track.
+The file is parsed incrementally and only up to them, and the description is
+queried with XPath for the company, the airports and the aircraft.
+
+The information of each file is kept in an index, by path, with the
+modification time of the file it was read from, so later runs only read the
+files that are new or have changed.
+"""
+import os
+import pickle
+
+from lxml import etree, html
+
+# Directory where the index is kept
+cache_dir = 'cache/'
+
+# Part of the index name, to be bumped whenever the extraction changes
+metadata_version = 1
+
+# Style of the aircraft model in the description
+aircraft_model_style = 'color: #333; font-size: 16px; font-weight: bold; ' \
+                       'line-height: 1.3em;'
+
+
+def document_header(kml_filepath: str) -> tuple:
+    """
+Reads the name and description of the Document of a .kml file, without
+parsing what comes after them
+
+    :param kml_filepath: path to the .kml file
+    :return: (name, description)
+    """
+    header = dict()
+    for _, element in etree.iterparse(kml_filepath, events=('end',)):
+        parent = element.getparent()
+        if parent is None \
+                or etree.QName(parent).localname != 'Document':
+            continue
+
+        tag = etree.QName(element).localname
+        if tag in ('name', 'description'):
+            header[tag] = element.text or ''
+            if len(header) == 2:
+                return header['name'], header['description']
+
+    raise ValueError(f'No Document name and description in {kml_filepath}')
+
+
+def node_text(node) -> str:
+    """
+Text of a text node, or markup of an element without its tail
+    """
+    if isinstance(node, str):
+        return str(node)
+
+    return html.tostring(node, encoding='unicode', with_tail=False)
+
+
+def read_metadata(kml_filepath: str) -> dict:
+    """
+Reads the flight information of a Flightradar24 .kml file
+
+    :param kml_filepath: path to the .kml file
+    :return: dict with the flight number (code), company, departure and
+             arrival airports IATA codes and the aircraft model and
+             registration
+    """
+    flight_number, description = document_header(kml_filepath)
+
+    # The description is an HTML fragment
+    document = html.fragment_fromstring(description, create_parent='body')
+
+    # Links to the departure and arrival airports
+    airports = [link.text_content() for link in document.xpath('.//a[@title]')
+                if link.text_content().strip()
+                and 'airport' in link.get('href')]
+
+    # Fourth node of the first div nested in two others
+    company = node_text(document.xpath(
+        './/div/div/div[not(preceding-sibling::*)]'
+    )[0].xpath('node()')[3])
+
+    acft_model = document.xpath(
+        f'.//span[@style="{aircraft_model_style}"]'
+    )[0].text_content()
+
+    acft_reg = document.xpath('.//a[contains(@href, "/reg/")]'
+                              )[0].text_content()
+
+    return {
+        'code': flight_number,
+        'company': company,
+        'departure_iata': airports[0][:3].upper(),
+        'arrival_iata': airports[1][:3].upper(),
+        'aircraft_model': acft_model,
+        'aircraft_registration': acft_reg,
+    }
+
+
+class MetadataIndex:
+    """
+Flight information of .kml files, by absolute path, with the modification
+time (ns) of the file it was read from
+    """
+    __slots__ = ('path', 'entries', 'changed')
+
+    def __init__(self, cache_directory: str = cache_dir):
+        """
+    :param cache_directory: directory holding the index
+        """
+        self.path = os.path.join(cache_directory,
+                                 f'flight_metadata-v{metadata_version}.pkl')
+        self.changed = False
+        self.entries = dict()
+        if os.path.isfile(self.path):
+            with open(self.path, 'rb') as file_handle:
+                self.entries = pickle.load(file_handle)
+
+    def get(self, kml_filepath: str, mtime: int):
+        """
+Flight information of a file, None if it wasn't read at that modification
+time
+
+    :param kml_filepath: path to the .kml file
+    :param mtime: modification time of the file, in ns
+        """
+        entry = self.entries.get(os.path.abspath(kml_filepath))
+        if entry is None or entry[0] != mtime:
+            return None
+
+        return entry[1]
+
+    def put(self, kml_filepath: str, mtime: int, metadata: dict) -> None:
+        """
+Keeps the flight information of a file
+
+    :param kml_filepath: path to the .kml file
+    :param mtime: modification time of the file it was read at, in ns
+    :param metadata: flight information, as returned by read_metadata
+        """
+        key = os.path.abspath(kml_filepath)
+        if self.entries.get(key) != (mtime, metadata):
+            self.entries[key] = (mtime, metadata)
+            self.changed = True
+
+    def save(self) -> None:
+        """
+Saves the index atomically, if it changed
+        """
+        if not self.changed:
+            return
+
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp_path = f'{self.path}.tmp'
+        with open(tmp_path, 'wb') as file_handle:
+            pickle.dump(self.entries, file_handle,
+                        protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, self.path)
+        self.changed = False
+
+
+def modification_time(kml_filepath: str) -> int:
+    """
+Modification time of a file, in ns, as kept in the index
+    """
+    return os.stat(kml_filepath).st_mtime_ns
@@ -1,352 +1,782 @@
+import argparse
+import csv
 import datetime
-from metar import Metar
-import re
-import pandas as pd
-
-procs = ['VFR', 'VFR-E', 'IFR-ILS', 'IFR-LNAV/VNAV', 'IFR-LNAV-PAB',
-         'IFR-LNAV-PCD', 'IFR-RNP030', 'IFR-RNP015']
-
-def check_ops(op: str, metar: Metar.Metar) -> bool:
-    ceiling_minimum = None
-    visibility_minimum = None
+import math
+from concurrent.futures import ProcessPoolExecutor
 
-    if op.upper() == 'VFR':
-        ceiling_minimum = 1500
-        visibility_minimum = 5000
-
-    elif op.upper() == 'VFR-E':
-        ceiling_minimum = 1000
-        visibility_minimum = 3000
+import numpy as np
+import pandas as pd
+from metar import Metar
 
+import aerodromes
+import metar_store
+import metar_timeline
+import output_sinks
+import procedure_minima
+import stats_checkpoint
+import stats_store
+from aerodromes import Aerodrome
+from stats_store import HourlyStats
 
+procs = procedure_minima.procs
 
-    else:
-        if metar.wind_speed is not None:
-            wind_speed = metar.wind_speed.value('kt')
+# Reference for the day ordinals of the observations
+epoch = datetime.datetime(1970, 1, 1)
 
-        else:
-            wind_speed = None
 
-        if metar.wind_dir is not None:
-            wind_dir = metar.wind_dir.value()
-        else:
-            wind_dir = None
+def check_ops(op: str, metar: Metar.Metar) -> bool:
+    wind_dir, wind_speed, ceiling, vis, max_vis, rvr = \
+        metar_store.extract_fields(metar)
+
+    return check_ops_fields(op, wind_dir, wind_speed, ceiling,
+                            float(metar_store.min_visibility(vis, max_vis,
+                                                             rvr)))
+
+
+def check_ops_fields(op: str,
+                     wind_dir: float,
+                     wind_speed: float,
+                     ceiling: float,
+                     visibility: float) -> bool:
+    """
+Given the fields extracted from a METAR, returns whether the aerodrome could
+receive operations of the given type
+
+    :param op: operation type, one of procs
+    :param wind_dir: wind direction in degrees, NaN if not reported
+    :param wind_speed: wind speed in kt, NaN if not reported
+    :param ceiling: lowest BKN/OVC layer base in ft, NaN if there's none
+    :param visibility: lowest of visibility, maximum visibility and RVR in m,
+           NaN if none was reported
+    :return: True/False, whether the operation was available
+    """
+    op_minima = procedure_minima.get_minima(
+        op, procedure_minima.runway_in_use(wind_dir, wind_speed)
+    )
+
+    # Procedure not published for the runway in use
+    if op_minima is None:
+        return False
 
-        # RWY 15 in use
-        if wind_speed is None or \
-                wind_speed < 6 or \
-                wind_dir is None or \
-                (abs(wind_dir - 149) > abs(wind_dir - 239)):
+    ceiling_minimum, visibility_minimum = op_minima
 
-            if op.upper() == 'IFR-ILS':
-                ceiling_minimum = 200
-                visibility_minimum = 800
+    if not math.isnan(ceiling) and ceiling < ceiling_minimum:
+        return False
 
-            elif op.upper() == 'IFR-LNAV/VNAV':
-                ceiling_minimum = 357
-                visibility_minimum = 1100
+    if not math.isnan(visibility) and visibility < visibility_minimum:
+        return False
 
-            elif op.upper() == 'IFR-LNAV-PAB':
-                ceiling_minimum = 430
-                visibility_minimum = 800
+    return True
 
-            elif op.upper() == 'IFR-LNAV-PCD':
-                ceiling_minimum = 430
-                visibility_minimum = 1500
 
-            elif op.upper() == 'IFR-RNP030':
-                ceiling_minimum = 339
-                visibility_minimum = 1000
+def compute_bucket_stats(obs: dict,
+                         start_date: datetime.datetime,
+                         end_date: datetime.datetime,
+                         bucket='hour',
+                         max_validity: int = None,
+                         aerodrome: Aerodrome = procedure_minima.sbkp) -> tuple:
+    """
+Computes the statistics of each bucket of a range from the validity
+timeline of the observations
+
+By default each observation is valid until the next one in the same hour, or
+until the end of the hour, and only the hours without any report count as
+time without information. With max_validity, each report is valid until the
+next one for at most max_validity minutes, across hour and day boundaries,
+and any time not covered by a valid report counts as without information
+
+    :param obs: METAR columns, as returned by metar_store.load_archive
+    :param start_date: start of the statistics
+    :param end_date: end of the statistics (exclusive)
+    :param bucket: 'minute', 'hour', 'day', 'month' or a width in minutes
+    :param max_validity: maximum validity of a report, in minutes
+    :param aerodrome: runways and procedure minima to evaluate
+    :return: (bucket edges as minutes since the epoch, array of seconds
+             (buckets x aerodrome.metrics))
+    """
+    start_minute = int((start_date - epoch).total_seconds()) // 60
+    end_minute = int((end_date - epoch).total_seconds()) // 60
+
+    # Reports from before the range may still be valid inside it
+    lookback = max_validity if max_validity is not None else 0
+
+    obs_minutes = obs['time'].astype(np.int64)
+    rows = np.flatnonzero((obs_minutes >= start_minute - lookback)
+                          & (obs_minutes < end_minute))
+
+    interval_rows, starts, ends = metar_timeline.validity_intervals(
+        obs_minutes[rows], max_validity
+    )
+    rows = rows[interval_rows]
+
+    # Runway in use and availability of every procedure
+    visibility = metar_store.min_visibility(obs['vis'][rows],
+                                            obs['max_vis'][rows],
+                                            obs['rvr'][rows])
+    runway_index = aerodrome.runway_in_use(obs['wind_dir'][rows],
+                                           obs['wind_speed'][rows])
+    available = aerodrome.availability_matrix(
+        obs['wind_dir'][rows], obs['wind_speed'][rows], obs['ceiling'][rows],
+        visibility, obs['cb'][rows]
+    )
+    cb = obs['cb'][rows]
+
+    # Cases where there's /////CB on METAR are not counted as runway in use
+    runway_in_use = (runway_index[:, np.newaxis]
+                     == np.arange(len(aerodrome.runways))) & ~cb[:, np.newaxis]
+    weights = np.column_stack([np.ones(len(rows), dtype=bool),
+                               runway_in_use,
+                               ~available])
+
+    edges = metar_timeline.bucket_edges(start_minute, end_minute, bucket)
+    covered = metar_timeline.covered_minutes(starts, ends, weights, edges) * 60
+    bucket_seconds = np.diff(edges) * 60
+
+    # Columns in the order of aerodrome.metrics: time without information,
+    # runways in use and unavailable procedures
+    seconds = covered
+
+    if max_validity is None:
+        # Hours without any report, counted inside the buckets they overlap
+        hour_edges = metar_timeline.bucket_edges(
+            start_minute // 60 * 60, -(-end_minute // 60) * 60, 'hour'
+        )
+        no_report = metar_timeline.count_starts(starts, hour_edges) == 0
+        seconds[:, 0] = metar_timeline.covered_minutes(
+            hour_edges[:-1], hour_edges[1:], no_report[:, np.newaxis], edges
+        )[:, 0] * 60
+    else:
+        seconds[:, 0] = bucket_seconds - seconds[:, 0]
+
+    return edges, seconds
+
+
+def compute_hourly_stats(obs: dict,
+                         start_date: datetime.datetime,
+                         end_date: datetime.datetime,
+                         max_validity: int = None,
+                         aerodrome: Aerodrome = procedure_minima.sbkp
+                         ) -> HourlyStats:
+    """
+Computes the hourly statistics from the METAR columns
+
+    :param obs: METAR columns, as returned by metar_store.load_archive
+    :param start_date: first day of the statistics
+    :param end_date: end of the statistics (exclusive)
+    :param max_validity: maximum validity of a report, in minutes. See
+           compute_bucket_stats
+    :param aerodrome: runways and procedure minima to evaluate
+    :return: hourly statistics, in seconds
+    """
+    _, seconds = compute_bucket_stats(obs, start_date, end_date, 'hour',
+                                      max_validity, aerodrome)
+
+    return HourlyStats(start_date, seconds.reshape(-1, 24, seconds.shape[-1]))
+
+
+def date_range(obs: dict) -> tuple:
+    """
+Returns the range of whole days covered by the METAR columns
+
+    :param obs: METAR columns, as returned by metar_store.load_archive
+    :return: (start_date, end_date), end_date exclusive
+    """
+    # Observation times as minutes since the epoch
+    obs_minutes = obs['time'].astype(np.int64)
+
+    start_date = epoch + datetime.timedelta(days=int(obs_minutes.min()) // 1440)
+    end_date = epoch + datetime.timedelta(days=int(obs_minutes.max()) // 1440 + 1)
+
+    return start_date, end_date
+
+
+def partition_start(date: datetime.datetime,
+                    partition: str) -> datetime.datetime:
+    """
+Returns the first day of the partition containing a date
+
+    :param date: any date
+    :param partition: 'month' or 'year'
+    :return: first day of the month or year
+    """
+    return datetime.datetime(date.year,
+                             date.month if partition == 'month' else 1, 1)
+
+
+def next_partition(start_date: datetime.datetime,
+                   partition: str) -> datetime.datetime:
+    """
+Returns the start of the partition following the one starting at start_date
+
+    :param start_date: first day of a partition
+    :param partition: 'month' or 'year'
+    :return: first day of the next partition
+    """
+    if partition == 'year':
+        return start_date.replace(year=start_date.year + 1)
+
+    return start_date.replace(year=start_date.year + start_date.month // 12,
+                              month=start_date.month % 12 + 1)
+
+
+def partition_bounds(first_start: datetime.datetime,
+                     last_start: datetime.datetime,
+                     partition: str) -> list:
+    """
+Lists the consecutive partitions between two partitions, inclusive
+
+    :param first_start: first day of the first partition
+    :param last_start: first day of the last partition
+    :param partition: 'month' or 'year'
+    :return: list of (start_date, end_date), end_date exclusive
+    """
+    bounds = list()
+    start_date = first_start
+    while start_date <= last_start:
+        end_date = next_partition(start_date, partition)
+        bounds.append((start_date, end_date))
+        start_date = end_date
+
+    return bounds
+
+
+def read_partitions(filepath: str, partition: str) -> dict:
+    """
+Splits the lines of an archive by the month or year of their timetag
+
+    :param filepath: path to the archive
+    :param partition: 'month' or 'year'
+    :return: dict of partition first day to its lines, in file order
+    """
+    partitions = dict()
+    with open(filepath, 'r', encoding='utf8') as file_handle:
+        for line in file_handle:
+            timetag = line.strip('\ufeff')[:6]
+            if not timetag.isdigit():
+                continue
+
+            start_date = partition_start(
+                datetime.datetime(int(timetag[:4]), int(timetag[4:6]), 1),
+                partition
+            )
+            partitions.setdefault(start_date, list()).append(line)
+
+    return partitions
+
+
+def evaluate_partition(obs: dict,
+                       start_date: datetime.datetime,
+                       end_date: datetime.datetime,
+                       max_validity: int = None) -> HourlyStats:
+    """
+Evaluates the columns of one partition. Runs in a worker process
+
+    :param obs: METAR columns of the partition, including the reports still
+           valid at its start
+    :param start_date: first day of the partition
+    :param end_date: end of the partition (exclusive)
+    :param max_validity: maximum validity of a report, in minutes
+    :return: hourly statistics of the partition
+    """
+    return compute_hourly_stats(obs, start_date, end_date, max_validity)
+
+
+def compute_hourly_stats_parallel(filepath: str,
+                                  workers: int,
+                                  partition: str = 'month',
+                                  max_validity: int = None) -> HourlyStats:
+    """
+Computes the hourly statistics of a whole archive, with each month or year
+parsed and evaluated in a separate worker process. The partitions are merged
+in time order, so the result is the same as the one of compute_hourly_stats
+over the date range of the data
+
+    :param filepath: path to the archive
+    :param workers: number of worker processes
+    :param partition: 'month' or 'year'
+    :param max_validity: maximum validity of a report, in minutes
+    :return: hourly statistics, in seconds
+    """
+    path = metar_store.cache_path(filepath)
+    obs = metar_store.load_cached(path)
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        if obs is None:
+            # Not parsed yet, the workers parse their own lines
+            partitions = read_partitions(filepath, partition)
+            if not partitions:
+                raise ValueError(f'No METAR information in {filepath}')
+
+            obs = metar_store.concat_columns(list(executor.map(
+                metar_store.parse_lines,
+                [partitions[start_date] for start_date in sorted(partitions)]
+            )))
+            metar_store.save_cached(path, obs)
+
+        start_date, end_date = date_range(obs)
+        bounds = partition_bounds(
+            partition_start(start_date, partition),
+            partition_start(end_date - datetime.timedelta(days=1), partition),
+            partition
+        )
+
+        # Each partition gets its reports and the ones still valid at its
+        # start
+        lookback = np.timedelta64(max_validity or 0, 'm')
+        data = list()
+        for bound_start, bound_end in bounds:
+            mask = (obs['time'] >= np.datetime64(bound_start, 'm') - lookback) \
+                & (obs['time'] < np.datetime64(bound_end, 'm'))
+            data.append({name: column[mask] for name, column in obs.items()})
+
+        results = list(executor.map(evaluate_partition, data,
+                                    [bound[0] for bound in bounds],
+                                    [bound[1] for bound in bounds],
+                                    [max_validity] * len(bounds)))
+
+    # The partitions cover whole months or years, only the date range of the
+    # data is kept
+    return HourlyStats.concat(results).select(start_date, end_date)
+
+
+def compute_hourly_stats_incremental(filepath: str,
+                                     max_validity: int = None) -> HourlyStats:
+    """
+Computes the hourly statistics of an append-only archive, parsing only the
+lines appended since the previous run. The days from the last one of the
+previous run onwards are recomputed, the others are taken from its
+checkpoint. If the processed part of the archive changed, or the new reports
+are older than that last day, everything is computed again
+
+    :param filepath: path to the archive
+    :param max_validity: maximum validity of a report, in minutes. See
+           compute_bucket_stats
+    :return: hourly statistics, in seconds, over the date range of the data
+    """
+    path = stats_checkpoint.checkpoint_path(filepath, max_validity)
+    checkpoint = stats_checkpoint.load_checkpoint(path, filepath)
+
+    offset = checkpoint['offset'] if checkpoint is not None else 0
+    lines, last_line, offset = stats_checkpoint.read_tail(filepath, offset)
+    new_obs = metar_store.parse_lines(lines)
+
+    if checkpoint is not None and len(new_obs['time']) > 0:
+        first_date = checkpoint['stats'].end_date - datetime.timedelta(days=1)
+        if new_obs['time'].min() < np.datetime64(first_date, 'm'):
+            # Appended out of order, the checkpoint can't be updated
+            checkpoint = None
+            lines, last_line, offset = stats_checkpoint.read_tail(filepath, 0)
+            new_obs = metar_store.parse_lines(lines)
+
+    if checkpoint is not None:
+        obs = metar_store.concat_columns([checkpoint['obs'], new_obs])
+    else:
+        obs = new_obs
 
-            elif op.upper() == 'IFR-RNP015':
-                ceiling_minimum = None
-                visibility_minimum = None
+    # The unterminated last line is counted, but parsed again on the next run
+    # as it may not have been completely written yet
+    current_obs = metar_store.concat_columns(
+        [obs, metar_store.parse_lines([last_line])]
+    )
+    if len(current_obs['time']) == 0:
+        raise ValueError(f'No METAR information in {filepath}')
 
-        # RWY 33 in use
-        else:
-            if op.upper() == 'IFR-LNAV/VNAV':
-                ceiling_minimum = 363
-                visibility_minimum = 1700
+    start_date, end_date = date_range(current_obs)
 
-            elif op.upper() == 'IFR-LNAV-PAB':
-                ceiling_minimum = 450
-                visibility_minimum = 1700
+    if checkpoint is None:
+        hourly_stats = compute_hourly_stats(current_obs, start_date, end_date,
+                                            max_validity)
 
-            elif op.upper() == 'IFR-LNAV-PCD':
-                ceiling_minimum = 450
-                visibility_minimum = 2100
+    else:
+        # The last day of the previous run may have been partial
+        previous_stats = checkpoint['stats']
+        first_date = previous_stats.end_date - datetime.timedelta(days=1)
+        end_date = max(end_date, previous_stats.end_date)
+
+        hourly_stats = HourlyStats.concat([
+            previous_stats.select(previous_stats.start_date, first_date),
+            compute_hourly_stats(current_obs, first_date, end_date,
+                                 max_validity),
+        ])
+
+    # Only the reports still needed to recompute the new last day are kept
+    keep_from = np.datetime64(end_date - datetime.timedelta(days=1), 'm') \
+        - np.timedelta64(max_validity or 0, 'm')
+    mask = obs['time'] >= keep_from
+    stats_checkpoint.save_checkpoint(
+        path, filepath, offset, hourly_stats,
+        {name: column[mask] for name, column in obs.items()}
+    )
+
+    return hourly_stats
+
+
+def read_stations(filepath: str, stations) -> dict:
+    """
+Splits the lines of a combined archive by the station ID of their reports
+
+    :param filepath: path to the archive
+    :param stations: station IDs to keep, the others are skipped
+    :return: dict of station ID to its lines, in file order
+    """
+    stations = set(stations)
+    station_lines = {station: list() for station in stations}
+    with open(filepath, 'r', encoding='utf8') as file_handle:
+        for line in file_handle:
+            station = metar_store.station_id(line)
+            if station in stations:
+                station_lines[station].append(line)
+
+    return station_lines
+
+
+def evaluate_station(lines: list,
+                     aerodrome: Aerodrome,
+                     max_validity: int = None):
+    """
+Parses and evaluates the reports of one station. Runs in a worker process
+
+    :param lines: archive lines of the station
+    :param aerodrome: runways and procedure minima of the station
+    :param max_validity: maximum validity of a report, in minutes
+    :return: hourly statistics over the date range of the station's reports,
+             None if it has no valid report
+    """
+    obs = metar_store.parse_lines(lines)
+    if len(obs['time']) == 0:
+        return None
+
+    return compute_hourly_stats(obs, *date_range(obs), max_validity, aerodrome)
+
+
+def compute_station_stats(filepath: str,
+                          aerodromes: dict,
+                          workers: int = 1,
+                          max_validity: int = None) -> dict:
+    """
+Computes the hourly statistics of many aerodromes from a combined archive.
+The archive is read once and the reports of each station are evaluated in a
+separate worker process
+
+    :param filepath: path to the archive
+    :param aerodromes: dict of station ID to Aerodrome, as returned by
+           aerodromes.load_aerodromes
+    :param workers: number of worker processes
+    :param max_validity: maximum validity of a report, in minutes
+    :return: dict of station ID to hourly statistics, None for the stations
+             without any valid report
+    """
+    station_lines = read_stations(filepath, aerodromes)
+    stations = list(aerodromes)
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        results = executor.map(evaluate_station,
+                               [station_lines[station] for station in stations],
+                               [aerodromes[station] for station in stations],
+                               [max_validity] * len(stations))
+
+        return dict(zip(stations, results))
+
+
+def stream_stats(rows, max_validity: int = None):
+    """
+Computes the daily and monthly statistics while the observations are read,
+emitting each day and month as soon as it closes. Only the observations of
+the current day are held in memory. The date range is the one of the data
+
+    :param rows: iterable of observations in time order, as yielded by
+           metar_store.iter_archive
+    :param max_validity: maximum validity of a report, in minutes. See
+           compute_bucket_stats
+    :return: generator of (period, key, seconds), where period is 'day' (key
+             "dd/mm/YYYY") or 'month' (key "mm/YYYY") and seconds the array of
+             each metric
+    """
+    current_day = None
+    day_rows = list()
+    month_key = None
+    month_total = None
+
+    # Latest report of the days already closed, it may still be valid
+    carried_rows = list()
+
+    def close_days(first_day: int, last_day: int):
+        nonlocal month_key, month_total, carried_rows
+
+        # Only the first day has observations, the others are gaps in the data
+        for day in range(first_day, last_day + 1):
+            day_start = epoch + datetime.timedelta(days=day)
+
+            if day == first_day:
+                obs_rows = carried_rows + day_rows
+                carried_rows = [max(obs_rows, key=lambda row: row[0])]
+            else:
+                obs_rows = carried_rows
+
+            day_keys, day_seconds = compute_hourly_stats(
+                metar_store.to_columns(obs_rows),
+                day_start, day_start + datetime.timedelta(days=1),
+                max_validity
+            ).daily()
+
+            yield 'day', day_keys[0], day_seconds[0]
+
+            day_month_key = day_start.strftime("%m/%Y")
+            if day_month_key != month_key:
+                if month_key is not None:
+                    yield 'month', month_key, month_total
+
+                month_key = day_month_key
+                month_total = day_seconds[0].copy()
+
+            else:
+                month_total += day_seconds[0]
+
+    for row in rows:
+        # Day ordinal of the observation
+        day = row[0] // 1440
+
+        if current_day is None:
+            current_day = day
+
+        elif day < current_day:
+            raise ValueError(
+                f'Observation out of order: {epoch + datetime.timedelta(minutes=row[0])}'
+                f' after {epoch + datetime.timedelta(days=current_day)}'
+            )
 
-            elif op.upper() == 'IFR-RNP030':
-                ceiling_minimum = 363
-                visibility_minimum = 1700
+        elif day > current_day:
+            # Days without any observation in between are closed as well
+            yield from close_days(current_day, day - 1)
+            day_rows = list()
+            current_day = day
 
-            elif op.upper() == 'IFR-RNP015':
-                ceiling_minimum = 250
-                visibility_minimum = 1300
+        day_rows.append(row)
 
-            elif op.upper() == 'IFR-ILS':
-                ceiling_minimum = None
-                visibility_minimum = None
+    if current_day is not None:
+        yield from close_days(current_day, current_day)
+        yield 'month', month_key, month_total
 
-    if ceiling_minimum is None and visibility_minimum is None:
-        return False
 
-    if ceiling_minimum is None or visibility_minimum is None:
-        raise ValueError('Operation type not found')
+def write_stream(stats, daily_filepath: str, monthly_filepath: str) -> None:
+    """
+Writes the statistics emitted by stream_stats to CSV files, row by row
 
-    ceiling_heights = []
-    for layer in metar.sky:
-        if layer[0].upper() in {'BKN', 'OVC'}:
-            ceiling_heights.append(layer[1].value('ft'))
+    :param stats: generator returned by stream_stats
+    :param daily_filepath: path of the daily statistics file
+    :param monthly_filepath: path of the monthly statistics file
+    """
+    with open(daily_filepath, 'w', newline='', encoding='utf8') as d_fh, \
+            open(monthly_filepath, 'w', newline='', encoding='utf8') as m_fh:
+        writers = {'day': csv.writer(d_fh), 'month': csv.writer(m_fh)}
 
-    if len(ceiling_heights) > 0 and min(ceiling_heights) < ceiling_minimum:
-        return False
+        for writer in writers.values():
+            writer.writerow(
+                [''] + [labels[metric] for metric in stats_store.metrics]
+            )
 
-    visibilities = []
-    if metar.vis is not None:
-        visibilities.append(metar.vis.value('m'))
+        for period, key, seconds in stats:
+            writers[period].writerow(
+                [key] + [str(datetime.timedelta(seconds=int(value)))
+                         for value in seconds]
+            )
 
-    if metar.max_vis is not None:
-        visibilities.append(metar.max_vis.value('m'))
 
-    for vis in metar.runway:
-        visibilities.append(vis[1].value('m'))
+def write_stream_sinks(stats,
+                       daily_filepath: str,
+                       monthly_filepath: str,
+                       output_format: str) -> None:
+    """
+Writes the statistics emitted by stream_stats through output sinks, row by
+row, with the durations in seconds
+
+    :param stats: generator returned by stream_stats
+    :param daily_filepath: path of the daily statistics file, without
+           extension
+    :param monthly_filepath: path of the monthly statistics file, without
+           extension
+    :param output_format: one of output_sinks.output_formats
+    """
+    sinks = {
+        'day': output_sinks.open_sink(daily_filepath,
+                                      stats_columns('Dia'), output_format),
+        'month': output_sinks.open_sink(monthly_filepath,
+                                        stats_columns('Mês'), output_format),
+    }
+    try:
+        for period, key, seconds in stats:
+            sinks[period].write_row([key] + seconds.tolist())
+    finally:
+        for sink in sinks.values():
+            sink.close()
+
+
+def write_stats(hourly_stats: HourlyStats,
+                daily_filepath: str,
+                monthly_filepath: str,
+                output_format: str = 'legacy',
+                aerodrome: Aerodrome = procedure_minima.sbkp) -> None:
+    """
+Writes the daily and monthly statistics
+
+    :param hourly_stats: hourly statistics, in seconds
+    :param daily_filepath: path of the daily statistics file, without
+           extension
+    :param monthly_filepath: path of the monthly statistics file, without
+           extension
+    :param output_format: 'legacy' for the pandas xlsx tables of durations,
+           or one of output_sinks.output_formats for durations in seconds
+    :param aerodrome: aerodrome of the statistics
+    """
+    for (keys, seconds), filepath, key_label in [
+            (hourly_stats.daily(), daily_filepath, 'Dia'),
+            (hourly_stats.monthly(), monthly_filepath, 'Mês')]:
+        if output_format == 'legacy':
+            stats_frame(keys, seconds, aerodrome).to_excel(f'{filepath}.xlsx')
 
-    if len(visibilities) > 0 and min(visibilities) < visibility_minimum:
-        return False
+        else:
+            output_sinks.write_table(
+                filepath, stats_columns(key_label, aerodrome),
+                ([key] + row for key, row in zip(keys, seconds.tolist())),
+                output_format
+            )
 
-    return True
 
+def stats_columns(key_label: str,
+                  aerodrome: Aerodrome = procedure_minima.sbkp) -> list:
+    """
+Returns the column names of the statistics written through output sinks
+
+    :param key_label: name of the day or month column
+    :param aerodrome: aerodrome of the statistics
+    :return: key_label followed by the labels of the metrics
+    """
+    metric_labels = aerodrome.metric_labels()
+
+    return [key_label] + [metric_labels[metric] for metric in aerodrome.metrics]
+
+
+def stats_frame(keys: list,
+                seconds: np.ndarray,
+                aerodrome: Aerodrome = procedure_minima.sbkp) -> pd.DataFrame:
+    """
+Builds the exported table of daily or monthly statistics, with the labels
+as column names
+
+    :param keys: day or month keys
+    :param seconds: array of seconds (keys x aerodrome.metrics)
+    :param aerodrome: aerodrome of the statistics
+    :return: DataFrame of durations
+    """
+    metric_labels = aerodrome.metric_labels()
+
+    return pd.DataFrame(
+        {metric_labels[metric]: pd.to_timedelta(seconds[:, index], unit='s')
+         for index, metric in enumerate(aerodrome.metrics)},
+        index=keys
+    )
+
+
+# Names of the metrics of SBKP in the exported tables
+labels = procedure_minima.sbkp.metric_labels()
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(
+        description='Computes the time SBKP was closed for each procedure'
+    )
+    arg_parser.add_argument('--input', default='data/sbkp.txt',
+                            help='METAR archive, "YYYYMMDDHH - <METAR>" lines')
+    arg_parser.add_argument('--stream', action='store_true',
+                            help='read the archive line by line and write '
+                                 'each day and month as soon as it closes, '
+                                 'in constant memory (CSV output)')
+    arg_parser.add_argument('--workers', type=int, default=1,
+                            help='number of worker processes, each parsing '
+                                 'and evaluating one partition of the archive')
+    arg_parser.add_argument('--partition', choices=['month', 'year'],
+                            default='month',
+                            help='size of the partitions of --workers')
+    arg_parser.add_argument('--incremental', action='store_true',
+                            help='keep a checkpoint of the statistics and, on '
+                                 'later runs, parse only the reports appended '
+                                 'to the archive since then')
+    arg_parser.add_argument('--aerodromes', metavar='FILE',
+                            help='aerodrome definition file (JSON). Evaluates '
+                                 'every aerodrome in it from the combined '
+                                 'archive in --input and writes a table per '
+                                 'station')
+    arg_parser.add_argument('--output-format',
+                            choices=['legacy'] + output_sinks.output_formats,
+                            default='legacy',
+                            help='legacy writes the durations as time values '
+                                 '(xlsx, or CSV text with --stream). The '
+                                 'others write them as numeric seconds')
+    arg_parser.add_argument('--max-validity', type=int, default=None,
+                            metavar='MINUTES',
+                            help='keep each report valid until the next one '
+                                 'for at most MINUTES, across hours and days. '
+                                 'By default a report is valid only until the '
+                                 'end of its hour')
+    args = arg_parser.parse_args()
+
+    if args.stream and args.workers > 1:
+        arg_parser.error('--stream runs in a single process')
+
+    if args.incremental and (args.stream or args.workers > 1):
+        arg_parser.error('--incremental runs in a single process, '
+                         'without --stream')
+
+    if args.aerodromes and (args.stream or args.incremental):
+        arg_parser.error('--aerodromes can\'t be used with --stream or '
+                         '--incremental')
+
+    if args.aerodromes:
+        station_aerodromes = aerodromes.load_aerodromes(args.aerodromes)
+        station_stats = compute_station_stats(args.input, station_aerodromes,
+                                              args.workers, args.max_validity)
+
+        for station, hourly_stats in station_stats.items():
+            if hourly_stats is None:
+                print(f'No METAR information for {station} in {args.input}')
+                continue
+
+            write_stats(hourly_stats,
+                        f'estatisticas diárias {station}',
+                        f'estatisticas mensais {station}',
+                        args.output_format, station_aerodromes[station])
+
+    elif args.stream:
+        stats = stream_stats(metar_store.iter_archive(args.input),
+                             args.max_validity)
+
+        if args.output_format == 'legacy':
+            write_stream(stats,
+                         'estatisticas diárias 2.csv',
+                         'estatisticas mensais 2.csv')
+        else:
+            write_stream_sinks(stats,
+                               'estatisticas diárias 2',
+                               'estatisticas mensais 2',
+                               args.output_format)
 
-daily_stats = dict()
-start_date = datetime.datetime(day=1, month=8, year=2022, hour=0, minute=0)
-end_date = datetime.datetime(day=30, month=10, year=2022, hour=0, minute=1)
-
-# Create data structure
-current_date = start_date
-while current_date < end_date:
-    key = current_date.strftime("%d/%m/%Y")
-    daily_stats[key] = dict()
-    daily_stats[key]["hourly_stats"] = dict()
-    for i in range(24):
-        key2 = f'{i:02}'
-        daily_stats[key]["hourly_stats"][key2] = {
-            "obs": {
-                "raw_obs": list(),
-                "parsed_obs": dict(),
-                "obs_duration": list(),
-            },
-            "no_info_time": datetime.timedelta(0),
-            "33_inuse_time": datetime.timedelta(0),
-            "15_inuse_time": datetime.timedelta(0),
-            "unavailable_VFR_time": datetime.timedelta(0),
-            "unavailable_VFR-E_time": datetime.timedelta(0),
-            "unavailable_IFR-ILS_time": datetime.timedelta(0),
-            "unavailable_IFR-LNAV/VNAV_time": datetime.timedelta(0),
-            "unavailable_IFR-LNAV-PAB_time": datetime.timedelta(0),
-            "unavailable_IFR-LNAV-PCD_time": datetime.timedelta(0),
-            "unavailable_IFR-RNP030_time": datetime.timedelta(0),
-            "unavailable_IFR-RNP015_time": datetime.timedelta(0),
-        }
-
-    current_date += datetime.timedelta(days=1)
-
-with open('data/sbkp.txt', 'r', encoding='utf8') as file_handle:
-    data = file_handle.readlines()
-
-for line in data:
-    timetag = line.strip('\ufeff')[:10]
-    year = int(timetag[:4])
-    month = int(timetag[4:6])
-    day = int(timetag[6:8])
-    hour = int(timetag[8:10])
-
-    key1 = f"{day:02}/{month:02}/{year}"
-    key2 = f"{hour:02}"
-
-    raw_metar = line[13:].strip()
-
-    daily_stats[key1]["hourly_stats"][key2]["obs"]["raw_obs"].append(raw_metar)
-
-
-current_date = start_date
-while current_date < end_date:
-    key1 = current_date.strftime("%d/%m/%Y")
-    for i in range(24):
-        key2 = f'{i:02}'
-        n_obs = len(daily_stats[key1]["hourly_stats"][key2]["obs"]['raw_obs'])
-
-        if n_obs > 0:
-            for j in range(n_obs):
-                # Parse the METAR information
-                if "/////CB" not in daily_stats[key1]["hourly_stats"][key2]["obs"]['raw_obs'][j]:
-                    parsed_obs = Metar.Metar(
-                        daily_stats[key1]["hourly_stats"][key2]["obs"]['raw_obs'][j]
-                    )
-                    daily_stats[key1]["hourly_stats"][key2]["obs"][
-                        'parsed_obs'][parsed_obs.time.minute] = parsed_obs
-
-                # /////CB in METAR
-                # Assigns None to its place in the parsed_metar dict
-                else:
-                    info_minute = re.search(
-                        r'\d{4}(?P<min>\d{2})Z',
-                        daily_stats[key1]["hourly_stats"][key2]["obs"]['raw_obs'][j]
-                    )['min']
-                    daily_stats[key1]["hourly_stats"][key2]["obs"]["parsed_obs"
-                                                   ][int(info_minute)] = None
-
-            # Recalculate number of observations
-            # In case there are duplicate metar information
-            n_obs = len(daily_stats[key1]["hourly_stats"][key2]["obs"]['parsed_obs'])
-
-            # Compile the time, in minutes, of the observations
-            obs_minutes = list(
-                daily_stats[key1]["hourly_stats"][key2]["obs"]["parsed_obs"].keys()
-            )
+    else:
+        if args.incremental:
+            hourly_stats = compute_hourly_stats_incremental(args.input,
+                                                            args.max_validity)
 
-            # Calculate the duration of the observations
-            for j in range(n_obs - 1):
-                daily_stats[key1]["hourly_stats"][key2]["obs"]["obs_duration"].append(
-                    datetime.timedelta(minutes=(
-                        obs_minutes[j+1] - obs_minutes[j]
-                    ))
-                )
-
-            # Calculate the duration of the last observation
-            daily_stats[key1]["hourly_stats"][key2]["obs"]["obs_duration"].append(
-                datetime.timedelta(minutes=(60 - obs_minutes[-1]))
+        elif args.workers > 1:
+            hourly_stats = compute_hourly_stats_parallel(
+                args.input, args.workers, args.partition, args.max_validity
             )
 
-            # Calculate active runway times
-            for j in range(n_obs):
-                if daily_stats[key1]["hourly_stats"][key2]["obs"]["parsed_obs"][obs_minutes[j]] \
-                        is not None:
-
-                    if daily_stats[key1]["hourly_stats"][key2]["obs"]["parsed_obs"][obs_minutes[j]].wind_speed is not None:
-                        wind_speed = daily_stats[key1]["hourly_stats"][key2]["obs"]["parsed_obs"][obs_minutes[j]].wind_speed.value('kt')
-
-                    else:
-                        wind_speed = None
-
-                    if daily_stats[key1]["hourly_stats"][key2]["obs"][
-                            "parsed_obs"][obs_minutes[j]].wind_dir is not None:
-                        wind_dir = daily_stats[key1]["hourly_stats"][key2]["obs"][
-                            "parsed_obs"][obs_minutes[j]].wind_dir
-
-                    else:
-                        wind_dir = None
-
-                    if wind_speed is None or\
-                            wind_speed < 6 or \
-                            wind_dir is None or \
-                            (abs(wind_dir.value() - 149) > abs(
-                                wind_dir.value() - 239)):
-                        daily_stats[key1]["hourly_stats"][key2]["15_inuse_time"] += \
-                            daily_stats[key1]["hourly_stats"][key2]["obs"]["obs_duration"][j]
-
-                    else:
-                        daily_stats[key1]["hourly_stats"][key2]["33_inuse_time"] += \
-                            daily_stats[key1]["hourly_stats"][key2]["obs"]["obs_duration"][j]
-
-            # Calculate unavailable times
-            for j in range(n_obs):
-                # Cases where there's /////CB on METAR
-                if daily_stats[key1]["hourly_stats"][key2]["obs"]["parsed_obs"][obs_minutes[j]]\
-                        is None:
-
-                    for proc in procs:
-                        daily_stats[key1]["hourly_stats"][key2][f"unavailable_{proc}_time"] += \
-                            daily_stats[key1]["hourly_stats"][key2]["obs"]["obs_duration"][j]
-
-
-                # Cases where is a valid parsed METAR
-                else:
-                    for proc in procs:
-                        if not check_ops(
-                                proc,
-                                daily_stats[key1]["hourly_stats"][key2]["obs"]["parsed_obs"][obs_minutes[j]]
-                        ):
-                            daily_stats[key1]["hourly_stats"][key2][f"unavailable_{proc}_time"] += \
-                                daily_stats[key1]["hourly_stats"][key2]["obs"]["obs_duration"][j]
-
-        # There's no metar information for that hour
         else:
-            daily_stats[key1]["hourly_stats"][key2]["no_info_time"] += \
-                datetime.timedelta(hours=1)
-
-    no_info_time = datetime.timedelta(0)
-    r15_inuse_time = datetime.timedelta(0)
-    r33_inuse_time = datetime.timedelta(0)
-    for j in range(24):
-        no_info_time += \
-            daily_stats[key1]["hourly_stats"][f'{j:02}']['no_info_time']
-        r15_inuse_time += \
-            daily_stats[key1]["hourly_stats"][f'{j:02}']['15_inuse_time']
-        r33_inuse_time += \
-            daily_stats[key1]["hourly_stats"][f'{j:02}']['33_inuse_time']
-
-    daily_stats[key1]['no_info_time'] = no_info_time
-    daily_stats[key1]['15_inuse_time'] = r15_inuse_time
-    daily_stats[key1]['33_inuse_time'] = r33_inuse_time
-
-    for proc in procs:
-        unavailable_proc_time = datetime.timedelta(0)
-        for j in range(24):
-            unavailable_proc_time += \
-                daily_stats[key1]["hourly_stats"][f'{j:02}'][f'unavailable_{proc}_time']
-
-        daily_stats[key1][f'unavailable_{proc}_time'] = unavailable_proc_time
-
-    current_date += datetime.timedelta(days=1)
-
-month_stats = dict()
-
-# Create data structure
-current_date = start_date
-while current_date < end_date:
-    month_key = current_date.strftime("%m/%Y")
-    day_key = current_date.strftime("%d/%m/%Y")
-
-    if month_key not in month_stats:
-        month_stats[month_key] = {
-            "no_info_time": datetime.timedelta(0),
-            "33_inuse_time": datetime.timedelta(0),
-            "15_inuse_time": datetime.timedelta(0),
-            "unavailable_VFR_time": datetime.timedelta(0),
-            "unavailable_VFR-E_time": datetime.timedelta(0),
-            "unavailable_IFR-ILS_time": datetime.timedelta(0),
-            "unavailable_IFR-LNAV/VNAV_time": datetime.timedelta(0),
-            "unavailable_IFR-LNAV-PAB_time": datetime.timedelta(0),
-            "unavailable_IFR-LNAV-PCD_time": datetime.timedelta(0),
-            "unavailable_IFR-RNP030_time": datetime.timedelta(0),
-            "unavailable_IFR-RNP015_time": datetime.timedelta(0),
-        }
-
-    del daily_stats[day_key]['hourly_stats']
-    for key in daily_stats[day_key]:
-        month_stats[month_key][key] += \
-            daily_stats[day_key][key]
-
-    current_date += datetime.timedelta(days=1)
-
-labels = {
-    "no_info_time": 'Tempo sem informações válidas',
-    "33_inuse_time": 'Tempo que a pista 33 esteve em uso',
-    "15_inuse_time": 'Tempo que a pista 15 esteve em uso',
-    "unavailable_VFR_time": 'Tempo que o aeródromo não recebeu operações VFR',
-    "unavailable_VFR-E_time": 'Tempo que o aeródromo não recebeu operações VFR especial',
-    "unavailable_IFR-ILS_time": 'Tempo que o aeródromo não recebeu operações ILS',
-    "unavailable_IFR-LNAV/VNAV_time": 'Tempo que o aeródromo não recebeu operações LNAV/VNAV',
-    "unavailable_IFR-LNAV-PAB_time": 'Tempo que o aeródromo não recebeu operações LNAV (Performance A e B)',
-    "unavailable_IFR-LNAV-PCD_time": 'Tempo que o aeródromo não recebeu operações LNAV (Performance C e D)',
-    "unavailable_IFR-RNP030_time": 'Tempo que o aeródromo não recebeu operações RNP 0.3',
-    "unavailable_IFR-RNP015_time": 'Tempo que o aeródromo não recebeu operações RNP 0.15',
-}
-
-d = pd.DataFrame.from_dict(daily_stats, orient='index').rename(columns=labels)
-m = pd.DataFrame.from_dict(month_stats, orient='index').rename(columns=labels)
-
-d.to_excel('estatisticas diárias 2.xlsx')
-m.to_excel('estatisticas mensais 2.xlsx')
-print()
+            # Parsed once, later runs load the cached columns
+            obs = metar_store.load_archive(args.input)
+
+            hourly_stats = compute_hourly_stats(obs, *date_range(obs),
+                                                args.max_validity)
+
+        write_stats(hourly_stats,
+                    'estatisticas diárias 2',
+                    'estatisticas mensais 2',
+                    args.output_format)
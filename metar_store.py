@@ -0,0 +1,322 @@
+"""
+Parse-once columnar store of METAR archives
+
+Each line of an archive ("YYYYMMDDHH - <METAR>") is parsed a single time and
+only the fields needed by the statistics are kept, as typed NumPy columns.
+The columns are cached in a .npz file named after the SHA-256 of the source
+file, so later runs load them instead of parsing the archive again.
+"""
+import calendar
+import datetime
+import hashlib
+import math
+import os
+import re
+import warnings
+
+import numpy as np
+from metar import Metar
+
+import metar_tokenizer
+
+# Directory where the parsed archives are cached
+cache_dir = 'cache/'
+
+# Part of the cache key, to be bumped whenever the parsing changes
+store_version = 2
+
+# Stored columns. Missing information is stored as NaN
+columns = ('time', 'wind_dir', 'wind_speed', 'ceiling', 'vis', 'max_vis',
+           'rvr', 'cb')
+
+column_dtypes = {
+    'time': 'datetime64[m]',  # Observation time (UTC)
+    'wind_dir': np.float32,   # Wind direction in degrees
+    'wind_speed': np.float32,  # Wind speed in kt
+    'ceiling': np.float32,    # Lowest BKN/OVC layer base in ft
+    'vis': np.float32,        # Prevailing visibility in m
+    'max_vis': np.float32,    # Maximum visibility in m
+    'rvr': np.float32,        # Lowest runway visual range in m
+    'cb': np.bool_,           # /////CB in METAR
+}
+
+
+def file_hash(filepath: str) -> str:
+    """
+Returns the SHA-256 hex digest of a file's content
+
+    :param filepath: path to the file
+    :return: hex digest
+    """
+    digest = hashlib.sha256()
+    with open(filepath, 'rb') as file_handle:
+        for chunk in iter(lambda: file_handle.read(1 << 20), b''):
+            digest.update(chunk)
+
+    return digest.hexdigest()
+
+
+def extract_fields(metar: Metar.Metar) -> tuple:
+    """
+Extracts from a parsed METAR the fields used by the statistics
+
+    :param metar: parsed METAR
+    :return: (wind_dir, wind_speed, ceiling, vis, max_vis, rvr), NaN where
+             the information is not reported
+    """
+    wind_dir = metar.wind_dir.value() \
+        if metar.wind_dir is not None else math.nan
+    wind_speed = metar.wind_speed.value('kt') \
+        if metar.wind_speed is not None else math.nan
+
+    ceiling_heights = [layer[1].value('ft') for layer in metar.sky
+                       if layer[0].upper() in {'BKN', 'OVC'}
+                       and layer[1] is not None]
+    ceiling = min(ceiling_heights) if ceiling_heights else math.nan
+
+    vis = metar.vis.value('m') if metar.vis is not None else math.nan
+    max_vis = metar.max_vis.value('m') \
+        if metar.max_vis is not None else math.nan
+
+    runway_visibilities = [runway[1].value('m') for runway in metar.runway]
+    rvr = min(runway_visibilities) if runway_visibilities else math.nan
+
+    return wind_dir, wind_speed, ceiling, vis, max_vis, rvr
+
+
+def min_visibility(vis, max_vis, rvr):
+    """
+Returns the lowest of the reported visibilities, ignoring the ones not
+reported. Works on single values and on columns alike
+
+    :param vis: prevailing visibility in m
+    :param max_vis: maximum visibility in m
+    :param rvr: lowest runway visual range in m
+    :return: lowest visibility in m, NaN if none was reported
+    """
+    return np.fmin(np.fmin(vis, max_vis), rvr)
+
+
+def obs_minute(year: int, month: int, day: int, hour: int,
+               minute: int) -> int:
+    """
+Returns an observation time as minutes since the Unix epoch (UTC)
+
+    :return: minutes since 1970-01-01 00:00
+    """
+    return calendar.timegm(
+        datetime.datetime(year, month, day, hour, minute).timetuple()
+    ) // 60
+
+
+# Station ID of a report, after the optional METAR/SPECI and COR groups
+station_re = re.compile(
+    r'^(?:(?:METAR|SPECI)\s+)?(?:COR\s+)?(?P<station>[A-Z][A-Z0-9]{3})\s'
+)
+
+
+def station_id(line: str):
+    """
+Returns the station ID of an archive line
+
+    :param line: archive line, "YYYYMMDDHH - <METAR>"
+    :return: station ID, or None when the line holds no report
+    """
+    line = line.strip('\ufeff')
+    if not line[:10].isdigit():
+        return None
+
+    match = station_re.match(line[13:].strip())
+    if match is None:
+        return None
+
+    return match['station']
+
+
+def parse_line(line: str):
+    """
+Parses one archive line into the stored fields
+
+    :param line: archive line, "YYYYMMDDHH - <METAR>"
+    :return: (time, wind_dir, wind_speed, ceiling, vis, max_vis, rvr, cb),
+             with time in minutes since the epoch, or None when the line holds
+             no valid report
+    """
+    line = line.strip('\ufeff')
+    timetag = line[:10]
+    if not timetag.isdigit():
+        return None
+
+    year = int(timetag[:4])
+    month = int(timetag[4:6])
+    day = int(timetag[6:8])
+    hour = int(timetag[8:10])
+
+    # Corrected reports come as "SBKP COR ...", which the parser rejects
+    raw_metar = re.sub(r'\b([A-Z]{4}) COR ', r'\1 ', line[13:].strip())
+
+    # /////CB in METAR, only the observation time is kept
+    if '/////CB' in raw_metar:
+        info_minute = re.search(r'\d{4}(?P<min>\d{2})Z', raw_metar)
+        if info_minute is None:
+            return None
+
+        return (obs_minute(year, month, day, hour, int(info_minute['min'])),
+                math.nan, math.nan, math.nan, math.nan, math.nan, math.nan,
+                True)
+
+    # Reports in the usual layout skip the full decoding
+    fields = metar_tokenizer.tokenize(raw_metar)
+
+    if fields is None:
+        with warnings.catch_warnings():
+            # Unparsed trailing groups are common and don't affect the
+            # stored fields
+            warnings.filterwarnings('ignore', message='Unparsed groups',
+                                    category=RuntimeWarning)
+            parsed_obs = Metar.Metar(raw_metar, month=month, year=year,
+                                     strict=False)
+
+        # Not a report (e.g. "Mensagem ... não localizada")
+        if parsed_obs.time is None:
+            return None
+
+        fields = (parsed_obs.time.minute, *extract_fields(parsed_obs))
+
+    return (obs_minute(year, month, day, hour, fields[0]), *fields[1:], False)
+
+
+def to_columns(rows: list) -> dict:
+    """
+Converts parsed rows into typed columns
+
+    :param rows: list of tuples as returned by parse_line
+    :return: dict of column name to NumPy array
+    """
+    if rows:
+        values = list(zip(*rows))
+    else:
+        values = [()] * len(columns)
+
+    obs = dict()
+    for name, column in zip(columns, values):
+        if name == 'time':
+            obs[name] = np.array(column, dtype=np.int64).astype('datetime64[m]')
+        else:
+            obs[name] = np.array(column, dtype=column_dtypes[name])
+
+    return obs
+
+
+def parse_lines(lines) -> dict:
+    """
+Parses archive lines into typed columns
+
+    :param lines: iterable of archive lines
+    :return: dict of column name to NumPy array, one entry per valid report,
+             in line order
+    """
+    return to_columns([row for row in map(parse_line, lines)
+                       if row is not None])
+
+
+def iter_archive(filepath: str):
+    """
+Reads a METAR archive line by line, yielding each valid report as soon as
+it's parsed
+
+    :param filepath: path to the archive
+    :return: generator of tuples as returned by parse_line, in file order
+    """
+    with open(filepath, 'r', encoding='utf8') as file_handle:
+        for line in file_handle:
+            row = parse_line(line)
+            if row is not None:
+                yield row
+
+
+def parse_archive(filepath: str) -> dict:
+    """
+Parses a whole METAR archive into typed columns
+
+    :param filepath: path to the archive
+    :return: dict of column name to NumPy array, one entry per valid report,
+             in file order
+    """
+    with open(filepath, 'r', encoding='utf8') as file_handle:
+        return parse_lines(file_handle)
+
+
+def cache_path(filepath: str, cache_directory: str = cache_dir) -> str:
+    """
+Returns the path of the cached columns of an archive, named after the hash
+of its content
+
+    :param filepath: path to the archive
+    :param cache_directory: directory holding the cached columns
+    :return: path to the .npz file
+    """
+    return os.path.join(
+        cache_directory, f'{file_hash(filepath)}-v{store_version}.npz'
+    )
+
+
+def load_cached(path: str):
+    """
+Loads cached columns
+
+    :param path: path to the .npz file, as returned by cache_path
+    :return: dict of column name to NumPy array, or None if not cached
+    """
+    if not os.path.isfile(path):
+        return None
+
+    with np.load(path) as cached:
+        return {name: cached[name] for name in columns}
+
+
+def save_cached(path: str, obs: dict) -> None:
+    """
+Saves columns to the cache, atomically
+
+    :param path: path to the .npz file, as returned by cache_path
+    :param obs: dict of column name to NumPy array
+    """
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'wb') as file_handle:
+        np.savez(file_handle, **obs)
+    os.replace(tmp_path, path)
+
+
+def concat_columns(partitions: list) -> dict:
+    """
+Concatenates the columns of consecutive partitions of an archive
+
+    :param partitions: list of dicts of column name to NumPy array
+    :return: dict of column name to NumPy array
+    """
+    if not partitions:
+        return to_columns([])
+
+    return {name: np.concatenate([obs[name] for obs in partitions])
+            for name in columns}
+
+
+def load_archive(filepath: str, cache_directory: str = cache_dir) -> dict:
+    """
+Loads the columns of a METAR archive, parsing it only if its content has
+not been cached before
+
+    :param filepath: path to the archive
+    :param cache_directory: directory holding the cached columns
+    :return: dict of column name to NumPy array
+    """
+    path = cache_path(filepath, cache_directory)
+
+    obs = load_cached(path)
+    if obs is None:
+        obs = parse_archive(filepath)
+        save_cached(path, obs)
+
+    return obs
@@ -0,0 +1,118 @@
+"""
+Validity timeline of METAR observations
+
+The observations are sorted once and turned into validity intervals: each
+report is valid until the next one, limited to a maximum validity. Any
+statistic is then the time covered by the intervals inside each bucket
+(minute, hour, day, month or a custom width), computed from cumulative sums
+in a single pass instead of looping over hours.
+
+All times are in minutes since the Unix epoch.
+"""
+import numpy as np
+
+
+def validity_intervals(obs_minutes: np.ndarray,
+                       max_validity: int = None) -> tuple:
+    """
+Sorts the observations and builds their validity intervals. In case there
+are duplicate observation times, the last one is kept
+
+    :param obs_minutes: observation times, in any order
+    :param max_validity: maximum validity of a report, in minutes. None keeps
+           each report valid only until the end of its hour
+    :return: (rows, starts, ends), the index in obs_minutes of the observation
+             of each interval and the interval limits, ends exclusive. The
+             intervals are sorted and don't overlap
+    """
+    rows = np.argsort(obs_minutes, kind='stable')
+    starts = obs_minutes[rows]
+
+    # No observations, no intervals
+    if not len(starts):
+        return rows, starts, starts.copy()
+
+    is_last = np.append(starts[1:] != starts[:-1], True)
+    rows = rows[is_last]
+    starts = starts[is_last]
+
+    if max_validity is None:
+        limits = (starts // 60 + 1) * 60
+    else:
+        limits = starts + max_validity
+
+    # Valid until the next report, or until the limit
+    ends = np.minimum(np.append(starts[1:], np.iinfo(np.int64).max), limits)
+
+    return rows, starts, ends
+
+
+def bucket_edges(start_minute: int, end_minute: int, bucket) -> np.ndarray:
+    """
+Returns the edges of the buckets covering a range
+
+    :param start_minute: start of the range
+    :param end_minute: end of the range (exclusive)
+    :param bucket: 'minute', 'hour', 'day', 'month' or a width in minutes.
+           Months start on the first day of each calendar month
+    :return: array of edges, from start_minute to end_minute
+    """
+    if bucket == 'month':
+        months = np.arange(
+            np.datetime64(start_minute, 'm').astype('datetime64[M]'),
+            np.datetime64(end_minute, 'm').astype('datetime64[M]') + 1
+        )
+        inner = months.astype('datetime64[m]').astype(np.int64)
+        inner = inner[(inner > start_minute) & (inner < end_minute)]
+
+        return np.concatenate([[start_minute], inner, [end_minute]])
+
+    width = {'minute': 1, 'hour': 60, 'day': 1440}.get(bucket, bucket)
+    if not isinstance(width, int) or width <= 0:
+        raise ValueError(f'Invalid bucket: {bucket}')
+
+    return np.append(np.arange(start_minute, end_minute, width), end_minute)
+
+
+def covered_minutes(starts: np.ndarray,
+                    ends: np.ndarray,
+                    weights: np.ndarray,
+                    edges: np.ndarray) -> np.ndarray:
+    """
+Sums, for each bucket, the minutes covered by the validity intervals. Each
+column of weights selects (1) or ignores (0) every interval
+
+    :param starts: interval starts, as returned by validity_intervals
+    :param ends: interval ends, as returned by validity_intervals
+    :param weights: integer or boolean array (intervals x columns)
+    :param edges: bucket edges, as returned by bucket_edges
+    :return: array of minutes (buckets x columns)
+    """
+    weights = weights.astype(np.int64)
+
+    # Covered minutes of each column up to the end of each interval
+    cumulative = np.zeros((len(starts) + 1, weights.shape[1]), dtype=np.int64)
+    cumulative[1:] = np.cumsum((ends - starts)[:, np.newaxis] * weights, axis=0)
+
+    # Intervals ended at each edge, plus the part of the one going on
+    ended = np.searchsorted(ends, edges, side='right')
+    covered = cumulative[ended]
+
+    going_on = np.minimum(ended, len(starts) - 1)
+    if len(starts) > 0:
+        partial = np.where((ended < len(starts)) & (starts[going_on] < edges),
+                           edges - starts[going_on], 0)
+        covered += partial[:, np.newaxis] * weights[going_on]
+
+    return np.diff(covered, axis=0)
+
+
+def count_starts(starts: np.ndarray, edges: np.ndarray) -> np.ndarray:
+    """
+Counts the intervals starting inside each bucket
+
+    :param starts: interval starts, as returned by validity_intervals
+    :param edges: bucket edges, as returned by bucket_edges
+    :return: array of counts (buckets)
+    """
+    return np.diff(np.searchsorted(starts, edges, side='left'))
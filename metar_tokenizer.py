@@ -0,0 +1,79 @@
+"""
+Fast-path METAR tokenizer
+
+gen_stats.py only needs a few fields of each report: the observation minute,
+wind, visibilities, RVR and the BKN/OVC layers. Instead of decoding every
+group with Metar.Metar, a single compiled regular expression matches the
+usual layout of a report up to its temperature group and extracts just those
+fields. Reports outside that layout are left to Metar.Metar (tokenize returns
+None for them).
+"""
+import math
+import re
+
+# Weather phenomena codes, as accepted by Metar.Metar
+weather_codes = 'MI|PR|BC|DR|BL|SH|TS|FZ|DZ|RA|SN|SG|IC|PL|GR|GS|UP|' \
+                'BR|FG|FU|VA|DU|SA|HZ|PY|PO|SQ|FC|SS|DS|NSW'
+
+report_re = re.compile(
+    r"""^(?:(?:METAR|SPECI)\s+)?
+        (?:COR\s+)?
+        [A-Z][A-Z0-9]{3}\s+
+        (?:COR\s+)?
+        \d{4}(?P<min>\d\d)Z\s+
+        (?:(?:AUTO|COR)\s+)?
+        (?P<wind_dir>\d{3}|VRB)(?P<wind_speed>\d{2,3})(?:G\d{2,3})?KT\s+
+        (?:\d{3}V\d{3}\s+)?
+        (?:CAVOK\s+
+         |(?P<vis>\d{4})(?:[NSEW][EW]?|NDV)?\s+
+          (?:(?P<max_vis>\d{4})(?:[NSEW][EW]?|NDV)?\s+)?)
+        (?P<runway>(?:R\d\d(?:RR?|LL?|C)?/[MP]?\d{4}(?:V[MP]?\d{4})?[/NDU]*\s+)*)
+        (?:(?:[-+]|VC)*(?:""" + weather_codes + r""")+\s+)*
+        (?P<sky>(?:(?:FEW|SCT|BKN|OVC|VV)\d{3}(?:CB|TCU)?\s+
+                  |(?:NSC|SKC|NCD|CLR)\s+)*)
+        M?\d\d/M?\d\d\s""",
+    re.VERBOSE,
+)
+
+runway_re = re.compile(r'R[^/]+/[MP]?(?P<low>\d{4})')
+ceiling_re = re.compile(r'(?:BKN|OVC)(?P<height>\d{3})')
+
+
+def tokenize(raw_metar: str):
+    """
+Extracts the fields used by the statistics from a report in the usual
+layout, without decoding the other groups
+
+    :param raw_metar: raw METAR report
+    :return: (minute, wind_dir, wind_speed, ceiling, vis, max_vis, rvr), NaN
+             where the information is not reported, or None when the report
+             must be parsed by Metar.Metar
+    """
+    match = report_re.match(f'{raw_metar.rstrip("=")} ')
+    if match is None:
+        return None
+
+    wind_dir = float(match['wind_dir']) \
+        if match['wind_dir'] != 'VRB' else math.nan
+
+    # CAVOK and 9999 are both reported by Metar.Metar as 10000 m
+    vis = match['vis']
+    vis = float(vis) if vis is not None and vis != '9999' else 10000.0
+
+    max_vis = match['max_vis']
+    if max_vis is None:
+        max_vis = math.nan
+    else:
+        max_vis = float(max_vis) if max_vis != '9999' else 10000.0
+
+    runway_visibilities = [float(group['low']) for group
+                           in runway_re.finditer(match['runway'])]
+    rvr = min(runway_visibilities) if runway_visibilities else math.nan
+
+    ceiling_heights = [int(group['height']) * 100.0 for group
+                       in ceiling_re.finditer(match['sky'])]
+    ceiling = min(ceiling_heights) if ceiling_heights else math.nan
+
+    return (int(match['min']), wind_dir, float(match['wind_speed']), ceiling,
+            vis, max_vis, rvr)
+
@@ -0,0 +1,145 @@
+"""
+Typed output sinks for the tables written by the scripts
+
+A sink writes a table row by row, keeping durations as numeric seconds
+instead of text, so the tables load back as numbers:
+    - csv: plain CSV file
+    - xlsx: openpyxl write-only workbook, rows are streamed to disk so the
+      memory use doesn't grow with the table
+    - parquet: Parquet file, typed columns. Needs pyarrow or fastparquet,
+      the rows are held in memory until the sink is closed
+"""
+import csv
+import datetime
+
+import numpy as np
+import pandas as pd
+from openpyxl import Workbook
+
+# File extension of each sink
+extensions = {
+    'csv': '.csv',
+    'xlsx': '.xlsx',
+    'parquet': '.parquet',
+}
+
+output_formats = list(extensions)
+
+
+def cell_value(value):
+    """
+Converts a value into a typed cell: durations become seconds, NumPy scalars
+become Python ones and other non-scalar values become text
+
+    :param value: any value of a table
+    :return: value to be written
+    """
+    if value is pd.NaT:
+        return None
+
+    if isinstance(value, datetime.timedelta):
+        return value.total_seconds()
+
+    if isinstance(value, np.timedelta64):
+        return value / np.timedelta64(1, 's')
+
+    if isinstance(value, np.generic):
+        return value.item()
+
+    if isinstance(value, (list, tuple, dict)):
+        return str(value)
+
+    return value
+
+
+class CsvSink:
+    """
+Writes a table to a CSV file
+    """
+    def __init__(self, filepath: str, columns: list):
+        self.file_handle = open(filepath, 'w', newline='', encoding='utf8')
+        self.writer = csv.writer(self.file_handle)
+        self.writer.writerow(columns)
+
+    def write_row(self, row) -> None:
+        self.writer.writerow([cell_value(value) for value in row])
+
+    def close(self) -> None:
+        self.file_handle.close()
+
+
+class XlsxSink:
+    """
+Writes a table to an xlsx workbook in openpyxl's write-only mode
+    """
+    def __init__(self, filepath: str, columns: list):
+        self.filepath = filepath
+        self.workbook = Workbook(write_only=True)
+        self.sheet = self.workbook.create_sheet()
+        self.sheet.append(columns)
+
+    def write_row(self, row) -> None:
+        self.sheet.append([cell_value(value) for value in row])
+
+    def close(self) -> None:
+        self.workbook.save(self.filepath)
+
+
+class ParquetSink:
+    """
+Writes a table to a Parquet file once it's closed
+    """
+    def __init__(self, filepath: str, columns: list):
+        self.filepath = filepath
+        self.columns = columns
+        self.rows = list()
+
+    def write_row(self, row) -> None:
+        self.rows.append([cell_value(value) for value in row])
+
+    def close(self) -> None:
+        pd.DataFrame(self.rows, columns=self.columns).to_parquet(
+            self.filepath, index=False
+        )
+
+
+sinks = {
+    'csv': CsvSink,
+    'xlsx': XlsxSink,
+    'parquet': ParquetSink,
+}
+
+
+def open_sink(filepath: str, columns: list, output_format: str):
+    """
+Opens a sink to write a table row by row. It must be closed to complete the
+file
+
+    :param filepath: path of the file, without extension
+    :param columns: column names
+    :param output_format: one of output_formats
+    :return: sink, with write_row(row) and close()
+    """
+    if output_format not in sinks:
+        raise ValueError(f'Unknown output format: {output_format}')
+
+    return sinks[output_format](f'{filepath}{extensions[output_format]}',
+                                [str(column) for column in columns])
+
+
+def write_table(filepath: str, columns: list, rows,
+                output_format: str) -> None:
+    """
+Writes a whole table through a sink
+
+    :param filepath: path of the file, without extension
+    :param columns: column names
+    :param rows: iterable of rows, each a sequence of values in column order
+    :param output_format: one of output_formats
+    """
+    sink = open_sink(filepath, columns, output_format)
+    try:
+        for row in rows:
+            sink.write_row(row)
+    finally:
+        sink.close()
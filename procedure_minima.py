@@ -0,0 +1,87 @@
+"""
+Procedure minima of SBKP and their evaluation over whole METAR columns
+
+The minima are held in a single table (procedure x runway in use) and checked
+with array operations over all observations at once, giving an
+observations x procedures availability matrix. SBKP is the
+aerodromes.Aerodrome of its entry in aerodromes.json, the same definition
+used by the multi-aerodrome batch run.
+"""
+import functools
+import os
+
+import numpy as np
+
+import aerodromes
+
+# Aerodrome definition file, next to this module
+aerodromes_path = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                               'aerodromes.json')
+
+sbkp = aerodromes.load_aerodromes(aerodromes_path)['SBKP']
+
+# Runways, in the order used by the minima arrays
+runways = sbkp.runways
+
+# Minima per procedure and runway in use: (ceiling in ft, visibility in m).
+# None where the procedure is not published for the runway
+minima = sbkp.minima
+
+procs = sbkp.procs
+
+# Names of the procedures in the exported tables
+labels = sbkp.labels
+
+# Minima as (procedure, runway) arrays. Procedures not published get an
+# infinite minimum, so they're never available
+ceiling_minima = sbkp.ceiling_minima
+visibility_minima = sbkp.visibility_minima
+
+
+@functools.lru_cache(maxsize=None)
+def runway_in_use(wind_dir: float, wind_speed: float) -> str:
+    """
+Returns the runway in use for a single reported wind, as selected by
+sbkp.runway_in_use. Remembered per wind, as the reported winds are few
+
+    :param wind_dir: wind direction in degrees, NaN if not reported
+    :param wind_speed: wind speed in kt, NaN if not reported
+    :return: one of runways
+    """
+    return runways[int(sbkp.runway_in_use(wind_dir, wind_speed))]
+
+
+def get_minima(op: str, runway: str) -> tuple:
+    """
+Returns the minima of a procedure for the runway in use
+
+    :param op: operation type, one of procs
+    :param runway: runway in use, one of runways
+    :return: (ceiling in ft, visibility in m), None if the procedure is not
+             published for the runway
+    """
+    if op.upper() not in minima:
+        raise ValueError('Operation type not found')
+
+    return minima[op.upper()][runway]
+
+
+def availability_matrix(wind_dir: np.ndarray,
+                        wind_speed: np.ndarray,
+                        ceiling: np.ndarray,
+                        visibility: np.ndarray,
+                        cb: np.ndarray) -> np.ndarray:
+    """
+Evaluates every procedure over every observation at once
+
+    :param wind_dir: wind direction column in degrees, NaN if not reported
+    :param wind_speed: wind speed column in kt, NaN if not reported
+    :param ceiling: lowest BKN/OVC layer base column in ft, NaN if there's
+           none
+    :param visibility: lowest visibility column in m, NaN if none was reported
+    :param cb: /////CB flag column, those observations close every procedure
+    :return: boolean array (observations x procs), True where the procedure
+             was available
+    """
+    return sbkp.availability_matrix(wind_dir, wind_speed, ceiling, visibility,
+                                    cb)
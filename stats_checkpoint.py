@@ -0,0 +1,164 @@
+"""
+Checkpoint of the statistics of an append-only METAR archive
+
+The checkpoint holds the hourly statistics already computed, the byte offset
+up to which the archive was processed, the SHA-256 of the first and last
+bytes of the processed part, the size and modification time of the archive
+and the reports still needed to recompute the last day. Checking the
+processed part reads at most two windows of it, whatever its size. When new reports are
+appended to the archive, only the new tail is parsed and only the days it
+touches are recomputed.
+"""
+import datetime
+import hashlib
+import io
+import os
+
+import numpy as np
+
+import metar_store
+from stats_store import HourlyStats
+
+# Part of the checkpoint name, to be bumped whenever its content changes
+checkpoint_version = 2
+
+# Bytes hashed at each end of the processed part
+window_size = 1 << 20
+
+# Reference for the day ordinals of the statistics
+epoch = datetime.datetime(1970, 1, 1)
+
+
+def checkpoint_path(filepath: str,
+                    max_validity: int = None,
+                    cache_directory: str = metar_store.cache_dir) -> str:
+    """
+Returns the path of the checkpoint of an archive, named after its absolute
+path. Each max_validity has its own checkpoint
+
+    :param filepath: path to the archive
+    :param max_validity: maximum validity of a report, in minutes
+    :param cache_directory: directory holding the checkpoints
+    :return: path to the .npz file
+    """
+    name = hashlib.sha256(os.path.abspath(filepath).encode('utf8')).hexdigest()
+    validity = max_validity if max_validity is not None else 'hour'
+
+    return os.path.join(
+        cache_directory,
+        f'{name}-checkpoint-{validity}-v{checkpoint_version}'
+        f'-s{metar_store.store_version}.npz'
+    )
+
+
+def window_hash(filepath: str, size: int) -> str:
+    """
+Returns the SHA-256 hex digest of the first bytes of a file, from the
+window_size bytes at each end of them and their number
+
+    :param filepath: path to the file
+    :param size: number of bytes
+    :return: hex digest
+    """
+    digest = hashlib.sha256(str(size).encode('utf8'))
+    with open(filepath, 'rb') as file_handle:
+        digest.update(file_handle.read(min(size, window_size)))
+
+        tail_start = max(size - window_size, window_size)
+        if tail_start < size:
+            file_handle.seek(tail_start)
+            digest.update(file_handle.read(size - tail_start))
+
+    return digest.hexdigest()
+
+
+def read_tail(filepath: str, offset: int) -> tuple:
+    """
+Reads the lines of an archive after a byte offset
+
+    :param filepath: path to the archive
+    :param offset: byte offset of the first line to read
+    :return: (complete lines, unterminated last line or '', offset after the
+             last complete line)
+    """
+    with open(filepath, 'rb') as file_handle:
+        file_handle.seek(offset)
+        data = file_handle.read()
+
+    # An unterminated last line may still be being written
+    end = data.rfind(b'\n') + 1
+
+    # Split the same way as reading the archive as a text file
+    lines = list(io.TextIOWrapper(io.BytesIO(data[:end]), encoding='utf8'))
+
+    return lines, data[end:].decode('utf8', errors='replace'), offset + end
+
+
+def load_checkpoint(path: str, filepath: str):
+    """
+Loads the checkpoint of an archive, provided the part of the archive it
+covers has not changed since
+
+    :param path: path to the .npz file, as returned by checkpoint_path
+    :param filepath: path to the archive
+    :return: dict with 'offset', 'stats' (HourlyStats) and 'obs' (columns of
+             the reports kept to recompute the last day), or None if there's
+             no valid checkpoint
+    """
+    if not os.path.isfile(path):
+        return None
+
+    with np.load(path) as saved:
+        offset = int(saved['offset'])
+        source_hash = str(saved['source_hash'])
+        source_size = int(saved['source_size'])
+        source_mtime = int(saved['source_mtime'])
+        start_day = int(saved['start_day'])
+        seconds = saved['seconds']
+        obs = {name: saved[f'obs_{name}'] for name in metar_store.columns}
+
+    # The archive must only have grown since the checkpoint. An archive with
+    # the same size and modification time wasn't touched
+    stat = os.stat(filepath)
+    if (stat.st_size, stat.st_mtime_ns) != (source_size, source_mtime) \
+            and (stat.st_size < offset
+                 or window_hash(filepath, offset) != source_hash):
+        return None
+
+    return {
+        'offset': offset,
+        'stats': HourlyStats(epoch + datetime.timedelta(days=start_day),
+                             seconds),
+        'obs': obs,
+    }
+
+
+def save_checkpoint(path: str,
+                    filepath: str,
+                    offset: int,
+                    stats: HourlyStats,
+                    obs: dict) -> None:
+    """
+Saves the checkpoint of an archive, atomically
+
+    :param path: path to the .npz file, as returned by checkpoint_path
+    :param filepath: path to the archive
+    :param offset: byte offset up to which the archive was processed
+    :param stats: hourly statistics of the processed reports
+    :param obs: columns of the reports kept to recompute the last day
+    """
+    stat = os.stat(filepath)
+
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'wb') as file_handle:
+        np.savez(file_handle,
+                 offset=offset,
+                 source_hash=window_hash(filepath, offset),
+                 source_size=stat.st_size,
+                 source_mtime=stat.st_mtime_ns,
+                 start_day=(stats.start_date - epoch).days,
+                 seconds=stats.seconds,
+                 **{f'obs_{name}': column for name, column in obs.items()})
+    os.replace(tmp_path, path)
+
@@ -0,0 +1,81 @@
+"""
+Array-backed store of the hourly statistics of gen_stats.py
+
+The statistics are held as a single NumPy integer array of seconds, indexed by
+day x hour x metric. Daily and monthly statistics are sums over its axes.
+"""
+import datetime
+
+import numpy as np
+
+import procedure_minima
+
+# Metrics of the last axis of SBKP, in order. Other aerodromes have the
+# metrics of their own runways and procedures, see aerodromes.Aerodrome
+metrics = procedure_minima.sbkp.metrics
+
+
+class HourlyStats:
+    """
+Hourly statistics, in seconds, of a range of whole days
+    """
+    __slots__ = ('start_date', 'seconds')
+
+    def __init__(self, start_date: datetime.datetime, seconds: np.ndarray):
+        """
+    :param start_date: first day of the statistics
+    :param seconds: array of seconds (days x 24 x metrics)
+        """
+        self.start_date = start_date
+        self.seconds = seconds
+
+    @classmethod
+    def concat(cls, parts: list) -> 'HourlyStats':
+        """
+Joins statistics of consecutive ranges of days
+
+    :param parts: list of HourlyStats, in time order and without gaps
+        """
+        return cls(parts[0].start_date,
+                   np.concatenate([part.seconds for part in parts]))
+
+    @property
+    def end_date(self) -> datetime.datetime:
+        return self.start_date + datetime.timedelta(days=len(self.seconds))
+
+    def dates(self) -> list:
+        return [self.start_date + datetime.timedelta(days=day)
+                for day in range(len(self.seconds))]
+
+    def select(self, start_date: datetime.datetime,
+               end_date: datetime.datetime) -> 'HourlyStats':
+        """
+Returns the statistics of a range of days inside this one
+        """
+        first = (start_date - self.start_date).days
+        last = (end_date - self.start_date).days
+
+        return HourlyStats(start_date, self.seconds[first:last])
+
+    def daily(self) -> tuple:
+        """
+    :return: (day keys "dd/mm/YYYY", array of seconds (days x metrics))
+        """
+        return [date.strftime("%d/%m/%Y") for date in self.dates()], \
+            self.seconds.sum(axis=1)
+
+    def monthly(self) -> tuple:
+        """
+    :return: (month keys "mm/YYYY", array of seconds (months x metrics))
+        """
+        month_keys = [date.strftime("%m/%Y") for date in self.dates()]
+
+        # First day of each month in the range
+        month_starts = [day for day in range(len(month_keys))
+                        if day == 0 or month_keys[day] != month_keys[day - 1]]
+
+        if not month_starts:
+            return [], np.zeros((0, self.seconds.shape[-1]), dtype=np.int64)
+
+        return [month_keys[day] for day in month_starts], \
+            np.add.reduceat(self.seconds.sum(axis=1), month_starts, axis=0)
@@ -0,0 +1,270 @@
+"""
+Flight tracks as columns
+
+A Track keeps each field of the positions of a flight in its own NumPy array
+instead of a list of Python objects per position:
+    - timestamps: epoch seconds (UTC), int64
+    - latitudes, longitudes: decimal degrees, float64
+    - altitudes: feet, float32
+    - speeds: knots, float32
+    - headings: degrees, float32
+    - rates_of_climb: feet per minute, int32, set by get_flight_time
+    - phases: flight phase code (see phases), int8, set by get_flight_time
+
+Altitudes, speeds and headings are reported as integers, so float32 keeps
+them exact.
+
+The columns read from a track file are cached in a binary file, one block per
+column after a small header, which later runs map into memory instead of
+parsing the text again. The header keeps the modification time and size of
+the track file, and the cache is written again when either changes.
+"""
+import csv
+import datetime
+import hashlib
+import json
+import os
+import struct
+
+import numpy as np
+
+epoch = datetime.datetime(1970, 1, 1)
+
+# Directory where the tracks are cached
+cache_dir = 'cache/tracks/'
+
+# Part of the cached file format, to be bumped whenever it changes
+cache_version = 1
+
+# Start of a cached track, followed by the length of its JSON header
+cache_magic = f'TRACK{cache_version:03d}'.encode('ascii')
+
+# Cached columns, in file order
+cached_columns = {
+    'timestamps': np.int64,
+    'latitudes': np.float64,
+    'longitudes': np.float64,
+    'altitudes': np.float32,
+    'speeds': np.float32,
+    'headings': np.float32,
+}
+
+# Flight phases by code, code 0 is a position without a phase
+phases = (None, 'parked', 'taxi', 'takeoff', 'landing', 'descent_step',
+          'cruise', 'climb', 'descent')
+
+phase_codes = {phase: code for code, phase in enumerate(phases)}
+
+
+class Track:
+    """
+Positions reported by a flight, in time order
+    """
+    __slots__ = ('callsign', 'timestamps', 'latitudes', 'longitudes',
+                 'altitudes', 'speeds', 'headings', 'rates_of_climb',
+                 'phases')
+
+    def __init__(self,
+                 timestamps,
+                 latitudes,
+                 longitudes,
+                 altitudes,
+                 speeds,
+                 headings,
+                 callsign: str = None):
+        """
+    :param timestamps: epoch seconds (UTC) of the positions
+    :param latitudes: latitudes in decimal format
+    :param longitudes: longitudes in decimal format
+    :param altitudes: altitudes in feet
+    :param speeds: ground speeds in knots
+    :param headings: headings in degrees
+    :param callsign: callsign reported by the flight
+        """
+        self.callsign = callsign
+        self.timestamps = np.asarray(timestamps, dtype=np.int64)
+        self.latitudes = np.asarray(latitudes, dtype=np.float64)
+        self.longitudes = np.asarray(longitudes, dtype=np.float64)
+        self.altitudes = np.asarray(altitudes, dtype=np.float32)
+        self.speeds = np.asarray(speeds, dtype=np.float32)
+        self.headings = np.asarray(headings, dtype=np.float32)
+        self.rates_of_climb = np.zeros(len(self.timestamps), dtype=np.int32)
+        self.phases = np.zeros(len(self.timestamps), dtype=np.int8)
+
+    @classmethod
+    def from_csv(cls, filepath: str):
+        """
+Reads a Flightradar24 track file: Timestamp, UTC, Callsign, Position
+("latitude,longitude"), Altitude, Speed and Direction columns
+
+    :param filepath: path to the .csv file
+    :return: Track
+        """
+        with open(filepath, 'r') as file_handle:
+            reader = csv.reader(file_handle)
+            # Skip CSV header
+            next(reader, None)
+            rows = [line for line in reader]
+
+        positions = [row[3].split(',') for row in rows]
+
+        return cls(
+            np.fromiter((row[0] for row in rows), dtype=np.int64,
+                        count=len(rows)),
+            np.fromiter((position[0] for position in positions),
+                        dtype=np.float64, count=len(rows)),
+            np.fromiter((position[1] for position in positions),
+                        dtype=np.float64, count=len(rows)),
+            np.fromiter((row[4] for row in rows), dtype=np.float32,
+                        count=len(rows)),
+            np.fromiter((row[5] for row in rows), dtype=np.float32,
+                        count=len(rows)),
+            np.fromiter((row[6] for row in rows), dtype=np.float32,
+                        count=len(rows)),
+            callsign=rows[0][2] if rows else None
+        )
+
+    def __len__(self) -> int:
+        return len(self.timestamps)
+
+    @property
+    def nbytes(self) -> int:
+        """
+Memory used by the position arrays, in bytes
+        """
+        return sum(getattr(self, name).nbytes for name
+                   in [*cached_columns, 'rates_of_climb', 'phases'])
+
+    def datetime(self, index: int) -> datetime.datetime:
+        """
+Time of a position, as a naive UTC datetime
+        """
+        return epoch + datetime.timedelta(seconds=int(self.timestamps[index]))
+
+    def coords(self, index: int) -> list:
+        """
+[latitude, longitude] of a position
+        """
+        return [float(self.latitudes[index]), float(self.longitudes[index])]
+
+    def phase(self, index: int):
+        """
+Flight phase name of a position, None if it has none
+        """
+        return phases[self.phases[index]]
+
+
+def cache_path(filepath: str, cache_directory: str = cache_dir) -> str:
+    """
+Returns the path of the cached columns of a track file, named after its
+absolute path
+
+    :param filepath: path to the track file
+    :param cache_directory: directory holding the cached tracks
+    :return: path to the .track file
+    """
+    name = hashlib.sha256(os.path.abspath(filepath).encode('utf8')).hexdigest()
+
+    return os.path.join(cache_directory, f'{name}.track')
+
+
+def column_offsets(header_end: int, length: int) -> dict:
+    """
+Offsets of the cached columns of a track, each aligned to 8 bytes
+
+    :param header_end: size of the magic and header, multiple of 8
+    :param length: number of positions
+    :return: dict of column name: offset
+    """
+    offsets = dict()
+    offset = header_end
+    for name, dtype in cached_columns.items():
+        offsets[name] = offset
+        offset += -(-length * np.dtype(dtype).itemsize // 8) * 8
+
+    return offsets
+
+
+def save_cached(path: str, track: Track, stat: os.stat_result) -> None:
+    """
+Saves the columns of a track to the cache, atomically
+
+    :param path: path to the .track file, as returned by cache_path
+    :param track: track read from the track file
+    :param stat: status of the track file it was read from
+    """
+    header = json.dumps({'callsign': track.callsign,
+                         'length': len(track),
+                         'mtime': stat.st_mtime_ns,
+                         'size': stat.st_size}).encode('utf8')
+    # Magic, header length and header, padded so the columns are aligned
+    header_end = -(-(len(cache_magic) + 4 + len(header)) // 8) * 8
+    header = header.ljust(header_end - len(cache_magic) - 4)
+
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'wb') as file_handle:
+        file_handle.write(cache_magic + struct.pack('<I', len(header))
+                          + header)
+        for name, offset in column_offsets(header_end, len(track)).items():
+            file_handle.seek(offset)
+            file_handle.write(getattr(track, name).tobytes())
+    os.replace(tmp_path, path)
+
+
+def load_cached(path: str, stat: os.stat_result):
+    """
+Maps the cached columns of a track into memory, read-only
+
+    :param path: path to the .track file, as returned by cache_path
+    :param stat: status of the track file, the cache is only used if it was
+           saved from a file with the same modification time and size
+    :return: Track, or None if not cached or outdated
+    """
+    if not os.path.isfile(path):
+        return None
+
+    with open(path, 'rb') as file_handle:
+        if file_handle.read(len(cache_magic)) != cache_magic:
+            return None
+
+        header_length, = struct.unpack('<I', file_handle.read(4))
+        header = json.loads(file_handle.read(header_length))
+
+    if header['mtime'] != stat.st_mtime_ns or header['size'] != stat.st_size:
+        return None
+
+    length = header['length']
+    header_end = len(cache_magic) + 4 + header_length
+    if not length:
+        return Track(*[np.empty(0, dtype) for dtype in cached_columns.values()],
+                     callsign=header['callsign'])
+
+    buffer = np.memmap(path, dtype=np.uint8, mode='r')
+
+    return Track(
+        *[np.frombuffer(buffer, dtype=cached_columns[name], count=length,
+                        offset=offset)
+          for name, offset in column_offsets(header_end, length).items()],
+        callsign=header['callsign']
+    )
+
+
+def load(filepath: str, cache_directory: str = cache_dir) -> Track:
+    """
+Loads a Flightradar24 track file, parsing it only if it isn't cached or
+changed since it was
+
+    :param filepath: path to the .csv file
+    :param cache_directory: directory holding the cached tracks
+    :return: Track
+    """
+    path = cache_path(filepath, cache_directory)
+    stat = os.stat(filepath)
+
+    track = load_cached(path, stat)
+    if track is None:
+        track = Track.from_csv(filepath)
+        save_cached(path, track, stat)
+
+    return track